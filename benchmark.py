@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+性能基准测试
+
+每个 bench_* 函数测量一个热点路径，可单独运行：
+    python benchmark.py                 # 运行全部
+    python benchmark.py serialization   # 只运行指定项
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# 基准测试使用临时数据库，避免污染 data/app.db
+_tmp_dir = tempfile.TemporaryDirectory(prefix="light-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp_dir.name}/bench.db")
+os.environ.setdefault("ARCHIVE_DATABASE_URL", f"sqlite+aiosqlite:///{_tmp_dir.name}/archive.db")
+
+
+def _timeit(func, repeat: int = 5, number: int = 20) -> float:
+    """返回多轮测量中单次调用的最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def _report(label: str, seconds: float, items: int):
+    print(f"  {label:<40}{seconds * 1000:>10.3f} ms / {items} 条  {items / seconds:>12,.0f} 条/秒")
+
+
+async def bench_serialization(items: int = 1000):
+    """回廊内容序列化：字典行+标准库json 对比 类型行+快速编码器"""
+    from the_light_on_the_way_back import responses
+    from the_light_on_the_way_back.schemas import GalleryItem
+    from the_light_on_the_way_back.timeutils import to_epoch
+
+    print(f"\n[serialization] 每 {items} 条回廊内容的构建+编码耗时")
+    now = datetime.utcnow()
+    rows = [
+        (i, f"心绪 #{i}：天一亮，我们又人模狗样", None, now - timedelta(minutes=i), i % 100,
+         "23小时59分钟", now + timedelta(hours=23))
+        for i in range(items)
+    ]
+
+    def dict_stdlib():
+        contents = [
+            {
+                "id": r[0], "content_text": r[1], "image_path": r[2], "created_at": r[3],
+                "applause_count": r[4], "time_remaining": r[5],
+            }
+            for r in rows
+        ]
+        # 原实现直接交给 JSONResponse 会因 datetime 报错，这里用 default=str 模拟
+        return json.dumps({"contents": contents}, ensure_ascii=False, default=str).encode()
+
+    def slots_encoder():
+        contents = [
+            GalleryItem(r[0], r[1], r[2], to_epoch(r[3]), r[4], r[5], to_epoch(r[6]))
+            for r in rows
+        ]
+        return responses.dumps({"contents": contents})
+
+    _report("dict rows + json(default=str)", _timeit(dict_stdlib), items)
+
+    orjson = responses.orjson
+    responses.orjson = None
+    try:
+        _report("slotted rows + json fallback", _timeit(slots_encoder), items)
+    finally:
+        responses.orjson = orjson
+    if orjson is not None:
+        _report("slotted rows + orjson", _timeit(slots_encoder), items)
+    else:
+        print("  (未安装 orjson，跳过 orjson 测量)")
+
+
+async def bench_gallery_query(items: int = 1000):
+    """回廊查询：ORM实体装配 对比 列元组直接构建类型行"""
+    from sqlalchemy import select, and_, desc
+    from the_light_on_the_way_back.database import AsyncSessionLocal, engine, init_db
+    from the_light_on_the_way_back.models import FacadeContent, FacadeIdentity
+    from the_light_on_the_way_back.services import facade_service
+
+    engine.echo = False
+    await init_db()
+    print(f"\n[gallery_query] 读取 {items} 条回廊内容")
+
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "10.0.0.1")
+        for i in range(items):
+            db.add(FacadeContent(facade_identity_id=identity.id, content_text=f"心绪 #{i}"))
+        await db.commit()
+
+        async def orm_entities():
+            result = await db.execute(
+                select(FacadeContent, FacadeIdentity).join(
+                    FacadeIdentity,
+                    and_(
+                        FacadeContent.facade_identity_id == FacadeIdentity.id,
+                        FacadeIdentity.is_expired == False,
+                        FacadeIdentity.expires_at > datetime.utcnow()
+                    )
+                ).where(FacadeContent.is_deleted == False)
+                .order_by(desc(FacadeContent.created_at)).limit(items)
+            )
+            return [
+                {
+                    "id": c.id, "content_text": c.content_text, "image_path": c.image_path,
+                    "created_at": c.created_at, "applause_count": c.applause_count,
+                    "time_remaining": facade_service._calculate_time_remaining(i.expires_at),
+                }
+                for c, i in result
+            ]
+
+        async def tuple_rows():
+            return await facade_service.get_gallery_contents(db, limit=items)
+
+        for label, func in (("ORM entities + dict rows", orm_entities), ("column tuples + slotted rows", tuple_rows)):
+            best = float("inf")
+            for _ in range(5):
+                db.expunge_all()
+                started = time.perf_counter()
+                await func()
+                best = min(best, time.perf_counter() - started)
+            _report(label, best, items)
+
+
+async def bench_timestamp_index(rows: int = 200_000):
+    """时间列：ISO文本 对比 整数纪元秒 的索引大小和范围扫描速度"""
+    import random
+    import sqlite3
+
+    print(f"\n[timestamp_index] {rows} 行，expires_at 索引")
+    now = int(time.time())
+    values = [now + random.randint(-86400, 86400) for _ in range(rows)]
+    lower, upper = now, now + 86400
+
+    for label, convert in (
+        ("ISO text (DateTime)", lambda v: datetime.utcfromtimestamp(v).strftime("%Y-%m-%d %H:%M:%S.%f")),
+        ("integer epoch", lambda v: v),
+    ):
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, expires_at)")
+        db.executemany("INSERT INTO t (expires_at) VALUES (?)", ((convert(v),) for v in values))
+        db.execute("CREATE INDEX ix_t_expires_at ON t (expires_at)")
+        index_bytes = db.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'ix_t_expires_at'"
+        ).fetchone()[0]
+        bounds = (convert(lower), convert(upper))
+
+        def scan():
+            return db.execute(
+                "SELECT COUNT(*) FROM t WHERE expires_at > ? AND expires_at <= ?", bounds
+            ).fetchone()
+
+        seconds = _timeit(scan, number=50)
+        print(f"  {label:<24} 索引 {index_bytes / 1024:>9,.0f} KiB   范围扫描(未来24小时) {seconds * 1000:>8.3f} ms")
+        db.close()
+
+
+async def bench_search(posts: int = 1_000_000):
+    """全文搜索：建立索引的吞吐量和典型查询的延迟"""
+    import random
+    from sqlalchemy import create_engine
+    from the_light_on_the_way_back.database import Base
+    from the_light_on_the_way_back import models  # noqa: F401  注册模型
+    from the_light_on_the_way_back.search import (
+        SEARCH_SCHEMA, SEARCH_SQL, FTS_TABLE, tokenize, build_match_query,
+    )
+
+    print(f"\n[search] {posts} 条回廊内容")
+    sync_engine = create_engine(f"sqlite:///{_tmp_dir.name}/search.db")
+    Base.metadata.create_all(sync_engine)
+    db = sync_engine.raw_connection()
+    for statement in SEARCH_SCHEMA:
+        db.execute(statement)
+
+    random.seed(0)
+    phrases = [
+        "天一亮", "我们又人模狗样", "归途的光", "许一个便宜糕点的愿望", "风吹过旧站台",
+        "今天也很努力", "城市的夜晚", "没有人知道", "假装很快乐", "hello world", "coffee",
+    ]
+    now = int(time.time())
+    db.execute(
+        "INSERT INTO facade_identities (id, identity_token, created_at, expires_at, is_expired) "
+        "VALUES (1, 'bench', ?, ?, 0)", (now, now + 86400)
+    )
+
+    batch = 10_000
+    started = time.perf_counter()
+    for first in range(1, posts + 1, batch):
+        rows = [
+            (i, "，".join(random.sample(phrases, 3)) + f" #{i}")
+            for i in range(first, min(first + batch, posts + 1))
+        ]
+        db.executemany(
+            "INSERT INTO facade_contents (id, facade_identity_id, content_text, created_at, "
+            "applause_count, is_deleted) VALUES (?, 1, ?, ?, 0, 0)",
+            [(i, text, now) for i, text in rows]
+        )
+        db.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, tokens) VALUES (?, ?)",
+            [(i, tokenize(text)) for i, text in rows]
+        )
+        db.commit()
+    seconds = time.perf_counter() - started
+    print(f"  {'分词+写入内容表和索引':<36}{seconds:>10.2f} s      {posts / seconds:>12,.0f} 条/秒")
+
+    for query in ("归途的光", "糕点", "光", "coffee", "旧站台 努力", "不存在的词"):
+        params = {
+            "query": build_match_query(query), "candidates": 1000, "now": now,
+            "after_rank": float("-inf"), "after_id": 0, "limit": 21,
+        }
+        matches = db.execute(
+            f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?", (params["query"],)
+        ).fetchone()[0]
+        seconds = _timeit(lambda: db.execute(SEARCH_SQL, params).fetchall(), repeat=3, number=5)
+        print(f"  查询 {query!r:<16} 命中 {matches:>9,} 条   首页(20条) {seconds * 1000:>9.2f} ms")
+    db.close()
+    sync_engine.dispose()
+
+
+async def bench_letter_open(opens: int = 20):
+    """重复开启同一封信笺：每次派生密钥解密 对比 已开启信笺缓存"""
+    from the_light_on_the_way_back.database import AsyncSessionLocal, engine, init_db
+    from the_light_on_the_way_back.services import time_capsule_service
+    from the_light_on_the_way_back.services.letter_cache import opened_letter_cache
+
+    engine.echo = False
+    await init_db()
+    print(f"\n[letter_open] 重复开启同一封信笺 {opens} 次")
+
+    async with AsyncSessionLocal() as db:
+        letter = await time_capsule_service.create_letter(
+            db, "写给一秒后的自己：" * 50, "基准", datetime.utcnow() + timedelta(seconds=1)
+        )
+    await asyncio.sleep(1.1)
+
+    enabled = opened_letter_cache.enabled
+    try:
+        for label, cache_enabled in (("PBKDF2 + decrypt every time", False), ("opened letter cache", True)):
+            opened_letter_cache.enabled = cache_enabled
+            opened_letter_cache.clear()
+            async with AsyncSessionLocal() as db:
+                await time_capsule_service.open_letter(db, letter.id)
+                started = time.perf_counter()
+                for _ in range(opens):
+                    await time_capsule_service.open_letter(db, letter.id)
+                _report(label, (time.perf_counter() - started) / opens, 1)
+    finally:
+        opened_letter_cache.enabled = enabled
+        opened_letter_cache.clear()
+
+
+async def bench_rate_limit(clients: int = 100_000, requests: int = 2000):
+    """限流：令牌桶检查本身的开销，以及作为路由依赖时每个请求增加的耗时"""
+    import httpx
+    from fastapi import Depends, FastAPI
+    from the_light_on_the_way_back import ratelimit
+    from the_light_on_the_way_back.ratelimit import TokenBucketPolicy, rate_limit, rate_limiter
+
+    print(f"\n[rate_limit] 令牌桶检查（{clients:,} 个不同客户端）与路由依赖开销")
+    keys = [ratelimit.hash_ip(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}") for i in range(clients)]
+
+    policy = TokenBucketPolicy(burst=10, per_minute=60)
+    _report("acquire, same client", _timeit(lambda: policy.acquire(keys[0]), number=1000), 1)
+    policy = TokenBucketPolicy(burst=10, per_minute=60)
+    _report("acquire, distinct clients", _timeit(lambda: [policy.acquire(k) for k in keys], repeat=3, number=1), clients)
+    _report("hash_ip + acquire", _timeit(lambda: rate_limiter.check("content_create", "10.0.0.1"), number=1000), 1)
+    print(f"  跟踪的客户端数: {len(policy):,}，策略上限 {policy.max_keys:,}")
+
+    # 限额足够大，只测量放行路径
+    rate_limiter.policies["bench"] = TokenBucketPolicy(burst=10 ** 9, per_minute=10 ** 9)
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return {}
+
+    @app.get("/limited", dependencies=[Depends(rate_limit("bench"))])
+    async def limited():
+        return {}
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for label, url in (("ASGI request, no limit", "/plain"), ("ASGI request, rate_limit dependency", "/limited")):
+                for _ in range(100):
+                    await client.get(url)
+                best = float("inf")
+                for _ in range(3):
+                    started = time.perf_counter()
+                    for _ in range(requests):
+                        await client.get(url)
+                    best = min(best, (time.perf_counter() - started) / requests)
+                _report(label, best, 1)
+    finally:
+        del rate_limiter.policies["bench"]
+
+
+async def bench_dedup(entries: int = 20_000, probes: int = 500):
+    """近似重复检测：索引中已有大量近期内容时，每次发布的检查开销（对比逐条比较签名）"""
+    import random
+    from the_light_on_the_way_back.dedup import NearDuplicateIndex, minhash, normalize, similarity
+
+    print(f"\n[dedup] 近似重复检测（索引 {entries:,} 条近期内容）")
+    rng = random.Random(42)
+    alphabet = [chr(code) for code in range(0x4E00, 0x4E00 + 2000)]
+
+    def post(length: int) -> str:
+        return "".join(rng.choice(alphabet) for _ in range(length))
+
+    index = NearDuplicateIndex(enabled=True, window_minutes=60, threshold=0.6, min_length=20, max_entries=entries)
+    expires_at = time.time() + 3600
+    for _ in range(entries):
+        index.check(post(80), expires_at)
+
+    for length in (40, 200, 1000):
+        texts = [post(length) for _ in range(probes)]
+        keys = []
+        started = time.perf_counter()
+        for text in texts:
+            keys.append(index.check(text, expires_at))
+        elapsed = (time.perf_counter() - started) / probes
+        for key in keys:
+            index.discard(key)
+        _report(f"check, {length} chars", elapsed, 1)
+
+    signatures = [entry.signature for entry in index._entries.values()]
+    probe = minhash(normalize(post(200)))
+    _report("linear scan (for comparison)", _timeit(lambda: [similarity(s, probe) for s in signatures], repeat=3, number=1), 1)
+    print(f"  条目数: {len(index):,}，拒绝 {index.rejected} 次")
+
+
+async def bench_card_cache(items: int = 20):
+    """回廊页面渲染CPU：卡片片段缓存为空（每张卡片都渲染）对比 缓存已命中"""
+    from types import SimpleNamespace
+    from the_light_on_the_way_back.schemas import GalleryItem
+    from the_light_on_the_way_back.services.card_cache import gallery_card_cache
+    from the_light_on_the_way_back.templating import get_templates, gallery_card
+
+    print(f"\n[card_cache] 回廊页面渲染（{items} 条内容）")
+    now = int(time.time())
+    contents = [
+        GalleryItem(i, f"片段缓存测试心绪 #{i} " * 20, f"uploads/{i:04x}.jpg" if i % 3 == 0 else None,
+                    now - i * 60, i % 7, "23小时59分钟", now + 86400)
+        for i in range(items)
+    ]
+    template = get_templates().env.get_template("facade_gallery.html")
+    context = {
+        "request": SimpleNamespace(url=SimpleNamespace(path="/facade-gallery/")),
+        "identity_token": "bench", "time_remaining": "23小时59分钟", "contents": contents,
+    }
+
+    def cold_page():
+        gallery_card_cache.clear()
+        template.render(context)
+
+    def cold_cards():
+        gallery_card_cache.clear()
+        for content in contents:
+            gallery_card(content)
+
+    def warm_cards():
+        for content in contents:
+            gallery_card(content)
+
+    enabled = gallery_card_cache.enabled
+    gallery_card_cache.enabled = True
+    try:
+        _report("page, cold cache", _timeit(cold_page), items)
+        template.render(context)
+        _report("page, warm cache", _timeit(lambda: template.render(context)), items)
+        _report("cards only, cold cache", _timeit(cold_cards), items)
+        warm_cards()
+        _report("cards only, warm cache", _timeit(warm_cards), items)
+        print(f"  缓存 {len(gallery_card_cache)} 张卡片，{gallery_card_cache.bytes:,} 字节")
+    finally:
+        gallery_card_cache.enabled = enabled
+        gallery_card_cache.clear()
+
+
+async def bench_tracing(calls: int = 10_000):
+    """请求追踪的开销：未被追踪的请求中每个追踪点的开销 对比 被追踪时记录一个跨度"""
+    from the_light_on_the_way_back.tracing import Tracer, Trace, Span, _current_span
+
+    print(f"\n[tracing] 追踪点开销（{calls:,} 次）")
+    tracer = Tracer(enabled=True, sample_rate=0)
+
+    def bare():
+        for _ in range(calls):
+            pass
+
+    def untraced():
+        for _ in range(calls):
+            with tracer.span("bench"):
+                pass
+
+    def traced():
+        trace = Trace()
+        token = _current_span.set(Span(trace, "GET /bench"))
+        try:
+            for _ in range(calls):
+                with tracer.span("bench", key="value"):
+                    pass
+        finally:
+            _current_span.reset(token)
+
+    baseline = _timeit(bare, repeat=3, number=1)
+    _report("span, request not traced", _timeit(untraced, repeat=3, number=1) - baseline, calls)
+    _report("span, request traced", _timeit(traced, repeat=3, number=1) - baseline, calls)
+
+
+async def bench_applause_filter(applause: int = 1_000_000, clicks: int = 200_000):
+    """鼓掌过滤器：每100万次鼓掌占用的内存、误判率，以及重复点击为主的负载下跳过的数据库查询比例"""
+    import hashlib
+    import random
+    import tracemalloc
+    from the_light_on_the_way_back.config import MAX_APPLAUSE_PER_CONTENT
+    from the_light_on_the_way_back.services.applause_filter import ApplauseFilters
+
+    def ip_hash(i: int) -> str:
+        return hashlib.sha256(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}".encode()).hexdigest()
+
+    contents = applause // MAX_APPLAUSE_PER_CONTENT
+    print(f"\n[applause_filter] {applause:,} 次鼓掌，{contents:,} 条内容各 {MAX_APPLAUSE_PER_CONTENT} 次")
+    hashes = [ip_hash(i) for i in range(MAX_APPLAUSE_PER_CONTENT)]
+    expires_at = int(time.time()) + 86400
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    filters = ApplauseFilters(enabled=True, max_bytes=1 << 40)
+    for content_id in range(contents):
+        filters.load(content_id, hashes, expires_at)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"  位数组 {filters.bytes / 2 ** 20:.2f} MiB，含字典和条目对象共 {used / 2 ** 20:.2f} MiB"
+          f"（每条内容 {used / contents:.0f} 字节）")
+
+    absent = [ip_hash(i) for i in range(1 << 20, (1 << 20) + 100_000)]
+    false_positives = sum(filters.check(i % contents, value) for i, value in enumerate(absent))
+    print(f"  误判率 {false_positives / len(absent):.2%}（目标 {filters.false_positive_rate:.0%}）")
+    _report("check", _timeit(lambda: filters.check(0, absent[0]), number=10_000), 1)
+
+    # 点击流：每位访客点击次数服从几何分布（平均3次），第一次是新鼓掌，之后都是重复点击
+    rng = random.Random(42)
+    filters = ApplauseFilters(enabled=True)
+    applauded = {}
+    live = 2000
+    queries = accepted = total = 0
+    while total < clicks:
+        content_id = rng.randrange(live)
+        visitor = ip_hash(rng.randrange(1 << 22))
+        seen = applauded.setdefault(content_id, set())
+        repeats = 1
+        while rng.random() < 2 / 3:
+            repeats += 1
+        for _ in range(repeats):
+            total += 1
+            if len(seen) >= MAX_APPLAUSE_PER_CONTENT:
+                break  # 已达上限，检查之前就被拒绝
+            answer = filters.check(content_id, visitor)
+            if answer is None:
+                filters.load(content_id, seen, expires_at)
+                queries += 1
+            elif answer:
+                queries += 1
+            if visitor not in seen:
+                seen.add(visitor)
+                filters.add(content_id, visitor)
+                accepted += 1
+    checked = filters.checks + filters.loads
+    print(f"  {total:,} 次点击，{accepted:,} 次新鼓掌（{accepted / total:.0%}），{live} 条内容")
+    print(f"  数据库查询 {queries:,} 次（无过滤器时 {checked:,} 次），跳过 {1 - queries / checked:.1%}")
+
+
+async def bench_ttfb(requests: int = 50, posts: int = 200):
+    """页面首字节时间：整页渲染 对比 流式渲染（直接驱动ASGI应用，记录第一块和最后一块响应体到达的时间）"""
+    from the_light_on_the_way_back import templating
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.database import AsyncSessionLocal, engine
+    from the_light_on_the_way_back.models import FacadeContent
+    from the_light_on_the_way_back.services import facade_service
+
+    engine.echo = False
+    print(f"\n[ttfb] 页面首字节时间与完整响应时间（{requests} 次取中位数）")
+
+    async def get(path: str):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        marks = []
+        finished = asyncio.Event()
+        requested = False
+
+        async def receive():
+            # 流式响应期间 Starlette 会持续等待断开消息，响应结束后才返回
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                if message.get("body"):
+                    marks.append(time.perf_counter())
+                if not message.get("more_body"):
+                    finished.set()
+
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        return marks[0] - started, marks[-1] - started, len(marks)
+
+    async with app.router.lifespan_context(app):
+        async with AsyncSessionLocal() as db:
+            identity = await facade_service.create_identity(db, "10.0.0.2")
+            for i in range(posts):
+                db.add(FacadeContent(facade_identity_id=identity.id, content_text=f"首字节测试心绪 #{i}" * 5))
+            await db.commit()
+
+        streaming = templating.TEMPLATE_STREAMING_ENABLED
+        try:
+            for path in ("/facade-gallery/", "/time-capsule/"):
+                for label, enabled in (("TemplateResponse", False), ("stream_template", True)):
+                    templating.TEMPLATE_STREAMING_ENABLED = enabled
+                    await get(path)
+                    samples = sorted([await get(path) for _ in range(requests)])
+                    first = sorted(sample[0] for sample in samples)[requests // 2]
+                    last = sorted(sample[1] for sample in samples)[requests // 2]
+                    print(
+                        f"  {path:<18}{label:<18} TTFB {first * 1000:>7.2f} ms   "
+                        f"完整响应 {last * 1000:>7.2f} ms   响应体分 {samples[0][2]} 块发送"
+                    )
+        finally:
+            templating.TEMPLATE_STREAMING_ENABLED = streaming
+
+
+BENCHMARKS = {
+    "serialization": bench_serialization,
+    "gallery_query": bench_gallery_query,
+    "timestamp_index": bench_timestamp_index,
+    "search": bench_search,
+    "letter_open": bench_letter_open,
+    "rate_limit": bench_rate_limit,
+    "dedup": bench_dedup,
+    "ttfb": bench_ttfb,
+    "card_cache": bench_card_cache,
+    "tracing": bench_tracing,
+    "applause_filter": bench_applause_filter,
+}
+
+
+async def main(names):
+    """运行选定的基准测试"""
+    for name in names:
+        await BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        print(f"未知的基准测试: {', '.join(unknown)}，可选: {', '.join(BENCHMARKS)}")
+        sys.exit(2)
+    try:
+        asyncio.run(main(selected))
+    finally:
+        _tmp_dir.cleanup()
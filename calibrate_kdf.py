@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+密钥派生成本校准
+
+在当前机器上测量 PBKDF2（以及可选的 scrypt）派生一次密钥的耗时，
+推荐接近目标耗时的参数，输出可直接使用的环境变量：
+    python calibrate_kdf.py                   # 目标 100 毫秒
+    python calibrate_kdf.py --target-ms 250 --scrypt
+    python calibrate_kdf.py --json
+
+修改参数后只影响新封存的信笺；已有信笺的参数记录在各自的密文头中，
+由定时任务 rewrap_letters 分批迁移。
+"""
+import argparse
+import json
+import secrets
+import time
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+# OWASP 建议的 PBKDF2-SHA256 最低迭代次数
+MIN_PBKDF2_ITERATIONS = 100000
+PROBE_ITERATIONS = 200000
+
+
+def _measure(derive, repeat: int = 3) -> float:
+    """返回多次派生中最短的一次耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        derive()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def calibrate_pbkdf2(target_seconds: float) -> dict:
+    """PBKDF2 的耗时与迭代次数成正比，测量一次后按比例推算"""
+    salt, material = secrets.token_bytes(32), secrets.token_bytes(64)
+
+    def derive(iterations):
+        return lambda: PBKDF2HMAC(
+            algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations
+        ).derive(material)
+
+    per_iteration = _measure(derive(PROBE_ITERATIONS)) / PROBE_ITERATIONS
+    # 取整到一万次，便于阅读和配置
+    iterations = max(MIN_PBKDF2_ITERATIONS, round(target_seconds / per_iteration, -4))
+    return {
+        "algorithm": "pbkdf2",
+        "iterations": int(iterations),
+        "measured_ms": round(_measure(derive(int(iterations))) * 1000, 1),
+        "env": {"KDF_ALGORITHM": "pbkdf2", "KDF_PBKDF2_ITERATIONS": str(int(iterations))},
+    }
+
+
+def calibrate_scrypt(target_seconds: float, r: int = 8, p: int = 1) -> dict:
+    """scrypt 的内存和耗时都随 N 翻倍，从小到大尝试，取不超过目标的最大 N"""
+    salt, material = secrets.token_bytes(32), secrets.token_bytes(64)
+    best = None
+    for log2_n in range(14, 21):
+        seconds = _measure(
+            lambda: Scrypt(salt=salt, length=32, n=2 ** log2_n, r=r, p=p).derive(material),
+            repeat=2
+        )
+        if best is not None and seconds > target_seconds:
+            break
+        best = (log2_n, seconds)
+    log2_n, seconds = best
+    return {
+        "algorithm": "scrypt",
+        "log2_n": log2_n,
+        "r": r,
+        "p": p,
+        "memory_mb": 128 * r * 2 ** log2_n // (1024 * 1024),
+        "measured_ms": round(seconds * 1000, 1),
+        "env": {
+            "KDF_ALGORITHM": "scrypt",
+            "KDF_SCRYPT_LOG2_N": str(log2_n),
+            "KDF_SCRYPT_R": str(r),
+            "KDF_SCRYPT_P": str(p),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校准密钥派生成本")
+    parser.add_argument("--target-ms", type=float, default=100.0, help="单次派生的目标耗时（毫秒）")
+    parser.add_argument("--scrypt", action="store_true", help="同时校准 scrypt")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    results = [calibrate_pbkdf2(target)]
+    if args.scrypt:
+        results.append(calibrate_scrypt(target))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"目标耗时 {args.target_ms:.0f} ms（开启一封信笺需派生一次，重新封装需两次）\n")
+    for result in results:
+        if result["algorithm"] == "pbkdf2":
+            print(f"PBKDF2-SHA256  {result['iterations']:,} 次迭代  实测 {result['measured_ms']} ms")
+        else:
+            print(
+                f"scrypt  N=2^{result['log2_n']} r={result['r']} p={result['p']}  "
+                f"内存 {result['memory_mb']} MB  实测 {result['measured_ms']} ms"
+            )
+        for key, value in result["env"].items():
+            print(f"  {key}={value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+进程内压测工具
+
+通过 ASGI transport 直接驱动 the_light_on_the_way_back.app:app，无需绑定端口，
+按脚本化场景施加并发负载，并按路由输出吞吐量与 p50/p95/p99 延迟。
+指定 --base-url 时改为通过 HTTP 压测已启动的服务器（例如比较 start_server.py 不同 worker 数的吞吐量），
+此时 --database-url 需与服务器使用同一个数据库，以便预置数据；所有请求来自同一个IP，服务器应关闭限流。
+
+场景：
+    browse   回廊浏览：打开回廊页面后按无限滚动方式翻页
+    applause 鼓掌风暴：大量不同IP同时为同一条热门内容鼓掌
+    letters  信笺创建潮：集中提交时光信笺
+    deadline 到期开启：一批信笺在同一时刻到期，多个标签页同时开启
+
+多进程场景（不包含在 all 中）：
+    coherence 跨进程一致性：本进程作为写入worker发布并鼓掌，--processes 个读取worker
+              （各自运行完整的应用生命周期）轮询热度排行，测量新内容出现在每个worker中的延迟
+
+用法：
+    python load_test.py --scenario all --concurrency 32 --requests 500
+    python load_test.py --scenario coherence --processes 4 --rounds 30
+    python load_test.py --scenario browse --base-url http://127.0.0.1:8000 --database-url sqlite+aiosqlite:///data/app.db
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+SCENARIOS = ["browse", "applause", "letters", "deadline"]
+MULTIPROCESS_SCENARIOS = ["coherence"]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="归途的光进程内压测工具")
+    parser.add_argument(
+        "--scenario", choices=SCENARIOS + MULTIPROCESS_SCENARIOS + ["all"], default="all",
+        help="要运行的场景（默认全部）"
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="并发虚拟用户数")
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--seed-posts", type=int, default=200, help="预置的回廊内容数")
+    parser.add_argument("--page-size", type=int, default=10, help="无限滚动每页条数")
+    parser.add_argument("--letters", type=int, default=20, help="到期开启场景的信笺数")
+    parser.add_argument(
+        "--deadline-seconds", type=float, default=5.0,
+        help="到期开启场景中信笺距离到期的秒数"
+    )
+    parser.add_argument("--processes", type=int, default=3, help="一致性场景中的读取worker进程数")
+    parser.add_argument("--rounds", type=int, default=20, help="一致性场景中的写入轮数")
+    parser.add_argument(
+        "--poll-ms", type=float, default=20.0,
+        help="一致性场景中读取worker轮询热度排行的间隔（毫秒）"
+    )
+    parser.add_argument(
+        "--no-invalidation", action="store_true",
+        help="一致性场景中不启用跨进程缓存失效（用于对比）"
+    )
+    parser.add_argument(
+        "--database-url", default=None,
+        help="数据库URL（默认使用临时SQLite文件，避免污染 data/app.db）"
+    )
+    parser.add_argument(
+        "--base-url", default=None,
+        help="压测已启动的服务器（例如 http://127.0.0.1:8000），而不是进程内的应用"
+    )
+    parser.add_argument("--json", dest="json_path", default=None, help="将结果写入JSON文件")
+    return parser.parse_args()
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class RouteStats:
+    """单个路由的统计数据"""
+
+    def __init__(self):
+        self.latencies = []
+        self.status_counts = defaultdict(int)
+        self.errors = 0
+
+    def record(self, latency: float, status: int):
+        self.latencies.append(latency)
+        self.status_counts[status] += 1
+        if status >= 500:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        values = sorted(self.latencies)
+        return {
+            "count": len(values),
+            "throughput": len(values) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "errors": self.errors,
+            "status": dict(sorted(self.status_counts.items())),
+        }
+
+
+class LoadRunner:
+    """负载执行器：按并发度消费请求队列，并记录每个路由的延迟"""
+
+    def __init__(self, app, concurrency: int, base_url: str = None):
+        self.app = app
+        self.concurrency = concurrency
+        self.base_url = base_url
+        self._clients = {}
+
+    def _client(self, client_ip: str):
+        """每个客户端IP对应一个 AsyncClient，使 request.client.host 可区分"""
+        import httpx
+
+        if self.base_url:
+            # 真实连接无法伪造来源IP，所有虚拟用户共用一个连接池
+            client = self._clients.get(None)
+            if client is None:
+                limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+                client = httpx.AsyncClient(base_url=self.base_url, limits=limits, follow_redirects=False)
+                self._clients[None] = client
+            return client
+
+        client = self._clients.get(client_ip)
+        if client is None:
+            transport = httpx.ASGITransport(
+                app=self.app, client=(client_ip, 50000), raise_app_exceptions=False
+            )
+            client = httpx.AsyncClient(
+                transport=transport, base_url="http://loadtest", follow_redirects=False
+            )
+            self._clients[client_ip] = client
+        return client
+
+    async def run(self, requests) -> dict:
+        """
+        执行一批请求
+
+        Args:
+            requests: (路由标签, 方法, URL, 请求参数, 客户端IP) 组成的列表
+
+        Returns:
+            按路由汇总的统计结果
+        """
+        queue = asyncio.Queue()
+        for item in requests:
+            queue.put_nowait(item)
+
+        stats = defaultdict(RouteStats)
+
+        async def worker():
+            while True:
+                try:
+                    label, method, url, kwargs, client_ip = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                client = self._client(client_ip)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    status = response.status_code
+                except Exception:
+                    status = 599
+                stats[label].record(time.perf_counter() - started, status)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        total = sum(len(s.latencies) for s in stats.values())
+        return {
+            "elapsed_s": elapsed,
+            "throughput": total / elapsed if elapsed > 0 else 0.0,
+            "routes": {label: s.summary(elapsed) for label, s in sorted(stats.items())},
+        }
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+def _ip(n: int) -> str:
+    """由序号生成一个唯一的IPv4地址"""
+    return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+
+async def seed_gallery(count: int) -> int:
+    """预置回廊内容，返回最后一条内容的ID"""
+    from the_light_on_the_way_back.database import AsyncSessionLocal
+    from the_light_on_the_way_back.services import facade_service
+
+    content_id = 0
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "10.255.0.1")
+        for i in range(count):
+            content = await facade_service.create_content(
+                db=db,
+                identity_token=identity.identity_token,
+                content_text=f"压测心绪 #{i}：天一亮，我们又人模狗样",
+            )
+            content_id = content.id
+    return content_id
+
+
+def build_browse(args):
+    """回廊浏览：首屏页面 + 无限滚动翻页"""
+    requests = []
+    pages = max(1, args.seed_posts // args.page_size)
+    n = 0
+    while len(requests) < args.requests:
+        ip = _ip(n)
+        requests.append(("GET /facade-gallery/", "GET", "/facade-gallery/", {}, ip))
+        for page in range(pages):
+            if len(requests) >= args.requests:
+                break
+            offset = 20 + page * args.page_size
+            requests.append((
+                "GET /facade-gallery/contents", "GET",
+                f"/facade-gallery/contents?offset={offset}&limit={args.page_size}", {}, ip
+            ))
+        n += 1
+    return requests
+
+
+def build_applause(args, hot_content_id: int):
+    """鼓掌风暴：每个请求来自不同IP，集中于同一条内容"""
+    url = f"/facade-gallery/applaud/{hot_content_id}"
+    return [
+        ("POST /facade-gallery/applaud/{content_id}", "POST", url, {}, _ip(100000 + i))
+        for i in range(args.requests)
+    ]
+
+
+def build_letters(args):
+    """信笺创建潮"""
+    open_date = (datetime.utcnow() + timedelta(days=30)).isoformat(timespec="minutes")
+    return [
+        (
+            "POST /time-capsule/create", "POST", "/time-capsule/create",
+            {"data": {
+                "title": f"压测信笺 {i}",
+                "content": "写给一个月后的自己：" + "许便宜糕点的愿望。" * 20,
+                "open_date": open_date,
+            }},
+            _ip(200000 + i),
+        )
+        for i in range(args.requests)
+    ]
+
+
+async def build_deadline(args):
+    """到期开启：预置一批同一时刻到期的信笺，到期后集中开启"""
+    from the_light_on_the_way_back.database import AsyncSessionLocal
+    from the_light_on_the_way_back.services import time_capsule_service
+
+    open_date = datetime.utcnow() + timedelta(seconds=args.deadline_seconds)
+    letter_ids = []
+    async with AsyncSessionLocal() as db:
+        for i in range(args.letters):
+            letter = await time_capsule_service.create_letter(
+                db=db,
+                content=f"到期开启的信笺 #{i}",
+                title="到期",
+                open_date=open_date,
+                creator_ip="10.255.0.2",
+            )
+            letter_ids.append(letter.id)
+
+    delay = (open_date - datetime.utcnow()).total_seconds()
+    if delay > 0:
+        await asyncio.sleep(delay + 0.05)
+
+    return [
+        (
+            "POST /time-capsule/open/{letter_id}", "POST",
+            f"/time-capsule/open/{letter_ids[i % len(letter_ids)]}", {}, _ip(300000 + i)
+        )
+        for i in range(args.requests)
+    ]
+
+
+def _coherence_reader(target, written_at, stop, results, poll_seconds: float):
+    """读取worker进程入口"""
+    asyncio.run(_coherence_read(target, written_at, stop, results, poll_seconds))
+
+
+async def _coherence_read(target, written_at, stop, results, poll_seconds: float):
+    """有待确认的新内容时轮询热度排行，首次看到时上报距写入完成的延迟"""
+    import logging
+    import httpx
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.database import engine
+
+    engine.echo = False
+    logging.disable(logging.INFO)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, client=("10.254.0.1", 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            results.put(("ready", 0.0))
+            reported = 0
+            while not stop.is_set():
+                current = target.value
+                if current > reported:
+                    response = await client.get("/facade-gallery/trending", params={"limit": 5})
+                    if any(item["id"] == current for item in response.json()["contents"]):
+                        results.put((current, time.time() - written_at.value))
+                        reported = current
+                await asyncio.sleep(poll_seconds)
+
+
+async def run_coherence(args) -> dict:
+    """
+    跨进程一致性：测量本进程的写入在其他worker进程的热度排行中可见的延迟
+
+    Returns:
+        延迟分布（毫秒）和超时未见的次数
+    """
+    from the_light_on_the_way_back.database import AsyncSessionLocal
+    from the_light_on_the_way_back.services import facade_service
+
+    # spawn：子进程重新导入应用，与独立的 uvicorn worker 一致
+    ctx = multiprocessing.get_context("spawn")
+    target = ctx.Value("q", 0)
+    written_at = ctx.Value("d", 0.0)
+    stop = ctx.Event()
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_coherence_reader, args=(target, written_at, stop, results, args.poll_ms / 1000))
+        for _ in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        await asyncio.to_thread(results.get, True, 120)
+    print(f"{args.processes} 个读取worker已就绪")
+
+    timeout = 5.0
+    latencies = []
+    missed = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            identity = await facade_service.create_identity(db, "10.255.0.3")
+            for n in range(args.rounds):
+                content = await facade_service.create_content(
+                    db=db,
+                    identity_token=identity.identity_token,
+                    content_text=f"一致性测试 #{n}",
+                )
+                await facade_service.applaud_content(db, content.id, _ip(400000 + n))
+                written_at.value = time.time()
+                target.value = content.id
+
+                seen = 0
+                deadline = time.monotonic() + timeout
+                while seen < len(workers):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        missed += len(workers) - seen
+                        break
+                    try:
+                        content_id, latency = await asyncio.to_thread(results.get, True, remaining)
+                    except queue.Empty:
+                        continue
+                    if content_id == content.id:
+                        latencies.append(latency)
+                        seen += 1
+                # 随机间隔，使部分写入落在重建热度索引的节流窗口内
+                await asyncio.sleep(random.uniform(0, 0.5))
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=30)
+
+    values = sorted(latencies)
+    return {
+        "processes": args.processes,
+        "rounds": args.rounds,
+        "observations": len(values),
+        "missed": missed,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def print_coherence_report(result: dict):
+    """打印一致性场景的报告"""
+    print(
+        f"\n== coherence: {result['processes']} 个读取worker × {result['rounds']} 轮写入，"
+        f"{result['observations']} 次可见，{result['missed']} 次超时未见"
+    )
+    print(
+        f"可见延迟 p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  "
+        f"p99 {result['p99_ms']:.1f} ms  max {result['max_ms']:.1f} ms"
+    )
+
+
+def print_report(name: str, result: dict):
+    """打印单个场景的报告"""
+    print(f"\n== {name}: {result['throughput']:.1f} req/s, 用时 {result['elapsed_s']:.2f}s")
+    header = f"{'route':<42}{'count':>7}{'req/s':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'5xx':>6}  status"
+    print(header)
+    print("-" * len(header))
+    for label, s in result["routes"].items():
+        print(
+            f"{label:<42}{s['count']:>7}{s['throughput']:>9.1f}{s['p50_ms']:>9.2f}"
+            f"{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['errors']:>6}  {s['status']}"
+        )
+
+
+async def main(args):
+    """执行选定的压测场景"""
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.database import engine
+
+    # SQL回显会主导测量结果，压测时关闭
+    engine.echo = False
+
+    # 运行应用的生命周期（建表、重建索引、启动封存队列等），与真实部署一致
+    async with app.router.lifespan_context(app):
+        if args.scenario in MULTIPROCESS_SCENARIOS:
+            result = await run_coherence(args)
+            print_coherence_report(result)
+            if args.json_path:
+                with open(args.json_path, "w", encoding="utf-8") as f:
+                    json.dump({args.scenario: result}, f, ensure_ascii=False, indent=2)
+        else:
+            await run_scenarios(app, args)
+
+
+async def run_scenarios(app, args):
+    """预置数据并依次执行场景"""
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    runner = LoadRunner(app, args.concurrency, args.base_url)
+    results = {}
+
+    hot_content_id = await seed_gallery(args.seed_posts)
+    print(f"已预置 {args.seed_posts} 条回廊内容，并发度 {args.concurrency}，目标 {args.base_url or '进程内应用'}")
+
+    try:
+        for name in scenarios:
+            if name == "browse":
+                requests = build_browse(args)
+            elif name == "applause":
+                requests = build_applause(args, hot_content_id)
+            elif name == "letters":
+                requests = build_letters(args)
+            else:
+                requests = await build_deadline(args)
+            results[name] = await runner.run(requests)
+            print_report(name, results[name])
+    finally:
+        await runner.close()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # 必须在导入应用之前确定数据库，config 在导入时读取 DATABASE_URL
+    tmp_dir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif "DATABASE_URL" not in os.environ:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="light-load-")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp_dir.name}/load.db"
+        os.environ.setdefault("ARCHIVE_DATABASE_URL", f"sqlite+aiosqlite:///{tmp_dir.name}/archive.db")
+    if args.scenario in MULTIPROCESS_SCENARIOS and not args.no_invalidation:
+        if tmp_dir is None:
+            tmp_dir = tempfile.TemporaryDirectory(prefix="light-load-")
+        os.environ.setdefault("INVALIDATION_BUS_PATH", f"{tmp_dir.name}/invalidation.bin")
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
@@ -1,48 +1,180 @@
 #!/usr/bin/env python3
 """
 启动服务器脚本
+
+在父进程中执行一次启动前检查（导入应用、执行数据库迁移、校准统计计数），然后由父进程绑定监听套接字，
+以 spawn 方式启动多个 uvicorn worker 共享该套接字；父进程负责监督，worker 异常退出时自动补齐：
+    python start_server.py                            # worker 数默认为CPU核数
+    python start_server.py --workers 4 --port 8080
+    python start_server.py --workers 1 --loop asyncio --http h11
+    python start_server.py --check                    # 只执行启动前检查
+
+worker 通过环境变量 DB_PREFLIGHT_DONE 得知数据库已初始化，启动时不再重复迁移。
 """
-import uvicorn
+import argparse
 import asyncio
+import os
 import sys
 import traceback
+from importlib.util import find_spec
+from pathlib import Path
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+APP = "the_light_on_the_way_back.app:app"
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="归途的光服务器启动器")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"), help="监听地址")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")), help="监听端口")
+    parser.add_argument("--uds", default=None, help="改为监听 Unix 套接字（反向代理在同一台机器上时）")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="worker 进程数（默认CPU核数）"
+    )
+    parser.add_argument(
+        "--loop", choices=["auto", "uvloop", "asyncio"], default="auto",
+        help="事件循环实现（auto：已安装 uvloop 时使用 uvloop）"
+    )
+    parser.add_argument(
+        "--http", choices=["auto", "httptools", "h11"], default="auto",
+        help="HTTP 解析实现（auto：已安装 httptools 时使用 httptools）"
+    )
+    parser.add_argument("--backlog", type=int, default=2048, help="监听队列长度（受 net.core.somaxconn 限制）")
+    parser.add_argument("--keep-alive", type=int, default=5, help="空闲长连接保持的秒数（应小于反向代理的空闲超时）")
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="关闭时等待进行中请求完成的秒数，超时后强制关闭连接"
+    )
+    parser.add_argument("--log-level", default="info", help="日志级别")
+    parser.add_argument("--check", action="store_true", help="只执行启动前检查，不启动服务")
+    return parser.parse_args()
+
 
-async def test_app():
-    """测试应用是否可以正常导入和初始化"""
+def resolve_implementations(loop: str, http: str):
+    """
+    确定事件循环和HTTP解析的实现
+
+    Args:
+        loop: auto / uvloop / asyncio
+        http: auto / httptools / h11
+
+    Returns:
+        (事件循环实现, HTTP解析实现)
+
+    Raises:
+        SystemExit: 显式指定的实现未安装
+    """
+    resolved = []
+    for choice, fast, fallback in ((loop, "uvloop", "asyncio"), (http, "httptools", "h11")):
+        installed = find_spec(fast) is not None
+        if choice == "auto":
+            choice = fast if installed else fallback
+        elif choice == fast and not installed:
+            raise SystemExit(f"未安装 {fast}，请安装 uvicorn[standard] 或改用 {fallback}")
+        resolved.append(choice)
+    return tuple(resolved)
+
+
+async def preflight(workers: int) -> bool:
+    """
+    启动前检查，只在父进程中执行一次
+
+    Args:
+        workers: worker 进程数
+
+    Returns:
+        检查是否通过
+    """
     try:
+        from the_light_on_the_way_back import config
+        for name in ("SECRET_KEY", "ENCRYPTION_KEY"):
+            if getattr(config, name).endswith("change-in-production"):
+                print(f"警告: {name} 仍为默认值，生产环境必须通过环境变量设置")
+
         print("正在导入应用...")
-        from the_light_on_the_way_back.app import app
+        from the_light_on_the_way_back.app import app  # noqa: F401  导入失败说明依赖或配置有误
+        from the_light_on_the_way_back.database import engine, init_db, AsyncSessionLocal
+        from the_light_on_the_way_back.archive import letter_archive
+        from the_light_on_the_way_back.services import stats_service
+        from the_light_on_the_way_back.invalidation import invalidation_bus
+        from the_light_on_the_way_back.scheduler import scheduler
         print("应用导入成功！")
 
-        print("正在测试数据库连接...")
-        from the_light_on_the_way_back.database import init_db
-        await init_db()
-        print("数据库连接成功！")
+        try:
+            print("正在初始化数据库...")
+            await init_db()
+            await letter_archive.init()
+            if workers > 1 and engine.dialect.name == "sqlite":
+                # WAL 模式下读取不阻塞写入，多个 worker 同时访问时不必互相等待（设置保存在数据库文件中）
+                async with engine.connect() as conn:
+                    mode = (await conn.exec_driver_sql("PRAGMA journal_mode=WAL")).scalar()
+                print(f"SQLite 日志模式: {mode}")
+            async with AsyncSessionLocal() as db:
+                drifted = await stats_service.reconcile(db)
+            print(f"数据库初始化成功！校准统计计数 {drifted} 项")
+        finally:
+            await letter_archive.close()
+            await engine.dispose()
 
+        if workers > 1:
+            print(f"缓存失效总线: {invalidation_bus.path or '未配置（各worker缓存互不同步）'}")
+            print(f"定时任务锁: {scheduler.lock_path or '未配置（每个worker都运行定时任务）'}")
+            print("注意: 限流、近似重复检测和信笺缓存的状态保存在各worker内存中，不在worker之间共享")
         return True
     except Exception as e:
-        print(f"应用初始化失败: {e}")
+        print(f"启动前检查失败: {e}")
         traceback.print_exc()
         return False
 
-if __name__ == "__main__":
-    print("正在启动归途的光服务器...")
 
-    # 先测试应用
-    if asyncio.run(test_app()):
-        print("开始启动Web服务器...")
-        try:
-            uvicorn.run(
-                "the_light_on_the_way_back.app:app",
-                host="0.0.0.0",
-                port=8000,
-                reload=False,
-                log_level="info"
-            )
-        except Exception as e:
-            print(f"服务器启动失败: {e}")
-            traceback.print_exc()
-            sys.exit(1)
-    else:
+def main():
+    """执行启动前检查并启动 worker"""
+    args = parse_args()
+    loop, http = resolve_implementations(args.loop, args.http)
+
+    # 必须在导入应用之前设置，worker 以 spawn 方式启动并继承环境变量
+    os.environ.setdefault("DATABASE_ECHO", "false")
+    if args.workers > 1 and not os.getenv("INVALIDATION_BUS_PATH"):
+        os.environ["INVALIDATION_BUS_PATH"] = str(Path(__file__).resolve().parent / "data" / "invalidation.bin")
+    if args.workers > 1 and not os.getenv("SCHEDULER_LOCK_PATH"):
+        os.environ["SCHEDULER_LOCK_PATH"] = str(Path(__file__).resolve().parent / "data" / "scheduler.lock")
+
+    print("正在启动归途的光服务器...")
+    if not asyncio.run(preflight(args.workers)):
         print("应用初始化失败，无法启动服务器")
         sys.exit(1)
+    if args.check:
+        return
+
+    os.environ["DB_PREFLIGHT_DONE"] = "true"
+    config = uvicorn.Config(
+        APP,
+        host=args.host,
+        port=args.port,
+        uds=args.uds,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+    address = args.uds or f"{args.host}:{args.port}"
+    print(f"开始启动Web服务器: {address}，{args.workers} 个worker，事件循环 {loop}，HTTP {http}")
+    try:
+        # 父进程绑定一次套接字，所有 worker 在同一个套接字上接受连接
+        sock = config.bind_socket()
+        server = uvicorn.Server(config)
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    except Exception as e:
+        print(f"服务器启动失败: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
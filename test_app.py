@@ -2,10 +2,16 @@
 简单的应用测试
 """
 import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
 from datetime import datetime, timedelta
 from the_light_on_the_way_back.database import init_db, AsyncSessionLocal
-from the_light_on_the_way_back.services import time_capsule_service, facade_service
+from the_light_on_the_way_back.services import time_capsule_service, facade_service, stats_service
 from the_light_on_the_way_back.encryption import encryption_service
+from the_light_on_the_way_back.scheduler import TaskScheduler
 
 async def test_encryption():
     """测试加密功能"""
@@ -90,18 +96,989 @@ async def test_facade_gallery():
         success = await facade_service.applaud_content(db, content.id, "192.168.1.1")
         print(f"鼓掌{'成功' if success else '失败'}")
 
+        # 热度排行
+        trending = await facade_service.get_trending_contents(db, limit=5)
+        print(f"热度第一的内容ID: {trending[0].id if trending else None}")
+
+async def test_singleflight():
+    """测试并发合并：同一封信笺的并发开启只解密一次并共享结果，异常同样共享，执行者被取消时由等待者接手"""
+    print("\n测试并发合并...")
+    from the_light_on_the_way_back.services.singleflight import SingleFlight, singleflight
+    from the_light_on_the_way_back.timeutils import epoch_now
+
+    now = epoch_now()
+    openable = time_capsule_service.build_letter("并发开启的信笺", "并发", now - 1)
+    sealed = time_capsule_service.build_letter("尚未到开启时间", None, now + 3600)
+    async with AsyncSessionLocal() as db:
+        await time_capsule_service.save_letters(db, [openable, sealed])
+
+    async def open_concurrently(letter_id, n=8):
+        async def open_once():
+            async with AsyncSessionLocal() as db:
+                return await time_capsule_service.open_letter(db, letter_id)
+        before = singleflight.executions["open_letter"]
+        results = await asyncio.gather(*(open_once() for _ in range(n)), return_exceptions=True)
+        return results, singleflight.executions["open_letter"] - before
+
+    decrypts = []
+    decrypt_content = encryption_service.decrypt_content
+
+    def counting_decrypt(*args, **kwargs):
+        decrypts.append(1)
+        return decrypt_content(*args, **kwargs)
+
+    encryption_service.decrypt_content = counting_decrypt
+    try:
+        opened, executions = await open_concurrently(openable.id)
+    finally:
+        del encryption_service.decrypt_content
+    print(f"8 个并发开启: 执行 {executions} 次，解密 {len(decrypts)} 次，结果一致: {len({letter.content for letter in opened}) == 1}")
+    assert executions == 1 and len(decrypts) == 2, "并发开启同一封信笺执行了多次解密"
+    assert all(letter.content == "并发开启的信笺" and letter.title == "并发" for letter in opened)
+
+    failed, executions = await open_concurrently(sealed.id)
+    print(f"8 个并发开启尚未到时间的信笺: 执行 {executions} 次，{sum(isinstance(e, ValueError) for e in failed)} 个收到 ValueError")
+    assert executions == 1 and all(isinstance(e, ValueError) for e in failed), "异常没有共享给等待者"
+
+    # 执行者被取消（如客户端断开）时，等待者接手重新计算，而不是一起被取消
+    flight = SingleFlight()
+    runs = []
+    started = asyncio.Event()
+
+    async def compute():
+        runs.append(1)
+        started.set()
+        await asyncio.sleep(0.05)
+        return len(runs)
+
+    leader = asyncio.create_task(flight.do(("page",), compute))
+    await started.wait()
+    waiter = asyncio.create_task(flight.do(("page",), compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+    result = await waiter
+    print(f"执行者被取消后等待者的结果: {result}（共计算 {len(runs)} 次）")
+    assert leader.cancelled() and result == 2, "执行者被取消后等待者没有接手"
+
+async def test_image_upload():
+    """测试图片上传：超过大小限制返回 413，文件头不是图片返回 400，相同内容只保存一份，身份过期后删除图片及缩略图"""
+    print("\n测试图片上传...")
+    import io
+    import httpx
+    from PIL import Image
+    from sqlalchemy import select, update
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.config import STATIC_DIR
+    from the_light_on_the_way_back.models import FacadeContent, FacadeIdentity
+    from the_light_on_the_way_back.routers import facade_gallery
+    from the_light_on_the_way_back.storage import ImageStore, image_store, variant_path
+    from the_light_on_the_way_back.timeutils import epoch_now
+
+    def random_png(size=64) -> bytes:
+        # 随机像素，每次运行的内容哈希都不同
+        buffer = io.BytesIO()
+        Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def stored_files(store, image_path):
+        target = STATIC_DIR / image_path
+        return [path for path in [str(target)] + [variant_path(str(target), w) for w in store.variant_widths] if os.path.exists(path)]
+
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "127.0.0.4")
+    token = identity.identity_token
+    png = random_png()
+
+    facade_gallery.IMAGE_UPLOADS_ENABLED = True
+    max_bytes = image_store.max_bytes
+    try:
+        transport = httpx.ASGITransport(app=app, client=("10.3.0.1", 40000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def upload(data: bytes, name: str = "photo.png"):
+                return await client.post(
+                    "/facade-gallery/upload-image",
+                    data={"identity_token": token, "content_text": "图片上传测试"},
+                    files={"image": (name, data, "image/png")},
+                )
+
+            statuses = [(await upload(png)).status_code, (await upload(png, "again.png")).status_code]
+            not_image = (await upload(b"<?php echo 1; ?>" * 8, "fake.png")).status_code
+            image_store.max_bytes = 1024
+            too_large = (await upload(random_png(128))).status_code
+    finally:
+        image_store.max_bytes = max_bytes
+        facade_gallery.IMAGE_UPLOADS_ENABLED = False
+    leftover = [name for name in os.listdir(image_store.root / ".incoming") if name.endswith(".part")]
+    print(f"上传两次相同的图片: {statuses}，不是图片: {not_image}，超过大小限制: {too_large}，遗留的临时文件: {len(leftover)}")
+    assert statuses == [302, 302] and not_image == 400 and too_large == 413, "图片上传的状态码不正确"
+    assert not leftover, "被拒绝的上传留下了临时文件"
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(FacadeContent.image_path).where(FacadeContent.facade_identity_id == identity.id)
+        )
+        image_paths = result.scalars().all()
+    files = stored_files(image_store, image_paths[0])
+    print(f"两条内容引用的图片: {len(set(image_paths))} 张，磁盘上的文件（原图和缩略图）: {len(files)}")
+    assert len(image_paths) == 2 and len(set(image_paths)) == 1, "相同内容的图片没有去重"
+    assert len(files) == 1 + len(image_store.variant_widths), "缩略图没有生成"
+
+    # 相同内容再次提交时复用已有文件
+    pending = image_store.begin()
+    pending.write(png)
+    _, created = await image_store.commit(pending)
+    image_store.shutdown()
+    print(f"再次提交相同内容: created={created}")
+    assert created is False, "相同内容的图片被当作新文件"
+
+    # 身份过期后删除只被它的内容引用的图片
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(FacadeIdentity).where(FacadeIdentity.id == identity.id).values(expires_at=epoch_now() - 1))
+        await db.commit()
+        await facade_service.cleanup_expired_identities(db)
+    print(f"身份过期后剩余的文件: {len(stored_files(image_store, image_paths[0]))}")
+    assert not stored_files(image_store, image_paths[0]), "身份过期后图片没有删除"
+
+    # 自定义缩略图宽度的存储删除时同样删除这些缩略图
+    store = ImageStore(root=image_store.root, variant_widths=(48,))
+    pending = store.begin()
+    pending.write(random_png())
+    image_path, created = await store.commit(pending)
+    generated = len(stored_files(store, image_path))
+    store.delete(image_path)
+    store.shutdown()
+    print(f"自定义宽度: 生成 {generated} 个文件，删除后剩余 {len(stored_files(store, image_path))}")
+    assert created and generated == 2 and not stored_files(store, image_path), "自定义宽度的缩略图没有删除"
+
+async def test_applause_filter():
+    """测试鼓掌过滤器：确定没有鼓掌过时跳过重复检查查询，可能鼓掌过时仍查询数据库，淘汰和重启后不会误判为没有鼓掌过"""
+    print("\n测试鼓掌过滤器...")
+    from sqlalchemy import event
+    from the_light_on_the_way_back.database import engine
+    from the_light_on_the_way_back.models import FacadeContent
+    from the_light_on_the_way_back.services.applause_filter import applause_filters
+
+    queries = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "FROM facade_applause" in statement:
+            queries.append(statement)
+
+    async def applaud(ip):
+        queries.clear()
+        async with AsyncSessionLocal() as db:
+            return await facade_service.applaud_content(db, content_id, ip), len(queries)
+
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "127.0.0.2")
+        content = await facade_service.create_content(
+            db=db, identity_token=identity.identity_token, content_text="鼓掌过滤器测试"
+        )
+        content_id = content.id
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        first = await applaud("10.1.0.1")  # 本进程第一次：加载过滤器
+        definite_no = await applaud("10.1.0.2")  # 一定没有鼓掌过：跳过查询
+        maybe = await applaud("10.1.0.1")  # 可能鼓掌过：查询数据库后拒绝
+        print(f"首次鼓掌 {first}，一定没有 {definite_no}，可能鼓掌过 {maybe}（结果，查询次数）")
+        assert first == (True, 1) and definite_no == (True, 0) and maybe == (False, 1)
+
+        # 误判：过滤器的位全部置1，新访客也被判为"可能"，仍由数据库确认后接受
+        applause_filters._entries[content_id].bloom.bits[:] = b"\xff" * len(applause_filters._entries[content_id].bloom.bits)
+        false_positive = await applaud("10.1.0.3")
+        print(f"误判为可能鼓掌过的新访客: {false_positive}")
+        assert false_positive == (True, 1), "误判时没有查询数据库确认"
+
+        # 身份过期清理时丢弃过滤器，随后重启（过滤器全部丢失）：重新从数据库加载，已鼓掌的访客仍被拒绝
+        applause_filters.evict([content_id])
+        applause_filters.clear()
+        after_restart = await applaud("10.1.0.2")
+        print(f"淘汰并重启后已鼓掌访客再次鼓掌: {after_restart}")
+        assert after_restart == (False, 1), "淘汰并重启后把已鼓掌的访客当成了没有鼓掌过"
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    async with AsyncSessionLocal() as db:
+        content = await db.get(FacadeContent, content_id)
+    assert content.applause_count == 3, "鼓掌数与接受的鼓掌不一致"
+
+def test_byte_budget_caches():
+    """测试按字节预算淘汰的缓存：超出上限时淘汰最久未使用的条目，移除已开启信笺时清零明文"""
+    print("\n测试缓存字节预算...")
+    from the_light_on_the_way_back.services.card_cache import GalleryCardCache
+    from the_light_on_the_way_back.services.letter_cache import OpenedLetterCache
+
+    cards = GalleryCardCache(enabled=True, max_bytes=10)
+    cards.put(1, 0, "aaaa", 2 ** 40)
+    cards.put(2, 0, "bbbb", 2 ** 40)
+    cards.get(1, 0)  # 1 成为最近使用
+    cards.put(3, 0, "cccc", 2 ** 40)
+    cards.put(4, 0, "x" * 11, 2 ** 40)  # 超过上限的条目不缓存
+    print(f"卡片缓存: {cards.get_stats()}")
+    assert (cards.get(1, 0), cards.get(2, 0), cards.get(3, 0), cards.get(4, 0)) == ("aaaa", None, "cccc", None)
+    assert cards.bytes == 8 and cards.evictions == 1, "字节预算没有按最久未使用淘汰"
+
+    letters = OpenedLetterCache(enabled=True, max_bytes=1024)
+    letters.put(1, "标题", "信笺内容", 0)
+    entry = letters._entries[1]
+    letters.discard(1)
+    print(f"移除后的明文缓冲区: {bytes(entry.content)!r}")
+    assert not any(entry.content) and not any(entry.title) and letters.bytes == 0, "移除的信笺明文没有清零"
+
+async def test_dedup():
+    """测试近似重复检测：近似重复的内容在写入前被拒绝，过期和身份过期淘汰的条目不再参与比较"""
+    print("\n测试近似重复检测...")
+    from the_light_on_the_way_back.dedup import NearDuplicateIndex, near_duplicate_index
+
+    original = "今天在回家的路上看见路灯一盏一盏亮起来，突然觉得所有的疲惫都值得了。"
+    edited = "今天在回家的路上，看见路灯一盏一盏亮起来！突然觉得所有的疲惫都值得了"
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "127.0.0.3")
+        content = await facade_service.create_content(db=db, identity_token=identity.identity_token, content_text=original)
+        try:
+            await facade_service.create_content(db=db, identity_token=identity.identity_token, content_text=edited)
+            rejected = False
+        except ValueError as e:
+            rejected = True
+            print(f"近似重复的内容被拒绝: {e}")
+        assert rejected, "近似重复的内容没有被拒绝"
+
+        # 身份过期清理时淘汰该身份发布的内容，之后相似的内容可以发布
+        near_duplicate_index.evict([content.id])
+        await facade_service.create_content(db=db, identity_token=identity.identity_token, content_text=edited)
+        print("淘汰后相似的内容可以发布")
+
+    # 时间窗口结束的条目在下一次检查时淘汰
+    index = NearDuplicateIndex(window_minutes=0.2 / 60)
+    index.check(original, expires_at=2 ** 40)
+    try:
+        index.check(edited, expires_at=2 ** 40)
+        assert False, "时间窗口内的近似重复没有被拒绝"
+    except ValueError:
+        pass
+    await asyncio.sleep(0.3)
+    index.check(edited, expires_at=2 ** 40)
+    print(f"时间窗口结束后索引中的条目数: {len(index)}")
+    assert len(index) == 1, "过期的条目没有被淘汰"
+
+async def test_rate_limit():
+    """测试限流：桶空后返回 429 和 Retry-After，等待 Retry-After 秒后桶补充令牌"""
+    print("\n测试限流...")
+    import time
+    import httpx
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.ratelimit import rate_limiter
+    from the_light_on_the_way_back.encryption import hash_ip
+
+    client_ip = "10.2.0.1"
+    policy = rate_limiter.policies["identity_create"]
+    transport = httpx.ASGITransport(app=app, client=(client_ip, 40000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = [
+            (await client.post("/facade-gallery/create-identity")).status_code
+            for _ in range(policy.burst)
+        ]
+        limited = await client.post("/facade-gallery/create-identity")
+    retry_after = int(limited.headers.get("Retry-After", 0))
+    print(f"突发容量内: {statuses}，桶空后: {limited.status_code}，Retry-After {retry_after}")
+    assert all(status == 302 for status in statuses), "突发容量内的请求被限流"
+    assert limited.status_code == 429 and retry_after > 0, "桶空后没有返回 429"
+
+    # Retry-After 秒之后桶中补充了一个令牌
+    wait = policy.acquire(hash_ip(client_ip), now=time.monotonic() + retry_after)
+    print(f"等待 {retry_after} 秒后再次请求: {'放行' if wait == 0 else f'仍需等待 {wait:.1f} 秒'}")
+    assert wait == 0, "等待 Retry-After 秒后桶没有补充"
+
+async def test_search():
+    """测试全文搜索：新发布的内容可以搜到，身份过期清理后从索引中移除"""
+    print("\n测试全文搜索...")
+    import secrets
+    from sqlalchemy import text
+    from the_light_on_the_way_back.search import search_index, FTS_TABLE
+    from the_light_on_the_way_back.timeutils import epoch_now
+
+    if not search_index.available:
+        print("SQLite 不支持 FTS5，跳过")
+        return
+
+    keyword = f"lantern{secrets.token_hex(4)}"
+    async with AsyncSessionLocal() as db:
+        identity = await facade_service.create_identity(db, "127.0.0.4")
+        content = await facade_service.create_content(
+            db=db, identity_token=identity.identity_token, content_text=f"归途上的灯 {keyword} 和萤火虫"
+        )
+        found, _ = await facade_service.search_contents(db, keyword)
+        by_cjk, _ = await facade_service.search_contents(db, "萤火")
+        print(f"搜索新内容: {[item.id for item in found]}，按中文词搜索命中: {content.id in [item.id for item in by_cjk]}")
+        assert [item.id for item in found] == [content.id], "搜索不到新发布的内容"
+        assert content.id in [item.id for item in by_cjk], "按中文词搜索不到新发布的内容"
+
+        # 身份过期后由清理任务标记，触发器同时删除索引中的行
+        identity.expires_at = epoch_now() - 1
+        await db.commit()
+        await facade_service.cleanup_expired_identities(db)
+        found, _ = await facade_service.search_contents(db, keyword)
+        indexed = (await db.execute(
+            text(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE rowid = :id"), {"id": content.id}
+        )).scalar()
+        print(f"清理后搜索: {[item.id for item in found]}，索引中剩余 {indexed} 行")
+        assert not found and indexed == 0, "清理后内容仍在搜索索引中"
+
+async def test_letter_archive():
+    """测试信笺冷存储：远期信笺的密文移入归档库后可读取，临近开启时移回；归档库中缺少密文的信笺被标记，不阻塞其他信笺移回"""
+    print("\n测试信笺冷存储...")
+    import time
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from the_light_on_the_way_back.database import Base
+    from the_light_on_the_way_back.archive import LetterArchive, ArchivedLetter
+
+    with tempfile.TemporaryDirectory(prefix="light-archive-") as tmp_dir:
+        # 独立的主库，分层任务不会移动其他测试的信笺
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_dir}/app.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        archive_url = f"sqlite+aiosqlite:///{tmp_dir}/archive.db"
+        archive = LetterArchive(archive_url, horizon_days=30, promote_window_days=7, batch_size=1)
+        # 模拟时间推移：移回窗口覆盖这两封信笺
+        promoter = LetterArchive(archive_url, horizon_days=30, promote_window_days=90, batch_size=1)
+        await archive.init()
+        try:
+            open_at = int(time.time()) + 60 * 86400
+            async with sessions() as db:
+                lost, kept = (
+                    time_capsule_service.build_letter(f"远期信笺{i}", "标题", open_at) for i in range(2)
+                )
+                db.add_all([lost, kept])
+                await db.commit()
+                original = kept.encrypted_content, kept.encrypted_title
+
+                demoted = await archive.demote(db) + await archive.demote(db)
+                fetched = await archive.fetch(kept.id)
+                print(f"移入归档 {demoted} 封，主库中的密文 {len(kept.encrypted_content)} 字节，归档中读取的密文一致: {fetched == original}")
+                assert demoted == 2 and kept.is_archived and kept.encrypted_content == b"", "远期信笺没有移入归档"
+                assert fetched == original, "归档中读取的密文与原密文不一致"
+
+                # 第一封的归档行丢失：移回时标记它，下一批照常移回第二封
+                async with archive.sessions() as session:
+                    await session.execute(delete(ArchivedLetter).where(ArchivedLetter.id == lost.id))
+                    await session.commit()
+                promoted = [await promoter.promote(db) for _ in range(3)]
+                await db.refresh(lost)
+                await db.refresh(kept)
+                print(f"三次移回: {promoted}，缺少密文的信笺已标记: {lost.archive_missing}")
+                assert promoted == [0, 1, 0], "缺少密文的信笺阻塞了其他信笺移回"
+                assert lost.archive_missing and lost.is_archived, "缺少密文的信笺没有被标记"
+                assert not kept.is_archived and (kept.encrypted_content, kept.encrypted_title) == original, "移回的密文不一致"
+        finally:
+            await archive.close()
+            await promoter.close()
+            await engine.dispose()
+
+async def test_stats():
+    """测试统计计数：创建身份和内容、鼓掌、封存和开启信笺时计数随之变化，与COUNT校准的结果一致"""
+    print("\n测试统计计数...")
+    from the_light_on_the_way_back.timeutils import epoch_now
+
+    async with AsyncSessionLocal() as db:
+        drifted = await stats_service.reconcile(db)
+        print(f"校准后修正的计数: {drifted}")
+        before = await stats_service.get_stats(db)
+
+        identity = await facade_service.create_identity(db, "127.0.0.5")
+        content = await facade_service.create_content(
+            db=db, identity_token=identity.identity_token, content_text="统计计数测试"
+        )
+        await facade_service.applaud_content(db, content.id, "10.4.0.1")
+        letter = time_capsule_service.build_letter("统计计数测试信笺", None, epoch_now() - 1)
+        await time_capsule_service.save_letters(db, [letter])
+        sealed = await stats_service.get_stats(db)
+        await time_capsule_service.open_letter(db, letter.id)
+        after = await stats_service.get_stats(db)
+
+        def delta(stats, name):
+            return stats[name] - before[name]
+
+        moved = {
+            name: delta(after, name)
+            for name in ("active_facades", "live_posts", "total_applause", "letters_sealed", "letters_opened")
+        }
+        print(f"计数变化: {moved}，封存后未开启 +{delta(sealed, 'letters_sealed')}")
+        assert moved == {
+            "active_facades": 1, "live_posts": 1, "total_applause": 1, "letters_sealed": 0, "letters_opened": 1,
+        }, "计数没有随写入变化"
+        assert delta(sealed, "letters_sealed") == 1, "封存信笺后未开启计数没有增加"
+
+        # 增量维护的计数应与COUNT校准的结果一致
+        assert await stats_service.reconcile(db) == 0, "增量维护的计数与COUNT不一致"
+        print(f"统计: {await stats_service.get_stats(db)}")
+
+async def test_async_sealing():
+    """测试异步封存：创建信笺立即返回回执，回执随封存完成更新，表单提交重定向到回执页面，队列已满时返回 503"""
+    print("\n测试异步封存...")
+    import httpx
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.sealing import sealing_queue
+
+    open_date = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%dT%H:%M")
+    form = {"title": "异步封存", "content": "入队后在后台加密写入", "open_date": open_date}
+    sealing_queue.enabled = True
+    await sealing_queue.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/time-capsule/create", data=form)
+            receipt = response.json()["receipt"]
+            print(f"创建信笺: {response.status_code}，回执 {receipt}")
+            assert response.status_code == 202 and response.headers["Location"].endswith(receipt)
+
+            await sealing_queue._queue.join()
+            status = (await client.get(f"/time-capsule/receipts/{receipt}")).json()
+            print(f"回执状态: {status['status']}，信笺ID {status.get('letter_id')}")
+            assert status["status"] == "sealed" and status["letter_id"], "信笺没有封存"
+
+            # 其他worker没有这张回执的内存记录：已封存的从数据库查到，签名有效的视为仍在队列中
+            sealing_queue.receipts.clear()
+            other = (await client.get(f"/time-capsule/receipts/{receipt}")).json()
+            queued = (await client.get(f"/time-capsule/receipts/{sealing_queue._issue_receipt()}")).json()
+            forged = await client.get(f"/time-capsule/receipts/{receipt[:-2]}xx")
+            print(f"其他worker查询: {other['status']}，未封存的回执: {queued['status']}，伪造的回执: {forged.status_code}")
+            assert other == status, "其他worker查不到已封存的回执"
+            assert queued["status"] == "queued" and forged.status_code == 404
+
+            # 页面表单提交：重定向到显示回执状态的页面，而不是返回JSON
+            html = {"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"}
+            response = await client.post("/time-capsule/create", data=form, headers=html)
+            location = response.headers.get("Location", "")
+            await sealing_queue._queue.join()
+            page = await client.get(location, headers=html)
+            print(f"表单提交: {response.status_code} -> {location}，回执页面: {page.status_code}")
+            assert response.status_code == 303 and location.startswith("/time-capsule/?receipt="), "表单提交没有重定向到页面"
+            assert page.status_code == 200 and "信笺已封存" in page.text, "回执页面没有显示封存状态"
+
+            max_size, sealing_queue.max_size = sealing_queue.max_size, 0
+            try:
+                response = await client.post("/time-capsule/create", data=form)
+                form_response = await client.post("/time-capsule/create", data=form, headers=html)
+            finally:
+                sealing_queue.max_size = max_size
+            print(f"队列已满时: {response.status_code}，Retry-After {response.headers.get('Retry-After')}，表单提交 {form_response.status_code}")
+            assert response.status_code == 503 and response.headers.get("Retry-After"), "队列已满时没有返回 503"
+            assert form_response.headers["content-type"].startswith("text/html") and "封存队列已满" in form_response.text, \
+                "队列已满时表单提交没有返回页面"
+    finally:
+        await sealing_queue.stop()
+        sealing_queue.enabled = False
+
+async def test_readiness():
+    """测试就绪检查：调度器未运行或任务连续失败时降级，数据库写锁被长时间占用时在超时内返回 503"""
+    print("\n测试就绪检查...")
+    import sqlite3
+    import time
+    import httpx
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.database import get_engine
+    from the_light_on_the_way_back.readiness import readiness
+    from the_light_on_the_way_back.scheduler import scheduler
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def ready():
+            response = await client.get("/ready")
+            return response.status_code, response.json()
+
+        status, body = await ready()
+        stopped = body["checks"]["scheduler"]
+        print(f"调度器未运行: {status}，调度器检查 {stopped['status']} {stopped['reasons']}")
+        assert status == 200 and stopped["status"] == "degraded" and "调度器未运行" in stopped["reasons"]
+
+        scheduler.start()
+        try:
+            running = (await ready())[1]["checks"]["scheduler"]["status"]
+            scheduler.stats["tier_letters"].consecutive_failures = 1
+            failing = (await ready())[1]["checks"]["scheduler"]
+        finally:
+            scheduler.stats["tier_letters"].consecutive_failures = 0
+            scheduler.shutdown()
+        print(f"调度器运行: {running}，任务连续失败: {failing['status']} {failing['reasons']}")
+        assert running == "ready" and failing["status"] == "degraded" and "tier_letters" in failing["reasons"][0]
+
+        # 另一个连接占用 SQLite 写锁：探测在超时后返回未就绪，不等到 busy_timeout
+        locker = sqlite3.connect(get_engine().url.database, isolation_level=None)
+        locker.execute("BEGIN IMMEDIATE")
+        db_timeout, readiness.db_timeout = readiness.db_timeout, 0.2
+        try:
+            started = time.perf_counter()
+            status, body = await ready()
+            elapsed = time.perf_counter() - started
+        finally:
+            readiness.db_timeout = db_timeout
+            locker.execute("ROLLBACK")
+            locker.close()
+        database = body["checks"]["database"]
+        print(f"写锁被占用: {status}，耗时 {elapsed * 1000:.0f} ms，数据库检查 {database['status']} {database['reasons']}")
+        assert status == 503 and body["status"] == "unready" and database["status"] == "unready"
+        assert elapsed < 1.0, "就绪检查的耗时没有受超时限制"
+
+        # 写锁释放后上一次探测结束，数据库恢复就绪
+        await readiness._db_probe
+        database = (await ready())[1]["checks"]["database"]
+        print(f"写锁释放后: 数据库检查 {database['status']}")
+        assert database["status"] in ("ready", "degraded"), "写锁释放后数据库仍未就绪"
+
+async def test_debug_endpoints():
+    """测试调试接口：未启用时返回 404，须携带调试令牌"""
+    print("\n测试调试接口...")
+    import httpx
+    from the_light_on_the_way_back.app import app
+    from the_light_on_the_way_back.profiling import profiler
+    from the_light_on_the_way_back.tracing import tracer
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for component, path in ((profiler, "/debug/profile"), (tracer, "/debug/traces")):
+            enabled, token = component.enabled, component.debug_token
+            try:
+                component.enabled, component.debug_token = False, b"secret"
+                disabled = (await client.get(path, headers={"X-Debug-Token": "secret"})).status_code
+                component.enabled = True
+                anonymous = (await client.get(path)).status_code
+                wrong = (await client.get(path, headers={"X-Debug-Token": "guess"})).status_code
+                allowed = (await client.get(path, headers={"X-Debug-Token": "secret"})).status_code
+            finally:
+                component.enabled, component.debug_token = enabled, token
+            print(f"{path}: 未启用 {disabled}，无令牌 {anonymous}，错误令牌 {wrong}，正确令牌 {allowed}")
+            assert (disabled, anonymous, wrong, allowed) == (404, 403, 403, 200), f"{path} 的访问控制不正确"
+
+async def test_gallery_page_cleanup():
+    """测试回廊页面：身份查询出错时取消已开始的内容查询，不留下无人等待的任务"""
+    print("\n测试回廊页面出错时的清理...")
+    import httpx
+    from the_light_on_the_way_back.app import app
+
+    async def failing_lookup(db, token):
+        raise RuntimeError("身份查询失败")
+
+    facade_service.get_identity = failing_lookup
+    try:
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            status = (await client.get("/facade-gallery/", cookies={"identity_token": "x"})).status_code
+    finally:
+        del facade_service.get_identity
+    await asyncio.sleep(0)
+    leaked = [
+        task for task in asyncio.all_tasks()
+        if task.get_coro().__name__ == "_load_gallery_contents" and not task.done()
+    ]
+    print(f"身份查询出错时: {status}，遗留的查询任务: {len(leaked)}")
+    assert status == 500 and not leaked, "身份查询出错后内容查询任务没有取消"
+
+# 在独立进程中递增版本号
+INVALIDATION_BUMP_PROBE = """
+import sys
+from the_light_on_the_way_back.invalidation import InvalidationBus, GALLERY
+
+bus = InvalidationBus(sys.argv[1])
+for _ in range(int(sys.argv[2])):
+    bus.bump(GALLERY)
+bus.close()
+"""
+
+def test_invalidation_bus():
+    """测试跨进程缓存失效：一个进程递增版本号后另一个进程的观察者发现变化，写入方自己的观察者不变，并发递增不丢失"""
+    print("\n测试缓存失效总线...")
+    from the_light_on_the_way_back.invalidation import InvalidationBus, GALLERY, LETTERS
+
+    with tempfile.TemporaryDirectory(prefix="light-bus-") as tmp_dir:
+        path = f"{tmp_dir}/invalidation.bin"
+        writer, reader = InvalidationBus(path), InvalidationBus(path)
+        try:
+            own, other, letters = writer.watch(GALLERY), reader.watch(GALLERY), reader.watch(LETTERS)
+            primed = (own.changed(), other.changed(), letters.changed())
+            own.bump()
+            seen = (own.changed(), other.changed(), other.changed(), letters.changed())
+            print(f"首次同步: {primed}，写入后（写入方、读取方、读取方再次、其他命名空间）: {seen}")
+            assert primed == (False, False, False), "首次调用应只记录版本号"
+            assert seen == (False, True, False, False), "版本号变化没有正确传到另一个实例"
+
+            # 另一个进程与本进程同时递增，文件锁保证不丢失更新
+            bumper = subprocess.Popen([sys.executable, "-c", INVALIDATION_BUMP_PROBE, path, "500"])
+            for _ in range(500):
+                writer.bump(GALLERY)
+            bumper.wait()
+            print(f"两个进程各递增 500 次后: {reader.generation(GALLERY)}")
+            assert bumper.returncode == 0 and reader.generation(GALLERY) == 1001, "并发递增丢失了更新"
+            assert own.changed() and other.changed(), "其他进程的写入没有被发现"
+        finally:
+            writer.close()
+            reader.close()
+
+def test_sealing_journal():
+    """测试多worker共用封存日志路径：每个进程独占一个日志文件，不重放其他进程的记录，已退出进程的记录由下一个启动的进程接管"""
+    print("\n测试封存日志...")
+    from the_light_on_the_way_back.sealing import SealingJournal, LetterDraft
+
+    def draft(receipt):
+        return LetterDraft(receipt, None, f"信笺{receipt}", 0, False, None, 0.0)
+
+    with tempfile.TemporaryDirectory(prefix="light-journal-") as tmp_dir:
+        path = f"{tmp_dir}/sealing.journal"
+        first, second = SealingJournal(path), SealingJournal(path)
+        first.open()
+        first.submitted(draft("a"))
+        second_pending = second.open()
+        second.submitted(draft("b"))
+        print(f"两个worker的日志文件: {os.path.basename(first.file_path)}, {os.path.basename(second.file_path)}")
+        assert first.file_path != second.file_path, "两个worker共用了同一个日志文件"
+        assert second_pending == [], "重放了另一个运行中worker的记录"
+
+        # 两个worker都退出后，下一个启动的进程重放自己的文件并接管另一个
+        first.close()
+        second.close()
+        restarted = SealingJournal(path)
+        receipts = [record["receipt"] for record in restarted.open()]
+        restarted.close()
+        print(f"重启后重放: {receipts}，剩余日志文件: {sorted(n for n in os.listdir(tmp_dir) if not n.endswith('.lock'))}")
+        assert sorted(receipts) == ["a", "b"], "已退出worker的记录没有被接管"
+        assert not os.path.exists(second.file_path), "接管的日志文件没有删除"
+
+async def test_sealing_replay():
+    """测试重放封存日志：写入数据库后、记录完成前崩溃的信笺不重复封存，同一批中其他信笺照常封存"""
+    print("\n测试封存日志重放...")
+    import secrets
+    import time
+    from the_light_on_the_way_back.sealing import SealingJournal, SealingQueue, LetterDraft
+
+    open_at = int(time.time()) + 3 * 86400
+    sealed, pending = (
+        LetterDraft(secrets.token_hex(8), None, f"重放测试{name}", open_at, False, None, time.time())
+        for name in ("（已封存）", "（未封存）")
+    )
+    with tempfile.TemporaryDirectory(prefix="light-replay-") as tmp_dir:
+        path = f"{tmp_dir}/sealing.journal"
+        crashed = SealingJournal(path)
+        crashed.open()
+        crashed.submitted(sealed)
+        crashed.submitted(pending)
+        # 第一封已经写入数据库，进程在记录完成之前退出
+        letter = time_capsule_service.build_letter(sealed.content, None, open_at)
+        async with AsyncSessionLocal() as db:
+            await time_capsule_service.save_letters(db, [letter], [sealed.receipt])
+        crashed.close()
+
+        queue = SealingQueue(enabled=True, journal_path=path)
+        await queue.start()
+        try:
+            await queue._queue.join()
+        finally:
+            await queue.stop()
+        replayed = await queue.get_receipt(sealed.receipt)
+        completed = await queue.get_receipt(pending.receipt)
+        reopened = SealingJournal(path)
+        left = reopened.open()
+        reopened.close()
+
+    print(f"已封存的回执: {replayed}，未封存的回执: {completed['status']}，失败 {queue.failed}，日志剩余 {len(left)}")
+    assert replayed == {"status": "sealed", "letter_id": letter.id}, "已封存的信笺被重复封存"
+    assert completed["status"] == "sealed" and queue.failed == 0, "同一批中未封存的信笺没有封存"
+    assert queue.submitted == 1 and left == [], "已封存的记录仍留在日志中"
+
+# 在独立进程中运行的持锁worker
+SCHEDULER_LEADER_PROBE = """
+import asyncio, sys
+from the_light_on_the_way_back.scheduler import TaskScheduler
+
+async def main():
+    leader = TaskScheduler(sys.argv[1])
+    leader.start()
+    print(leader.running, flush=True)
+    await asyncio.sleep(60)
+
+asyncio.run(main())
+"""
+
+async def test_scheduler_lock():
+    """测试多worker时只有一个进程运行定时任务，持锁进程被杀死后待命的进程无需重启即可接替"""
+    print("\n测试定时任务锁...")
+
+    with tempfile.TemporaryDirectory(prefix="light-scheduler-") as tmp_dir:
+        lock_path = f"{tmp_dir}/scheduler.lock"
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/app.db",
+            ARCHIVE_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/archive.db",
+            DATABASE_ECHO="false",
+        )
+        leader = subprocess.Popen(
+            [sys.executable, "-c", SCHEDULER_LEADER_PROBE, lock_path],
+            env=env, stdout=subprocess.PIPE, text=True
+        )
+        standby = TaskScheduler(lock_path, standby_retry_seconds=0.1)
+        try:
+            leader_running = (await asyncio.to_thread(leader.stdout.readline)).strip() == "True"
+            standby.start()
+            print(f"持锁worker运行: {leader_running}，本进程待命: {standby.standby}")
+            assert leader_running and not standby.running and standby.standby, "多个worker同时运行了定时任务"
+            assert not standby.health_summary()["running"] and standby.health_summary()["standby"]
+
+            # 持锁worker崩溃，本进程不重启，由待命时的重试接替
+            leader.kill()
+            await asyncio.to_thread(leader.wait)
+            for _ in range(50):
+                if standby.running:
+                    break
+                await asyncio.sleep(0.1)
+            print(f"持锁worker被杀死后本进程接替: {standby.running}")
+            assert standby.running and not standby.standby, "持锁worker被杀死后待命的worker没有接替"
+        finally:
+            standby.shutdown()
+            if leader.poll() is None:
+                leader.kill()
+                leader.wait()
+            leader.stdout.close()
+
+# 引入迁移之前由 create_all 建立的数据库（时间列以ISO文本存储）
+LEGACY_SCHEMA = """
+CREATE TABLE time_capsule_letters (
+    id INTEGER NOT NULL PRIMARY KEY, encrypted_content BLOB NOT NULL, encrypted_title BLOB,
+    created_at DATETIME, open_at DATETIME NOT NULL, is_opened BOOLEAN, send_to_void BOOLEAN,
+    is_destroyed BOOLEAN, destroyed_at DATETIME, creator_ip_hash VARCHAR(64)
+);
+CREATE INDEX ix_time_capsule_letters_open_at ON time_capsule_letters (open_at);
+CREATE TABLE facade_identities (
+    id INTEGER NOT NULL PRIMARY KEY, identity_token VARCHAR(64) NOT NULL, created_at DATETIME,
+    expires_at DATETIME NOT NULL, is_expired BOOLEAN, creator_ip_hash VARCHAR(64)
+);
+CREATE UNIQUE INDEX ix_facade_identities_identity_token ON facade_identities (identity_token);
+CREATE TABLE facade_contents (
+    id INTEGER NOT NULL PRIMARY KEY, facade_identity_id INTEGER NOT NULL, content_text TEXT,
+    image_path VARCHAR(255), created_at DATETIME, applause_count INTEGER, is_deleted BOOLEAN
+);
+CREATE TABLE facade_applause (
+    id INTEGER NOT NULL PRIMARY KEY, content_id INTEGER NOT NULL,
+    applauder_ip_hash VARCHAR(64) NOT NULL, created_at DATETIME
+);
+CREATE INDEX ix_facade_applause_id ON facade_applause (id);
+CREATE TABLE stats_counters (name VARCHAR(64) NOT NULL PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+LEGACY_MIGRATION_PROBE = """
+import asyncio, json, sqlite3, sys
+from datetime import datetime, timedelta
+from the_light_on_the_way_back.encryption import encryption_service
+
+# 迁移前的信笺：开启时间带有亚秒部分，密钥由 open_date.isoformat() 派生
+open_date = datetime.utcnow() - timedelta(hours=1, microseconds=-123456)
+stored = open_date.strftime("%Y-%m-%d %H:%M:%S.%f")
+db = sqlite3.connect(sys.argv[1])
+db.executescript({schema!r})
+db.execute(
+    "INSERT INTO time_capsule_letters VALUES (1, ?, ?, ?, ?, 0, 0, 0, NULL, NULL)",
+    (encryption_service.encrypt_content("旧信笺的内容", open_date),
+     encryption_service.encrypt_content("旧信笺", open_date), stored, stored),
+)
+# 密文损坏的信笺：重新加密任务应跳过它，不影响其他信笺
+db.execute(
+    "INSERT INTO time_capsule_letters VALUES (2, ?, NULL, ?, ?, 0, 0, 0, NULL, NULL)",
+    (b"corrupt" * 16, stored, stored),
+)
+db.commit()
+db.close()
+
+from the_light_on_the_way_back.database import init_db, AsyncSessionLocal
+from the_light_on_the_way_back.models import TimeCapsuleLetter
+from the_light_on_the_way_back.services import time_capsule_service
+
+async def main():
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        opened = await time_capsule_service.open_letter(session, 1)
+        rewrapped = await time_capsule_service.rewrap_letters(session)
+        rewrapped_again = await time_capsule_service.rewrap_letters(session)
+        letter = await session.get(TimeCapsuleLetter, 1)
+        corrupt = await session.get(TimeCapsuleLetter, 2)
+        reopened = encryption_service.decrypt_content(letter.encrypted_content, letter.key_date())
+        return {{
+            "content": opened.content, "title": opened.title, "rewrapped": rewrapped,
+            "open_at_key": letter.open_at_key, "reopened": reopened,
+            "rewrapped_again": rewrapped_again, "corrupt_failed": corrupt.rewrap_failed,
+        }}
+
+print(json.dumps(asyncio.run(main()), ensure_ascii=False))
+"""
+
+def test_legacy_migration():
+    """测试迁移旧数据库：时间列转换为纪元秒后，带亚秒开启时间的旧信笺仍能开启，重新加密后不再需要原始时间，损坏的信笺被跳过"""
+    print("\n测试旧数据库迁移...")
+
+    with tempfile.TemporaryDirectory(prefix="light-legacy-") as tmp_dir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/app.db",
+            ARCHIVE_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/archive.db",
+            DATABASE_ECHO="false",
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", LEGACY_MIGRATION_PROBE.format(schema=LEGACY_SCHEMA), f"{tmp_dir}/app.db"],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"迁移后开启旧信笺: {result['title']} / {result['content']}，重新加密 {result['rewrapped']} 封")
+
+    assert result["content"] == "旧信笺的内容" and result["title"] == "旧信笺", "迁移后旧信笺无法解密"
+    assert result["rewrapped"] == 1 and result["open_at_key"] is None, "旧信笺没有按整秒开启时间重新加密"
+    assert result["reopened"] == "旧信笺的内容", "重新加密后无法解密"
+    assert result["corrupt_failed"] and result["rewrapped_again"] == 0, "损坏的信笺没有被标记跳过"
+
+def test_alembic_cli():
+    """测试在命令行对 create_all 建立的旧数据库执行 alembic upgrade head：时间转换、原始开启时间、重复鼓掌去重，之后模型与表结构一致"""
+    print("\n测试 alembic 命令行迁移旧数据库...")
+    import calendar
+    import sqlite3
+    from alembic.script import ScriptDirectory
+    from the_light_on_the_way_back.database import alembic_config
+
+    def epoch(text):
+        return calendar.timegm(datetime.fromisoformat(text).timetuple())
+
+    with tempfile.TemporaryDirectory(prefix="light-alembic-") as tmp_dir:
+        path = f"{tmp_dir}/app.db"
+        db = sqlite3.connect(path)
+        db.executescript(LEGACY_SCHEMA)
+        db.executescript("""
+            INSERT INTO facade_identities VALUES (1, 'token', '2026-10-18 10:00:00.000000', '2026-10-19 10:00:00.500000', 0, NULL);
+            INSERT INTO facade_contents VALUES (1, 1, '旧内容', NULL, '2026-10-18 10:05:00.000000', 3, 0);
+            INSERT INTO facade_applause VALUES (1, 1, 'ip-a', '2026-10-18 10:06:00.000000');
+            INSERT INTO facade_applause VALUES (2, 1, 'ip-a', '2026-10-18 10:07:00.000000');
+            INSERT INTO facade_applause VALUES (3, 1, 'ip-b', '2026-10-18 10:08:00.000000');
+            INSERT INTO stats_counters VALUES ('total_applause', 3);
+            INSERT INTO time_capsule_letters VALUES
+                (1, x'00', NULL, '2026-10-18 09:00:00.000000', '2026-11-01 08:00:00.250000', 0, 0, 0, NULL, NULL);
+        """)
+        db.commit()
+        db.close()
+
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{path}",
+            ARCHIVE_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/archive.db",
+            DATABASE_ECHO="false",
+        )
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        for command in (["upgrade", "head"], ["check"]):
+            result = subprocess.run(
+                [sys.executable, "-m", "alembic", *command], cwd=cwd, env=env, capture_output=True, text=True
+            )
+            print(f"alembic {' '.join(command)}: 退出码 {result.returncode}")
+            assert result.returncode == 0, result.stderr
+
+        db = sqlite3.connect(path)
+        version = db.execute("SELECT version_num FROM alembic_version").fetchone()[0]
+        open_at, open_at_key = db.execute("SELECT open_at, open_at_key FROM time_capsule_letters").fetchone()
+        expires_at = db.execute("SELECT expires_at FROM facade_identities").fetchone()[0]
+        applause = db.execute("SELECT COUNT(*) FROM facade_applause").fetchone()[0]
+        applause_count = db.execute("SELECT applause_count FROM facade_contents").fetchone()[0]
+        total = db.execute("SELECT value FROM stats_counters WHERE name = 'total_applause'").fetchone()[0]
+        db.close()
+
+    print(f"版本 {version}，开启时间 {open_at}（原始 {open_at_key}），鼓掌 {applause} 条（计数 {applause_count}，总数 {total}）")
+    assert version == ScriptDirectory.from_config(alembic_config()).get_current_head(), "没有迁移到最新版本"
+    assert open_at == epoch("2026-11-01 08:00:00") and open_at_key == "2026-11-01 08:00:00.250000", "开启时间转换不正确"
+    assert expires_at == epoch("2026-10-19 10:00:00"), "身份过期时间转换不正确"
+    assert (applause, applause_count, total) == (2, 2, 2), "重复鼓掌没有去重或计数没有修正"
+
+# 冷启动预算（秒），在全新的解释器中测量
+IMPORT_BUDGET_SECONDS = 1.5
+FIRST_RESPONSE_BUDGET_SECONDS = 3.0
+# 这些依赖应在首次使用时才导入
+LAZY_MODULES = ("cryptography", "apscheduler", "jinja2", "aiosqlite", "multiprocessing", "alembic")
+
+STARTUP_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import the_light_on_the_way_back.app as module
+imported = time.perf_counter()
+eager = [name for name in {lazy!r} if name in sys.modules]
+
+async def first_response():
+    import httpx
+    async with module.app.router.lifespan_context(module.app):
+        transport = httpx.ASGITransport(app=module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://probe") as client:
+            return (await client.get("/health")).status_code
+
+status = asyncio.run(first_response())
+print(json.dumps({{
+    "import": imported - started,
+    "first_response": time.perf_counter() - started,
+    "eager": eager,
+    "status": status,
+}}))
+"""
+
+def test_startup_budget():
+    """测试冷启动：导入时间和启动到首个响应的时间不超过预算，重依赖不在导入时加载"""
+    print("\n测试冷启动预算...")
+
+    with tempfile.TemporaryDirectory(prefix="light-startup-") as tmp_dir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/app.db",
+            ARCHIVE_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir}/archive.db",
+            DATABASE_ECHO="false",
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE.format(lazy=LAZY_MODULES)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(
+        f"导入 {result['import'] * 1000:.0f} ms（预算 {IMPORT_BUDGET_SECONDS * 1000:.0f} ms），"
+        f"启动到首个响应 {result['first_response'] * 1000:.0f} ms（预算 {FIRST_RESPONSE_BUDGET_SECONDS * 1000:.0f} ms）"
+    )
+
+    assert result["status"] == 200, f"健康检查返回 {result['status']}"
+    assert not result["eager"], f"导入应用时加载了应延迟导入的模块: {result['eager']}"
+    assert result["import"] <= IMPORT_BUDGET_SECONDS, "导入时间超出预算"
+    assert result["first_response"] <= FIRST_RESPONSE_BUDGET_SECONDS, "启动到首个响应的时间超出预算"
+
 async def main():
     """主测试函数"""
     print("开始测试归途的光应用...")
     
     # 初始化数据库
     await init_db()
+    async with AsyncSessionLocal() as db:
+        await stats_service.reconcile(db)
     print("数据库初始化完成")
     
     # 运行测试
     await test_encryption()
     await test_time_capsule()
     await test_facade_gallery()
+    await test_singleflight()
+    await test_image_upload()
+    await test_applause_filter()
+    test_byte_budget_caches()
+    await test_dedup()
+    await test_rate_limit()
+    await test_search()
+    await test_letter_archive()
+    await test_stats()
+    await test_async_sealing()
+    test_invalidation_bus()
+    test_sealing_journal()
+    await test_sealing_replay()
+    await test_readiness()
+    await test_debug_endpoints()
+    await test_gallery_page_cleanup()
+    await test_scheduler_lock()
+    test_legacy_migration()
+    test_alembic_cli()
+    test_startup_budget()
     
     print("\n所有测试完成！")
 
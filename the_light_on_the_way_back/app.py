@@ -1,26 +1,52 @@
 """
 FastAPI应用主文件
 """
+import logging
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from .database import init_db
-from .routers import main_router, time_capsule_router, facade_gallery_router
-from .config import APP_NAME, APP_DESCRIPTION, VERSION, STATIC_DIR
-from .scheduler import start_scheduler, stop_scheduler
+from .database import init_db, AsyncSessionLocal
+from .routers import main_router, time_capsule_router, facade_gallery_router, ops_router
+from .config import APP_NAME, APP_DESCRIPTION, VERSION, STATIC_DIR, DB_PREFLIGHT_DONE
+from .scheduler import scheduler, start_scheduler, stop_scheduler
+from .profiling import profiler, ProfilingMiddleware
+from .tracing import tracer, TracingMiddleware
+from .responses import CachedStaticFiles
+from .storage import image_store
+from .services import facade_service, stats_service
+from .archive import letter_archive
+from .sealing import sealing_queue
+from .invalidation import invalidation_bus
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    # 启动时初始化数据库
-    await init_db()
+    # 在启动时而不是导入时配置日志
+    logging.basicConfig(level=logging.INFO)
+    # 启动时初始化数据库（由 start_server.py 启动时已在父进程中完成，每个 worker 不再重复）
+    await init_db(migrate=not DB_PREFLIGHT_DONE)
+    await letter_archive.init()
+    # 由数据库重建回廊热度索引（每个进程各有一份），并校准统计计数（首次启动时创建计数行）
+    async with AsyncSessionLocal() as db:
+        await facade_service.rebuild_trending(db)
+        if not DB_PREFLIGHT_DONE:
+            await stats_service.reconcile(db)
+    # 启动性能诊断（未启用时为空操作）
+    profiler.start()
     # 启动定时任务调度器
     await start_scheduler()
+    # 启动异步封存队列（未启用时为空操作）
+    await sealing_queue.start()
     yield
-    # 关闭时的清理工作
+    # 关闭时的清理工作：先排空封存队列
+    await sealing_queue.stop()
     await stop_scheduler()
+    image_store.shutdown()
+    await letter_archive.close()
+    invalidation_bus.close()
+    await profiler.stop()
+    tracer.close()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -39,16 +65,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求采样剖析中间件（仅在启用性能诊断时添加）
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# 请求追踪中间件（仅在启用追踪时添加）
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
 # 挂载静态文件
 if STATIC_DIR.exists():
-    app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+    app.mount("/static", CachedStaticFiles(directory=str(STATIC_DIR)), name="static")
 
 # 注册路由
 app.include_router(main_router)
 app.include_router(time_capsule_router)
 app.include_router(facade_gallery_router)
+app.include_router(ops_router)
 
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    return {"status": "healthy", "app": APP_NAME, "version": VERSION}
+    return {
+        "status": "healthy",
+        "app": APP_NAME,
+        "version": VERSION,
+        "scheduler": scheduler.health_summary()
+    }
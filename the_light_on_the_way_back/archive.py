@@ -0,0 +1,205 @@
+"""
+信笺冷存储模块
+将开启时间还很遥远的信笺密文移到独立的归档数据库，临近开启时再移回
+"""
+import logging
+import zlib
+from typing import Optional, Tuple
+from sqlalchemy import Column, Integer, LargeBinary, select, delete, and_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase
+
+from .models import TimeCapsuleLetter
+from .timeutils import epoch_now
+from .tracing import tracer
+from .config import (
+    ARCHIVE_DATABASE_URL,
+    LETTER_ARCHIVE_HORIZON_DAYS,
+    LETTER_PROMOTE_WINDOW_DAYS,
+    LETTER_TIERING_BATCH_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+class ArchiveBase(DeclarativeBase):
+    """归档数据库模型基类（与主库的表结构分开管理）"""
+    pass
+
+class ArchivedLetter(ArchiveBase):
+    """归档的信笺密文"""
+    __tablename__ = "archived_letters"
+
+    # 与主库中的信笺ID相同
+    id = Column(Integer, primary_key=True)
+    # 开启时间（纪元秒）
+    open_at = Column(Integer, nullable=False, index=True)
+    # zlib压缩的加密内容
+    content = Column(LargeBinary, nullable=False)
+    # zlib压缩的加密标题（可选）
+    title = Column(LargeBinary, nullable=True)
+
+class LetterArchive:
+    """
+    信笺分层存储
+
+    主库中的信笺行始终保留（ID、开启时间和状态不变，get_openable_letters 等查询不受影响），
+    冷存储时只把密文移到归档库并清空主库中的密文列，主库的页面因此只包含临近开启的信笺。
+    Fernet 密文是base64文本，zlib压缩后约为原大小的四分之三。
+
+    开启时间超过 horizon_days 的信笺被移出，进入 promote_window_days 以内时移回；
+    两个阈值之间的间隔避免信笺在两层之间来回移动。
+    """
+
+    def __init__(
+        self,
+        url: str = ARCHIVE_DATABASE_URL,
+        horizon_days: int = LETTER_ARCHIVE_HORIZON_DAYS,
+        promote_window_days: int = LETTER_PROMOTE_WINDOW_DAYS,
+        batch_size: int = LETTER_TIERING_BATCH_SIZE
+    ):
+        self.url = url
+        self._engine: Optional[AsyncEngine] = None
+        self._sessions: Optional[async_sessionmaker] = None
+        self.horizon = horizon_days * 24 * 60 * 60
+        self.promote_window = promote_window_days * 24 * 60 * 60
+        self.batch_size = batch_size
+
+    @property
+    def engine(self) -> AsyncEngine:
+        """归档库引擎，首次使用时创建"""
+        if self._engine is None:
+            self._engine = create_async_engine(self.url)
+            tracer.instrument_engine(self._engine)
+        return self._engine
+
+    def sessions(self) -> AsyncSession:
+        """创建归档库会话"""
+        if self._sessions is None:
+            self._sessions = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        return self._sessions()
+
+    async def init(self):
+        """创建归档表"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(ArchiveBase.metadata.create_all)
+
+    async def demote(self, db: AsyncSession) -> int:
+        """
+        将开启时间在 horizon 之外的信笺密文移入归档库
+
+        先提交归档库再清空主库，中途失败时密文至少存在于一处；重复执行会覆盖归档行。
+
+        Args:
+            db: 主库会话
+
+        Returns:
+            移入归档的信笺数量
+        """
+        result = await db.execute(
+            select(TimeCapsuleLetter).where(
+                and_(
+                    TimeCapsuleLetter.open_at > epoch_now() + self.horizon,
+                    TimeCapsuleLetter.is_archived == False,
+                    TimeCapsuleLetter.is_destroyed == False
+                )
+            ).limit(self.batch_size)
+        )
+        letters = result.scalars().all()
+        if not letters:
+            return 0
+
+        async with self.sessions() as archive:
+            for letter in letters:
+                await archive.merge(ArchivedLetter(
+                    id=letter.id,
+                    open_at=letter.open_at,
+                    content=zlib.compress(letter.encrypted_content),
+                    title=zlib.compress(letter.encrypted_title) if letter.encrypted_title else None
+                ))
+            await archive.commit()
+
+        for letter in letters:
+            letter.encrypted_content = b""
+            letter.encrypted_title = None
+            letter.is_archived = True
+        await db.commit()
+        return len(letters)
+
+    async def promote(self, db: AsyncSession) -> int:
+        """
+        将即将开启的归档信笺移回主库
+
+        归档库中找不到密文的信笺记录日志并标记为 archive_missing，之后不再选取，
+        否则这些信笺每次都占据批次，积累到 batch_size 封后其他信笺再也无法移回。
+
+        Args:
+            db: 主库会话
+
+        Returns:
+            移回主库的信笺数量
+        """
+        result = await db.execute(
+            select(TimeCapsuleLetter).where(
+                and_(
+                    TimeCapsuleLetter.open_at <= epoch_now() + self.promote_window,
+                    TimeCapsuleLetter.is_archived == True,
+                    TimeCapsuleLetter.archive_missing == False
+                )
+            ).limit(self.batch_size)
+        )
+        letters = {letter.id: letter for letter in result.scalars().all()}
+        if not letters:
+            return 0
+
+        async with self.sessions() as archive:
+            result = await archive.execute(
+                select(ArchivedLetter).where(ArchivedLetter.id.in_(letters))
+            )
+            archived = result.scalars().all()
+
+            for row in archived:
+                letter = letters[row.id]
+                letter.encrypted_content = zlib.decompress(row.content)
+                letter.encrypted_title = zlib.decompress(row.title) if row.title else None
+                letter.is_archived = False
+            missing = letters.keys() - {row.id for row in archived}
+            if missing:
+                logger.error(f"归档库中缺少信笺密文，已标记为 archive_missing: {sorted(missing)}")
+                for letter_id in missing:
+                    letters[letter_id].archive_missing = True
+            await db.commit()
+
+            # 主库提交后再删除归档行
+            await archive.execute(
+                delete(ArchivedLetter).where(ArchivedLetter.id.in_([row.id for row in archived]))
+            )
+            await archive.commit()
+        return len(archived)
+
+    async def fetch(self, letter_id: int) -> Tuple[bytes, Optional[bytes]]:
+        """
+        读取归档的密文
+
+        Args:
+            letter_id: 信笺ID
+
+        Returns:
+            (加密内容, 加密标题)
+
+        Raises:
+            ValueError: 归档库中没有该信笺
+        """
+        async with self.sessions() as archive:
+            row = await archive.get(ArchivedLetter, letter_id)
+        if row is None:
+            raise ValueError("归档中找不到信笺")
+        return zlib.decompress(row.content), zlib.decompress(row.title) if row.title else None
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+            self._sessions = None
+
+# 全局信笺归档实例
+letter_archive = LetterArchive()
@@ -9,6 +9,7 @@ BASE_DIR = Path(__file__).parent.parent
 
 # 数据库配置
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{BASE_DIR}/data/app.db")
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "true").lower() == "true"  # 输出每条SQL（开发时使用，start_server.py 默认关闭）
 
 # 安全配置
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -17,6 +18,12 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # 加密配置
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "your-encryption-key-change-in-production")
+KDF_ALGORITHM = os.getenv("KDF_ALGORITHM", "pbkdf2")  # 新密文使用的密钥派生算法：pbkdf2 或 scrypt
+KDF_PBKDF2_ITERATIONS = int(os.getenv("KDF_PBKDF2_ITERATIONS", "100000"))  # PBKDF2-SHA256 迭代次数
+KDF_SCRYPT_LOG2_N = int(os.getenv("KDF_SCRYPT_LOG2_N", "14"))  # scrypt 成本参数 N 的以2为底的对数
+KDF_SCRYPT_R = int(os.getenv("KDF_SCRYPT_R", "8"))  # scrypt 块大小
+KDF_SCRYPT_P = int(os.getenv("KDF_SCRYPT_P", "1"))  # scrypt 并行度
+LETTER_REWRAP_BATCH_SIZE = int(os.getenv("LETTER_REWRAP_BATCH_SIZE", "50"))  # 每次重新封装任务最多迁移的信笺数
 
 # 应用配置
 APP_NAME = "归途的光"
@@ -26,19 +33,122 @@ VERSION = "0.1.0"
 # 时光信笺配置
 MAX_LETTER_LENGTH = 5000  # 最大信笺长度
 MAX_FUTURE_DAYS = 365 * 5  # 最多可设置5年后开启
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL", f"sqlite+aiosqlite:///{BASE_DIR}/data/archive.db")  # 信笺冷存储数据库
+LETTER_ARCHIVE_HORIZON_DAYS = int(os.getenv("LETTER_ARCHIVE_HORIZON_DAYS", "30"))  # 开启时间超过该天数的信笺移入冷存储
+LETTER_PROMOTE_WINDOW_DAYS = int(os.getenv("LETTER_PROMOTE_WINDOW_DAYS", "7"))  # 距开启不足该天数时移回主库
+LETTER_TIERING_BATCH_SIZE = 500  # 每次分层任务最多移动的信笺数
+ASYNC_SEALING_ENABLED = os.getenv("ASYNC_SEALING_ENABLED", "false").lower() == "true"  # 创建信笺时只入队，由后台批量封存
+SEALING_QUEUE_MAX_SIZE = int(os.getenv("SEALING_QUEUE_MAX_SIZE", "1000"))  # 封存队列容量
+SEALING_WORKERS = int(os.getenv("SEALING_WORKERS", "2"))  # 封存工作协程数（同时也是加密线程数）
+SEALING_BATCH_SIZE = 20  # 每批封存的最大信笺数
+SEALING_JOURNAL_PATH = os.getenv("SEALING_JOURNAL_PATH", "")  # 加密的封存日志文件，为空时不写日志
+SEALING_RECEIPTS_KEPT = 10000  # 内存中保留的回执数量
+SEALING_RECEIPT_TTL_SECONDS = 7 * 24 * 60 * 60  # 回执的有效期，过期的回执从数据库中删除
+SEALING_DRAIN_TIMEOUT_SECONDS = 30  # 关闭时等待队列排空的时间
+SEALING_RETRY_AFTER_SECONDS = 5  # 封存队列已满时建议客户端等待的秒数
+LETTER_CACHE_ENABLED = os.getenv("LETTER_CACHE_ENABLED", "false").lower() == "true"  # 缓存已开启信笺的明文
+LETTER_CACHE_TTL_SECONDS = int(os.getenv("LETTER_CACHE_TTL_SECONDS", "600"))  # 缓存条目存活时间
+LETTER_CACHE_MAX_BYTES = int(os.getenv("LETTER_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))  # 缓存明文总字节数上限
 
 # 假象回廊配置
 FACADE_LIFETIME_HOURS = 24  # 假象身份存在时间（小时）
 MAX_FACADE_CONTENT_LENGTH = 1000  # 最大内容长度
 MAX_APPLAUSE_PER_CONTENT = 100  # 每个内容最多鼓掌数
+APPLAUSE_FILTER_ENABLED = os.getenv("APPLAUSE_FILTER_ENABLED", "true").lower() == "true"  # 用每条内容的布隆过滤器跳过首次鼓掌前的重复检查查询
+APPLAUSE_FILTER_FALSE_POSITIVE_RATE = 0.01  # 布隆过滤器按每条内容的鼓掌上限计算的误判率
+APPLAUSE_FILTER_MAX_BYTES = int(os.getenv("APPLAUSE_FILTER_MAX_BYTES", str(8 * 1024 * 1024)))  # 鼓掌过滤器占用的总字节数上限
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "3"))  # 热度半衰期（小时）
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"  # 拒绝与近期内容近似重复的发布
+DEDUP_WINDOW_MINUTES = float(os.getenv("DEDUP_WINDOW_MINUTES", "60"))  # 近似重复检测的时间窗口
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.6"))  # 视为近似重复的相似度（四字片段的Jaccard相似度）
+DEDUP_MIN_LENGTH = 20  # 去掉空白标点后短于该长度的内容不做检测（短句容易巧合相同）
+DEDUP_MAX_ENTRIES = 50000  # 索引最多保存的近期内容数
+
+# 全文搜索配置（SQLite FTS5）
+SEARCH_MAX_QUERY_LENGTH = 100  # 搜索词最大长度
+SEARCH_MAX_QUERY_TERMS = 8  # 搜索词最多片段数
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))  # 单次查询参与相关度排序的最新命中数上限
+
+# 图片上传配置
+IMAGE_UPLOADS_ENABLED = os.getenv("IMAGE_UPLOADS_ENABLED", "false").lower() == "true"
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))  # 单张图片大小上限
+MAX_UPLOAD_FIELD_BYTES = 16 * 1024  # 上传表单中普通字段的大小上限
+IMAGE_VARIANT_WIDTHS = (320, 960)  # 缩略图宽度（需安装 Pillow）
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))  # 缩略图进程池大小
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # 按内容寻址的图片永不变化，可长期缓存
+
+# 定时任务配置
+SCHEDULER_MAX_INSTANCES = int(os.getenv("SCHEDULER_MAX_INSTANCES", "1"))  # 同一任务最多并行实例数
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "true").lower() == "true"  # 积压的触发合并为一次
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", "300"))  # 错过触发后仍可补跑的时限
+SCHEDULER_JITTER_SECONDS = int(os.getenv("SCHEDULER_JITTER_SECONDS", "0"))  # 触发时间随机抖动，错开多实例
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", "")  # 多个worker中只有持有此文件锁的一个运行定时任务，为空时每个进程都运行
+SCHEDULER_STANDBY_RETRY_SECONDS = float(os.getenv("SCHEDULER_STANDBY_RETRY_SECONDS", "15"))  # 待命的worker重试取得锁的间隔
+CLEANUP_IDENTITIES_INTERVAL_SECONDS = 60 * 60  # 清理过期假象身份的间隔
+CLEANUP_VOID_LETTERS_INTERVAL_SECONDS = 24 * 60 * 60  # 清理虚空信笺的间隔
+CHECK_OPENABLE_LETTERS_INTERVAL_SECONDS = 60  # 检查可开启信笺的间隔
+TIER_LETTERS_INTERVAL_SECONDS = 60 * 60  # 信笺冷热分层的间隔
+REWRAP_LETTERS_INTERVAL_SECONDS = 10 * 60  # 将信笺迁移到当前密钥派生参数的间隔
+RECONCILE_STATS_INTERVAL_SECONDS = 60 * 60  # 用COUNT校准统计计数的间隔
+CLEANUP_RECEIPTS_INTERVAL_SECONDS = 60 * 60  # 清理过期封存回执的间隔
+
+# 限流配置（按客户端IP哈希的令牌桶，状态保存在各worker进程内存中）
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_POLICIES = {  # 策略名: (突发容量, 每分钟补充的请求数)
+    "letter_create": (5, 6),  # 创建信笺（两次密钥派生）
+    "identity_create": (3, 2),  # 创建假象身份
+    "content_create": (10, 20),  # 发布回廊内容
+    "image_upload": (5, 10),  # 上传图片
+}
+RATE_LIMIT_MAX_KEYS = 100000  # 每条策略最多跟踪的客户端数
+
+# 多进程部署配置
+DB_PREFLIGHT_DONE = os.getenv("DB_PREFLIGHT_DONE", "false").lower() == "true"  # 启动器已在父进程中建表、迁移和校准计数，worker 启动时跳过
+INVALIDATION_BUS_PATH = os.getenv("INVALIDATION_BUS_PATH", "")  # 多个worker共享的缓存版本号文件，为空时只在进程内有效
+TRENDING_RESYNC_INTERVAL_SECONDS = float(os.getenv("TRENDING_RESYNC_INTERVAL_SECONDS", "1"))  # 其他worker写入后重建热度索引的最小间隔
+
+# 性能诊断配置（默认关闭，低采样率下可在生产环境常开）
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))  # 请求采样比例
+PROFILING_DEBUG_HEADER = "X-Debug-Profile"  # 携带正确令牌时强制剖析该请求
+PROFILING_DEBUG_TOKEN = os.getenv("PROFILING_DEBUG_TOKEN", "")  # 为空时禁用请求头触发
+PROFILING_SAMPLE_INTERVAL_MS = 5  # 调用栈采样间隔（毫秒）
+PROFILING_DUMP_PATH = os.getenv("PROFILING_DUMP_PATH", "")  # 关闭时写出热点数据的文件
+LOOP_LAG_CHECK_INTERVAL_MS = 100  # 事件循环心跳间隔（毫秒）
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))  # 判定阻塞的阈值（毫秒）
+
+# 请求追踪配置（默认关闭；关闭时各层追踪点只多一次上下文变量读取）
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.1"))  # 请求采样比例
+TRACING_DEBUG_HEADER = "X-Debug-Trace"  # 携带正确令牌时强制追踪该请求
+TRACING_DEBUG_TOKEN = os.getenv("TRACING_DEBUG_TOKEN", "")  # 为空时禁用请求头触发
+TRACING_BUFFER_SIZE = int(os.getenv("TRACING_BUFFER_SIZE", "200"))  # 内存中保留的最近追踪数
+TRACING_EXPORT_PATH = os.getenv("TRACING_EXPORT_PATH", "")  # 追踪逐条追加写入的 JSON Lines 文件，为空时只保存在内存中
+
+# 就绪检查配置（/ready，负载均衡据此摘除卡住的worker）
+READY_DB_TIMEOUT_MS = int(os.getenv("READY_DB_TIMEOUT_MS", "1000"))  # 数据库探测超时，超时即未就绪（也是检查耗时的上限）
+READY_DB_DEGRADED_MS = int(os.getenv("READY_DB_DEGRADED_MS", "100"))  # 数据库往返或获取写锁超过该值时为降级
+READY_LOOP_LAG_DEGRADED_MS = int(os.getenv("READY_LOOP_LAG_DEGRADED_MS", "50"))  # 事件循环延迟超过该值时为降级
+READY_LOOP_LAG_UNREADY_MS = int(os.getenv("READY_LOOP_LAG_UNREADY_MS", "500"))  # 事件循环延迟超过该值时为未就绪
+READY_QUEUE_DEGRADED_RATIO = 0.8  # 封存队列深度达到容量的该比例时为降级
+
+# 页面渲染配置
+TEMPLATE_STREAMING_ENABLED = os.getenv("TEMPLATE_STREAMING_ENABLED", "true").lower() == "true"  # 回廊和信笺页面流式渲染，外壳先于数据发送
+TEMPLATE_STREAM_CHUNK_SIZE = 16 * 1024  # 流式渲染时合并片段的字符数（渲染等待数据时提前发送）
+CARD_CACHE_ENABLED = os.getenv("CARD_CACHE_ENABLED", "true").lower() == "true"  # 缓存回廊内容卡片渲染好的HTML
+CARD_CACHE_MAX_BYTES = int(os.getenv("CARD_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))  # 卡片缓存占用的总字节数上限
 
 # 静态文件配置
 STATIC_DIR = BASE_DIR / "static"
 TEMPLATES_DIR = BASE_DIR / "templates"
+UPLOADS_DIR = STATIC_DIR / "uploads"
 
-# 确保模板目录存在
-TEMPLATES_DIR.mkdir(exist_ok=True)
+DATA_DIR = BASE_DIR / "data"  # 默认数据库和缓存失效总线文件所在目录
 
-# 确保数据目录存在
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
+def ensure_directories():
+    """创建运行所需的目录（由 init_db 调用，导入配置时没有副作用）"""
+    TEMPLATES_DIR.mkdir(exist_ok=True)
+    DATA_DIR.mkdir(exist_ok=True)
+    # 启用图片上传时确保上传目录存在
+    if IMAGE_UPLOADS_ENABLED:
+        UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
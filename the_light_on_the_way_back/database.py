@@ -1,17 +1,39 @@
 """
 数据库连接和会话管理
 """
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from .config import DATABASE_URL
+from .config import DATABASE_URL, DATABASE_ECHO, ensure_directories
+from .search import search_index
+from .tracing import tracer
 
-# 创建异步引擎
-engine = create_async_engine(DATABASE_URL, echo=True)
+_engine: Optional[AsyncEngine] = None
+
+def get_engine() -> AsyncEngine:
+    """获取异步引擎，首次调用时才创建（导入模块时不加载数据库驱动）"""
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(DATABASE_URL, echo=DATABASE_ECHO)
+        tracer.instrument_engine(_engine)
+        AsyncSessionLocal.configure(bind=_engine)
+    return _engine
+
+class _LazySessionMaker(async_sessionmaker):
+    """创建第一个会话时才创建引擎的会话工厂"""
+
+    def __call__(self, **local_kw) -> AsyncSession:
+        get_engine()
+        return super().__call__(**local_kw)
 
 # 创建会话工厂
-AsyncSessionLocal = async_sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
-)
+AsyncSessionLocal = _LazySessionMaker(class_=AsyncSession, expire_on_commit=False)
+
+def __getattr__(name: str):
+    # 兼容 from .database import engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class Base(DeclarativeBase):
     """数据库模型基类"""
@@ -25,7 +47,81 @@ async def get_db():
         finally:
             await session.close()
 
-async def init_db():
-    """初始化数据库"""
+# 迁移脚本所在位置（包内路径，安装后同样可用）
+MIGRATIONS_LOCATION = "the_light_on_the_way_back:migrations"
+
+def alembic_config(connection=None):
+    """
+    创建 Alembic 配置
+
+    Args:
+        connection: 迁移使用的同步数据库连接；为None时迁移环境按 DATABASE_URL 自行连接
+
+    Returns:
+        alembic.config.Config 实例
+    """
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_LOCATION)
+    config.attributes["connection"] = connection
+    return config
+
+def upgrade_schema(connection):
+    """
+    执行全部未完成的迁移（alembic upgrade head）
+
+    Args:
+        connection: 同步数据库连接
+    """
+    from alembic import command
+
+    command.upgrade(alembic_config(connection), "head")
+
+def check_schema_version(connection) -> str:
+    """
+    检查数据库结构是否为最新版本
+
+    只读取 alembic_version 表中记录的版本号，与迁移脚本的最新版本比较，不反射表结构。
+
+    Args:
+        connection: 同步数据库连接
+
+    Returns:
+        当前版本号
+
+    Raises:
+        RuntimeError: 数据库尚未迁移到最新版本
+    """
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    current = MigrationContext.configure(connection).get_current_revision()
+    head = ScriptDirectory.from_config(alembic_config()).get_current_head()
+    if current != head:
+        raise RuntimeError(
+            f"数据库结构版本为 {current}，最新版本为 {head}，请先运行 alembic upgrade head 或通过 start_server.py 启动"
+        )
+    return current
+
+async def init_db(migrate: bool = True):
+    """
+    初始化数据库
+
+    全文搜索的FTS表和触发器依赖 SQLite 是否支持 FTS5，不在迁移中管理，由 search_index 单独创建。
+
+    Args:
+        migrate: 是否执行迁移；为False时只检查结构版本和全文索引是否可用（启动器已在父进程中完成迁移）
+    """
+    ensure_directories()
+    engine = get_engine()
+    if not migrate:
+        async with engine.connect() as conn:
+            await conn.run_sync(check_schema_version)
+            await conn.run_sync(search_index.detect)
+        return
+    async with engine.connect() as conn:
+        # 迁移自行管理事务：每个迁移一个事务，在线建索引在事务之外提交
+        await conn.run_sync(upgrade_schema)
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(search_index.ensure)
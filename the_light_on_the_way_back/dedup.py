@@ -0,0 +1,218 @@
+"""
+近似重复检测模块
+用 MinHash 签名识别近期发布过的相同或略作改动的回廊内容，在写入数据库之前拒绝
+"""
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import (
+    DEDUP_ENABLED,
+    DEDUP_WINDOW_MINUTES,
+    DEDUP_SIMILARITY,
+    DEDUP_MIN_LENGTH,
+    DEDUP_MAX_ENTRIES,
+)
+
+_WORD_RE = re.compile(r"[^\W_]+")
+SHINGLE_SIZE = 4
+_MASK = (1 << 64) - 1
+
+# 签名长度与LSH分段：21段×每段3个值，相似度约0.36以上的内容才会大概率成为候选
+SIGNATURE_SIZE = 63
+BAND_ROWS = 3
+# 空桶借用后续非空桶的值时叠加的偏移，保证借来的值不会与真实值相同
+_BORROW_OFFSET = 1 << 58
+
+
+def normalize(text: str) -> str:
+    """小写并去掉空白和标点，插入空格或符号不改变签名"""
+    return "".join(_WORD_RE.findall(text.lower()))
+
+
+def minhash(normalized: str) -> Tuple[int, ...]:
+    """
+    计算 MinHash 签名（单次置换哈希）
+
+    特征为重叠的 SHINGLE_SIZE 字片段。每个特征只哈希一次，按哈希值分到 SIGNATURE_SIZE 个桶，
+    每个桶取最小值；短文本留下的空桶按顺序借用下一个非空桶的值。两份签名中相等位置的比例
+    是两段文本片段集合 Jaccard 相似度的估计。使用进程内的字符串哈希，签名只在本进程内有意义。
+
+    Args:
+        normalized: normalize() 处理后的文本
+
+    Returns:
+        签名
+    """
+    features = {normalized[i:i + SHINGLE_SIZE] for i in range(max(1, len(normalized) - SHINGLE_SIZE + 1))}
+    mins: List[Optional[int]] = [None] * SIGNATURE_SIZE
+    for feature in features:
+        value, bucket = divmod(hash(feature) & _MASK, SIGNATURE_SIZE)
+        current = mins[bucket]
+        if current is None or value < current:
+            mins[bucket] = value
+    if None not in mins:
+        return tuple(mins)
+
+    signature = list(mins)
+    for i, value in enumerate(mins):
+        if value is None:
+            distance = 1
+            while mins[(i + distance) % SIGNATURE_SIZE] is None:
+                distance += 1
+            signature[i] = mins[(i + distance) % SIGNATURE_SIZE] + distance * _BORROW_OFFSET
+    return tuple(signature)
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """由两份签名估计 Jaccard 相似度"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+class _Entry:
+    __slots__ = ("signature", "expires_at", "content_id")
+
+    def __init__(self, signature: Tuple[int, ...], expires_at: float):
+        self.signature = signature
+        self.expires_at = expires_at
+        self.content_id: Optional[int] = None
+
+
+class NearDuplicateIndex:
+    """
+    近期内容的 MinHash 索引
+
+    签名按 BAND_ROWS 个值一段建立散列表（局部敏感哈希），相似的签名大概率至少有一段完全相同；
+    查询时只比较落在同一段桶里的候选，不必扫描全部条目。
+
+    条目在时间窗口结束或发布者身份过期时失效，总数超过上限时淘汰最早的条目。
+    检查通过时立即登记（在写入数据库之前），并发提交的相同内容中只有第一条能通过。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = DEDUP_ENABLED,
+        window_minutes: float = DEDUP_WINDOW_MINUTES,
+        threshold: float = DEDUP_SIMILARITY,
+        min_length: int = DEDUP_MIN_LENGTH,
+        max_entries: int = DEDUP_MAX_ENTRIES
+    ):
+        self.enabled = enabled
+        self.window = window_minutes * 60
+        self.threshold = threshold
+        self.min_length = min_length
+        self.max_entries = max_entries
+        self.rejected = 0
+        self.checked = 0
+        self._tables: List[Dict[Tuple[int, ...], Set[int]]] = [
+            {} for _ in range(SIGNATURE_SIZE // BAND_ROWS)
+        ]
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_content: Dict[int, int] = {}
+        self._next_key = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check(self, text: Optional[str], expires_at: int) -> Optional[int]:
+        """
+        检查内容是否与近期内容近似重复，不重复时登记
+
+        Args:
+            text: 内容文本
+            expires_at: 发布者身份的过期时间（纪元秒），条目不会比它存活更久
+
+        Returns:
+            登记的条目键（写入成功后传给 bind，失败时传给 discard）；未启用或文本过短时为None
+
+        Raises:
+            ValueError: 与时间窗口内的内容近似重复
+        """
+        if not self.enabled or not text:
+            return None
+        normalized = normalize(text)
+        if len(normalized) < self.min_length:
+            return None
+
+        now = time.time()
+        self._expire(now)
+        self.checked += 1
+        signature = minhash(normalized)
+        candidates = set()
+        for table, band in zip(self._tables, self._bands(signature)):
+            bucket = table.get(band)
+            if bucket:
+                candidates |= bucket
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.expires_at > now and similarity(entry.signature, signature) >= self.threshold:
+                self.rejected += 1
+                raise ValueError("内容与近期发布的内容过于相似")
+
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = _Entry(signature, min(now + self.window, expires_at))
+        for table, band in zip(self._tables, self._bands(signature)):
+            table.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return key
+
+    def bind(self, key: Optional[int], content_id: int):
+        """内容写入成功后关联内容ID，供身份过期时淘汰"""
+        if key is not None and key in self._entries:
+            self._entries[key].content_id = content_id
+            self._by_content[content_id] = key
+
+    def discard(self, key: Optional[int]):
+        """内容写入失败时撤销登记"""
+        if key is not None and key in self._entries:
+            self._remove(key)
+
+    def evict(self, content_ids: Iterable[int]):
+        """淘汰已过期身份发布的内容"""
+        for content_id in content_ids:
+            key = self._by_content.get(content_id)
+            if key is not None:
+                self._remove(key)
+
+    def _bands(self, signature: Tuple[int, ...]):
+        return (signature[i:i + BAND_ROWS] for i in range(0, SIGNATURE_SIZE, BAND_ROWS))
+
+    def _expire(self, now: float):
+        # 按登记顺序排列，窗口相同，因此最早的条目最先到期；身份提前过期的条目由 evict 或查询时的时间检查处理
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            self._remove(key)
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key)
+        if entry.content_id is not None:
+            self._by_content.pop(entry.content_id, None)
+        for table, band in zip(self._tables, self._bands(entry.signature)):
+            bucket = table[band]
+            bucket.discard(key)
+            if not bucket:
+                del table[band]
+
+    def get_stats(self) -> dict:
+        """
+        获取索引统计
+
+        Returns:
+            是否启用、条目数、检查次数和拒绝次数
+        """
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "checked": self.checked,
+            "rejected": self.rejected,
+        }
+
+
+# 全局近似重复索引实例
+near_duplicate_index = NearDuplicateIndex()
@@ -5,19 +5,105 @@
 import base64
 import hashlib
 import secrets
+import struct
+from dataclasses import dataclass
 from datetime import datetime
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from .config import ENCRYPTION_KEY
+from typing import Tuple
+from .config import (
+    ENCRYPTION_KEY,
+    KDF_ALGORITHM,
+    KDF_PBKDF2_ITERATIONS,
+    KDF_SCRYPT_LOG2_N,
+    KDF_SCRYPT_R,
+    KDF_SCRYPT_P,
+)
+from .tracing import tracer
+
+# 密文头：魔数 + 算法编号 + 算法参数，其后为32字节盐值和Fernet令牌
+BLOB_MAGIC = b"TCK\x01"
+KDF_PBKDF2_SHA256 = 1
+KDF_SCRYPT = 2
+SALT_LENGTH = 32
+# 没有密文头的旧数据使用的参数
+LEGACY_PBKDF2_ITERATIONS = 100000
+
+@dataclass(frozen=True)
+class KdfParams:
+    """密钥派生算法及其成本参数"""
+    algorithm: str = "pbkdf2"
+    iterations: int = LEGACY_PBKDF2_ITERATIONS
+    log2_n: int = 14
+    r: int = 8
+    p: int = 1
+
+    @classmethod
+    def from_config(cls) -> "KdfParams":
+        if KDF_ALGORITHM == "scrypt":
+            return cls("scrypt", log2_n=KDF_SCRYPT_LOG2_N, r=KDF_SCRYPT_R, p=KDF_SCRYPT_P)
+        return cls("pbkdf2", iterations=KDF_PBKDF2_ITERATIONS)
+
+    def header(self) -> bytes:
+        """编码为密文头"""
+        if self.algorithm == "scrypt":
+            return BLOB_MAGIC + struct.pack(">BBBB", KDF_SCRYPT, self.log2_n, self.r, self.p)
+        return BLOB_MAGIC + struct.pack(">BI", KDF_PBKDF2_SHA256, self.iterations)
+
+    @classmethod
+    def parse(cls, blob: bytes) -> Tuple["KdfParams", int]:
+        """
+        解析密文头
 
+        Returns:
+            (参数, 盐值起始位置)；没有密文头的旧数据返回旧参数和位置0
+        """
+        if blob.startswith(BLOB_MAGIC):
+            kdf_id = blob[len(BLOB_MAGIC)]
+            offset = len(BLOB_MAGIC) + 1
+            if kdf_id == KDF_PBKDF2_SHA256:
+                (iterations,) = struct.unpack_from(">I", blob, offset)
+                params, offset = cls("pbkdf2", iterations=iterations), offset + 4
+            elif kdf_id == KDF_SCRYPT:
+                log2_n, r, p = struct.unpack_from(">BBB", blob, offset)
+                params, offset = cls("scrypt", log2_n=log2_n, r=r, p=p), offset + 3
+            else:
+                raise ValueError(f"未知的密钥派生算法: {kdf_id}")
+            # 旧数据的随机盐值恰好以魔数开头时，其后不会是Fernet令牌
+            if blob.startswith(b"gAAAAA", offset + SALT_LENGTH):
+                return params, offset
+        return cls("pbkdf2", iterations=LEGACY_PBKDF2_ITERATIONS), 0
+
+    def derive(self, key_material: bytes, salt: bytes) -> bytes:
+        """派生32字节密钥"""
+        # cryptography 在首次加解密时才导入，不计入应用的导入时间
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+        if self.algorithm == "scrypt":
+            kdf = Scrypt(salt=salt, length=32, n=2 ** self.log2_n, r=self.r, p=self.p)
+        else:
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=self.iterations,
+            )
+        return kdf.derive(key_material)
+
+    def describe(self) -> str:
+        if self.algorithm == "scrypt":
+            return f"scrypt(n=2^{self.log2_n}, r={self.r}, p={self.p})"
+        return f"pbkdf2-sha256({self.iterations})"
+
+@tracer.trace_methods("crypto")
 class EncryptionService:
     """加密服务类"""
     
-    def __init__(self, master_key: str = ENCRYPTION_KEY):
+    def __init__(self, master_key: str = ENCRYPTION_KEY, kdf_params: KdfParams = None):
         self.master_key = master_key.encode()
+        self.kdf_params = kdf_params or KdfParams.from_config()
     
-    def _derive_key(self, salt: bytes, open_date: datetime) -> bytes:
+    def _derive_key(self, salt: bytes, open_date: datetime, params: KdfParams = None) -> bytes:
         """
         基于盐值和开启日期派生加密密钥
         这确保了只有在指定日期后才能正确解密
@@ -28,14 +114,10 @@ class EncryptionService:
         # 组合主密钥、盐值和日期
         key_material = self.master_key + salt + date_bytes
         
-        # 使用PBKDF2派生密钥
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(key_material))
+        # 按密文头记录的参数派生密钥（默认使用当前配置）
+        params = params or self.kdf_params
+        with tracer.span("crypto.kdf", algorithm=params.describe()):
+            return base64.urlsafe_b64encode(params.derive(key_material, salt))
     
     def encrypt_content(self, content: str, open_date: datetime) -> bytes:
         """
@@ -46,29 +128,31 @@ class EncryptionService:
             open_date: 开启日期
 
         Returns:
-            包含盐值和加密数据的字节串
+            密文头、盐值和加密数据组成的字节串
         """
         # 生成随机盐值
-        salt = secrets.token_bytes(32)
+        salt = secrets.token_bytes(SALT_LENGTH)
 
         # 派生加密密钥
         key = self._derive_key(salt, open_date)
 
         # 创建Fernet实例
+        from cryptography.fernet import Fernet
         fernet = Fernet(key)
 
         # 加密内容
-        encrypted_content = fernet.encrypt(content.encode())
+        with tracer.span("crypto.fernet_encrypt"):
+            encrypted_content = fernet.encrypt(content.encode())
 
-        # 将盐值和加密内容组合
-        return salt + encrypted_content
+        # 将密文头、盐值和加密内容组合
+        return self.kdf_params.header() + salt + encrypted_content
     
     def decrypt_content(self, encrypted_data: bytes, open_date: datetime, current_date: datetime = None) -> str:
         """
         解密内容
 
         Args:
-            encrypted_data: 包含盐值和加密数据的字节串
+            encrypted_data: 加密时返回的字节串（也兼容没有密文头的旧数据）
             open_date: 开启日期
             current_date: 当前日期（用于验证是否可以解密）
 
@@ -85,22 +169,47 @@ class EncryptionService:
         if current_date < open_date:
             raise ValueError("信笺尚未到开启时间")
 
-        # 提取盐值和加密内容
-        salt = encrypted_data[:32]
-        encrypted_content = encrypted_data[32:]
+        return self._decrypt(encrypted_data, open_date)
+
+    def _decrypt(self, encrypted_data: bytes, open_date: datetime) -> str:
+        # 提取参数、盐值和加密内容
+        params, offset = KdfParams.parse(encrypted_data)
+        salt = encrypted_data[offset:offset + SALT_LENGTH]
+        encrypted_content = encrypted_data[offset + SALT_LENGTH:]
 
         # 派生解密密钥
-        key = self._derive_key(salt, open_date)
+        key = self._derive_key(salt, open_date, params)
 
         # 创建Fernet实例
+        from cryptography.fernet import Fernet
         fernet = Fernet(key)
 
         try:
             # 解密内容
-            decrypted_content = fernet.decrypt(encrypted_content)
+            with tracer.span("crypto.fernet_decrypt"):
+                decrypted_content = fernet.decrypt(encrypted_content)
             return decrypted_content.decode()
         except Exception as e:
             raise ValueError(f"解密失败: {str(e)}")
+
+    def needs_rewrap(self, encrypted_data: bytes) -> bool:
+        """密文是否没有密文头，或使用了与当前配置不同的密钥派生参数"""
+        params, offset = KdfParams.parse(encrypted_data)
+        return offset == 0 or params != self.kdf_params
+
+    def rewrap(self, encrypted_data: bytes, open_date: datetime, key_date: datetime = None) -> bytes:
+        """
+        用当前配置的参数重新加密（不检查开启时间，仅供迁移任务使用）
+
+        Args:
+            encrypted_data: 原密文
+            open_date: 开启日期，新密文的密钥由它派生
+            key_date: 原密文派生密钥时使用的开启日期（与 open_date 不同时传入）
+
+        Returns:
+            新密文
+        """
+        return self.encrypt_content(self._decrypt(encrypted_data, key_date or open_date), open_date)
     
     def can_decrypt(self, open_date: datetime, current_date: datetime = None) -> bool:
         """
@@ -0,0 +1,160 @@
+"""
+跨进程缓存失效模块
+多个 worker 进程通过内存映射文件共享每个缓存命名空间的版本号，无需外部消息服务
+"""
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：只支持单进程
+    fcntl = None
+
+from .config import INVALIDATION_BUS_PATH
+
+# 命名空间及其在文件中的槽位（每个槽位一个8字节无符号整数）
+GALLERY = "gallery"  # 回廊内容、鼓掌和身份过期（热度索引）
+LETTERS = "letters"  # 信笺销毁（已开启信笺缓存）
+NAMESPACES = (GALLERY, LETTERS)
+
+_SLOT = struct.Struct("<Q")
+# 预留槽位，以后增加命名空间时不必改变文件大小
+_FILE_SIZE = 64 * _SLOT.size
+
+class InvalidationBus:
+    """
+    缓存版本号总线
+
+    每个命名空间一个单调递增的版本号。写入方在提交事务后递增版本号，
+    读取方在使用本进程缓存前比较版本号，发现变化即丢弃或重建缓存。
+
+    配置了文件路径时版本号保存在内存映射文件中：读取只是一次内存访问，
+    递增时用文件锁保证多个进程不会丢失更新。未配置路径时版本号只在进程内有效，
+    适用于单进程部署。
+    """
+
+    def __init__(self, path: str = INVALIDATION_BUS_PATH):
+        self.path = path if fcntl is not None else ""
+        self._local: Dict[str, int] = dict.fromkeys(NAMESPACES, 0)
+        self._map: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """版本号是否在进程之间共享"""
+        return bool(self.path)
+
+    def _mapping(self) -> mmap.mmap:
+        # 首次使用时才创建和映射文件，导入模块没有副作用
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(fd).st_size < _FILE_SIZE:
+                            os.ftruncate(fd, _FILE_SIZE)
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    self._fd = fd
+                    self._map = mmap.mmap(fd, _FILE_SIZE)
+        return self._map
+
+    def generation(self, namespace: str) -> int:
+        """
+        读取命名空间的当前版本号
+
+        Args:
+            namespace: 命名空间
+
+        Returns:
+            版本号
+        """
+        if not self.path:
+            return self._local[namespace]
+        return _SLOT.unpack_from(self._mapping(), NAMESPACES.index(namespace) * _SLOT.size)[0]
+
+    def bump(self, namespace: str) -> int:
+        """
+        递增命名空间的版本号（在写入的事务提交之后调用）
+
+        Args:
+            namespace: 命名空间
+
+        Returns:
+            递增后的版本号
+        """
+        if not self.path:
+            with self._lock:
+                self._local[namespace] += 1
+                return self._local[namespace]
+        mapping = self._mapping()
+        offset = NAMESPACES.index(namespace) * _SLOT.size
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                value = _SLOT.unpack_from(mapping, offset)[0] + 1
+                _SLOT.pack_into(mapping, offset, value)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return value
+
+    def watch(self, namespace: str) -> "GenerationWatch":
+        """创建一个跟踪命名空间版本号的观察者"""
+        return GenerationWatch(self, namespace)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+            self._fd = None
+
+class GenerationWatch:
+    """
+    一个进程内缓存对某个命名空间的观察者
+
+    记录缓存最后一次与之同步的版本号。本进程的写入在递增版本号时同步更新记录
+    （本进程的缓存已随写入更新），只有其他进程的写入会使 changed() 返回True。
+    """
+
+    def __init__(self, bus: InvalidationBus, namespace: str):
+        self.bus = bus
+        self.namespace = namespace
+        self.seen: Optional[int] = None
+
+    def changed(self) -> bool:
+        """
+        版本号自上次同步后是否变化；返回True时视为已同步，调用方应丢弃或重建缓存
+
+        首次调用只记录当前版本号（缓存此时由启动流程从数据库构建）。
+        """
+        generation = self.bus.generation(self.namespace)
+        if self.seen is None:
+            self.seen = generation
+            return False
+        if generation == self.seen:
+            return False
+        self.seen = generation
+        return True
+
+    def sync(self):
+        """记录当前版本号（缓存即将从数据库重建时调用）"""
+        self.seen = self.bus.generation(self.namespace)
+
+    def bump(self):
+        """本进程写入后递增版本号"""
+        if self.seen is None:
+            self.seen = self.bus.generation(self.namespace)
+        generation = self.bus.bump(self.namespace)
+        # 期间没有其他进程写入时，本进程的缓存仍是最新的
+        if generation == self.seen + 1:
+            self.seen = generation
+
+# 全局缓存失效总线实例
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,62 @@
+"""
+数据库迁移（Alembic）
+init_db 在启动前检查中执行 upgrade head，也可以在项目根目录运行 alembic upgrade head；
+这里提供各迁移共用的在线建索引工具
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+def _index_names(table: str) -> set:
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _drop_invalid_postgresql_index(name: str):
+    # CREATE INDEX CONCURRENTLY 失败后会留下无效的索引，重试前需要删除
+    invalid = op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid:
+        with op.get_context().autocommit_block():
+            op.drop_index(name, postgresql_concurrently=True)
+
+
+def create_index_online(name: str, table: str, columns: list, unique: bool = False):
+    """
+    在不长时间阻塞写入的前提下创建索引
+
+    索引在迁移事务之外单独创建，已存在时跳过，中途失败后可以重新执行。
+    PostgreSQL 使用 CREATE INDEX CONCURRENTLY，建索引期间读写都不受影响；
+    SQLite 没有并发建索引，每个索引各自在一个短事务中建立，期间写入等待
+    （WAL 模式下读取不受影响），写锁不会跨越多个索引或整个迁移。
+
+    Args:
+        name: 索引名
+        table: 表名
+        columns: 列名列表
+        unique: 是否为唯一索引
+    """
+    if op.get_bind().dialect.name == "postgresql":
+        _drop_invalid_postgresql_index(name)
+    if name in _index_names(table):
+        return
+    with op.get_context().autocommit_block():
+        op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def drop_index_online(name: str, table: str):
+    """
+    删除索引（不存在时跳过），PostgreSQL 上使用 DROP INDEX CONCURRENTLY
+
+    Args:
+        name: 索引名
+        table: 表名
+    """
+    if name not in _index_names(table):
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
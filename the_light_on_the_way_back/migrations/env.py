@@ -0,0 +1,73 @@
+"""
+Alembic 迁移环境
+
+由 init_db 调用时使用传入的连接；在命令行运行 alembic 时按 DATABASE_URL 创建引擎。
+每个迁移在各自的事务中执行，在线建索引的迁移需要在事务之外提交。
+"""
+import asyncio
+from logging.config import fileConfig
+
+import sqlalchemy as sa
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from the_light_on_the_way_back.config import DATABASE_URL
+from the_light_on_the_way_back.database import Base
+from the_light_on_the_way_back import models  # noqa: F401  注册模型
+from the_light_on_the_way_back.search import FTS_TABLE
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name)
+
+
+def include_name(name, type_, parent_names) -> bool:
+    # FTS表及其影子表由 search_index 管理，自动生成迁移时忽略
+    return not (type_ == "table" and name.startswith(FTS_TABLE))
+
+
+def compare_type(context, inspected_column, metadata_column, inspected_type, metadata_type):
+    # create_all 时代的 SQLite 数据库中时间列声明为 DATETIME，0004 只转换了数据：
+    # SQLite 按值存储类型，声明类型不影响读写，重建整张表只为改声明不值得，比较时视为一致
+    if (
+        context.dialect.name == "sqlite"
+        and isinstance(metadata_type, models.EpochTimestamp)
+        and isinstance(inspected_type, sa.DateTime)
+    ):
+        return False
+    return None
+
+
+def do_run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=Base.metadata,
+        include_name=include_name,
+        compare_type=compare_type,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    engine = create_async_engine(DATABASE_URL)
+    try:
+        async with engine.connect() as connection:
+            await connection.run_sync(do_run_migrations)
+    finally:
+        await engine.dispose()
+
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is None:
+        asyncio.run(run_async_migrations())
+    else:
+        do_run_migrations(connection)
+
+
+if context.is_offline_mode():
+    # 迁移需要检查现有的表和索引（接管 create_all 建立的旧数据库、跳过已存在的索引）
+    raise SystemExit("迁移需要连接数据库，不支持 --sql 离线模式")
+run_migrations_online()
@@ -0,0 +1,97 @@
+"""基线：引入迁移之前由 create_all 建立的表结构
+
+新数据库直接建表；此前由 create_all 建立的数据库会补建缺失的列和索引。
+以ISO文本存储的旧时间列由 0004 转换。表结构在这里固定下来，之后模型的变化都通过新的迁移完成。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+metadata = sa.MetaData()
+
+sa.Table(
+    "time_capsule_letters", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("encrypted_content", sa.LargeBinary, nullable=False),
+    sa.Column("encrypted_title", sa.LargeBinary, nullable=True),
+    sa.Column("created_at", sa.Integer),
+    sa.Column("open_at", sa.Integer, nullable=False, index=True),
+    sa.Column("is_opened", sa.Boolean),
+    sa.Column("send_to_void", sa.Boolean),
+    sa.Column("is_destroyed", sa.Boolean),
+    sa.Column("destroyed_at", sa.Integer, nullable=True),
+    sa.Column("creator_ip_hash", sa.String(64), nullable=True),
+    sa.Column("is_archived", sa.Boolean, nullable=False, server_default="0"),
+)
+
+sa.Table(
+    "facade_identities", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("identity_token", sa.String(64), unique=True, nullable=False, index=True),
+    sa.Column("created_at", sa.Integer),
+    sa.Column("expires_at", sa.Integer, nullable=False, index=True),
+    sa.Column("is_expired", sa.Boolean),
+    sa.Column("creator_ip_hash", sa.String(64), nullable=True),
+)
+
+sa.Table(
+    "facade_contents", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("facade_identity_id", sa.Integer, nullable=False, index=True),
+    sa.Column("content_text", sa.Text, nullable=True),
+    sa.Column("image_path", sa.String(255), nullable=True),
+    sa.Column("created_at", sa.Integer, index=True),
+    sa.Column("applause_count", sa.Integer),
+    sa.Column("is_deleted", sa.Boolean),
+)
+
+sa.Table(
+    "facade_applause", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("content_id", sa.Integer, nullable=False, index=True),
+    sa.Column("applauder_ip_hash", sa.String(64), nullable=False),
+    sa.Column("created_at", sa.Integer),
+)
+
+sa.Table(
+    "stats_counters", metadata,
+    sa.Column("name", sa.String(64), primary_key=True),
+    sa.Column("value", sa.Integer, nullable=False),
+)
+
+
+def _adopt(bind, table: sa.Table, inspector):
+    """补建旧数据库中缺失的列和索引"""
+    columns = {column["name"] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in columns:
+            ddl = CreateColumn(column).compile(dialect=bind.dialect)
+            op.execute(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in indexes:
+            index.create(bind)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name in existing:
+            _adopt(bind, table, inspector)
+        else:
+            table.create(bind)
+
+
+def downgrade():
+    metadata.drop_all(op.get_bind())
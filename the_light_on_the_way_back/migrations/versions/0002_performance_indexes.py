@@ -0,0 +1,49 @@
+"""热点查询的复合索引，删除主键上多余的索引
+
+- 回廊分页：未删除的内容按创建时间倒序
+- 身份过期清理和有效身份计数：未过期且已到期的身份
+- 可开启信笺列表、寄往虚空信笺的销毁任务和可开启计数：按状态列加开启时间
+- 主键上的 index=True 在 SQLite 中是整数主键之外的第二份索引，每次插入都要多维护一次
+
+索引在迁移事务之外逐个在线创建，见 create_index_online。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from the_light_on_the_way_back.migrations import create_index_online, drop_index_online
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_facade_contents_is_deleted_created_at", "facade_contents", ["is_deleted", "created_at"]),
+    ("ix_facade_identities_is_expired_expires_at", "facade_identities", ["is_expired", "expires_at"]),
+    (
+        "ix_time_capsule_letters_state_open_at", "time_capsule_letters",
+        ["send_to_void", "is_destroyed", "is_opened", "open_at"],
+    ),
+]
+
+PRIMARY_KEY_INDEXES = [
+    ("ix_time_capsule_letters_id", "time_capsule_letters"),
+    ("ix_facade_identities_id", "facade_identities"),
+    ("ix_facade_contents_id", "facade_contents"),
+    ("ix_facade_applause_id", "facade_applause"),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+    for name, table in PRIMARY_KEY_INDEXES:
+        drop_index_online(name, table)
+
+
+def downgrade():
+    for name, table in PRIMARY_KEY_INDEXES:
+        create_index_online(name, table, ["id"])
+    for name, table, _ in INDEXES:
+        drop_index_online(name, table)
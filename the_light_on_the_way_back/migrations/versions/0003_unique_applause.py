@@ -0,0 +1,63 @@
+"""同一IP对同一内容只能鼓掌一次：(content_id, applauder_ip_hash) 唯一索引
+
+模型中原有的 unique_together 是 Django 的写法，SQLAlchemy 不会据此建立约束，
+同一IP的并发请求可能都通过"是否已鼓掌"的检查而重复插入。
+建索引前删除重复的鼓掌记录（保留最早的一条），并相应减少内容的鼓掌数和鼓掌总数。
+唯一索引以 content_id 开头，原有的 content_id 单列索引随之删除。
+
+删除重复记录在迁移事务中完成，唯一索引随后在线创建；两步之间若又产生了重复记录，
+建索引会失败，重新执行迁移即可。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+from the_light_on_the_way_back.migrations import create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+UNIQUE_INDEX = "ux_facade_applause_content_id_applauder_ip_hash"
+
+
+def upgrade():
+    op.execute(
+        """
+        UPDATE facade_contents SET applause_count = applause_count - (
+            SELECT COUNT(*) - COUNT(DISTINCT applauder_ip_hash) FROM facade_applause
+            WHERE facade_applause.content_id = facade_contents.id
+        )
+        WHERE id IN (
+            SELECT content_id FROM facade_applause
+            GROUP BY content_id HAVING COUNT(*) > COUNT(DISTINCT applauder_ip_hash)
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE stats_counters SET value = value - (
+            SELECT COUNT(*) FROM facade_applause WHERE id NOT IN (
+                SELECT MIN(id) FROM facade_applause GROUP BY content_id, applauder_ip_hash
+            )
+        )
+        WHERE name = 'total_applause'
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM facade_applause WHERE id NOT IN (
+            SELECT MIN(id) FROM facade_applause GROUP BY content_id, applauder_ip_hash
+        )
+        """
+    )
+    create_index_online(UNIQUE_INDEX, "facade_applause", ["content_id", "applauder_ip_hash"], unique=True)
+    drop_index_online("ix_facade_applause_content_id", "facade_applause")
+
+
+def downgrade():
+    create_index_online("ix_facade_applause_content_id", "facade_applause", ["content_id"])
+    drop_index_online(UNIQUE_INDEX, "facade_applause")
@@ -0,0 +1,59 @@
+"""把以ISO文本存储的旧时间列转换为UTC纪元秒，保留信笺派生密钥用的原始开启时间
+
+引入纪元秒之前，信笺的密钥由加密时的 open_date.isoformat() 派生，其中可能带有亚秒部分；
+转换为整数会截断亚秒，按截断后的时间派生出的密钥不同，信笺将无法解密。
+因此先把这些信笺的原始开启时间文本复制到 open_at_key，再转换各时间列；
+重新加密任务（rewrap_letters）把它们改为按整秒开启时间加密后清空 open_at_key。
+
+转换只执行一次，完成后记录在 PRAGMA user_version 中（只有 SQLite 数据库曾以文本存储时间）。
+在此之前由应用启动时直接转换过的数据库已经丢失了亚秒部分，无法由本迁移恢复。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# 曾以ISO文本存储的时间列
+EPOCH_TIMESTAMP_COLUMNS = [
+    ("time_capsule_letters", "created_at"),
+    ("time_capsule_letters", "open_at"),
+    ("time_capsule_letters", "destroyed_at"),
+    ("facade_identities", "created_at"),
+    ("facade_identities", "expires_at"),
+    ("facade_contents", "created_at"),
+    ("facade_applause", "created_at"),
+]
+
+# 完成纪元秒时间戳转换后的 SQLite user_version
+EPOCH_TIMESTAMPS_SCHEMA_VERSION = 1
+
+
+def upgrade():
+    op.add_column("time_capsule_letters", sa.Column("open_at_key", sa.String(32), nullable=True))
+
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    if bind.exec_driver_sql("PRAGMA user_version").scalar() >= EPOCH_TIMESTAMPS_SCHEMA_VERSION:
+        return
+    op.execute(
+        "UPDATE time_capsule_letters SET open_at_key = open_at WHERE typeof(open_at) = 'text'"
+    )
+    for table, column in EPOCH_TIMESTAMP_COLUMNS:
+        op.execute(
+            f"UPDATE {table} SET {column} = CAST(strftime('%s', {column}) AS INTEGER) "
+            f"WHERE typeof({column}) = 'text'"
+        )
+    op.execute(f"PRAGMA user_version = {EPOCH_TIMESTAMPS_SCHEMA_VERSION}")
+
+
+def downgrade():
+    with op.batch_alter_table("time_capsule_letters") as batch:
+        batch.drop_column("open_at_key")
@@ -0,0 +1,28 @@
+"""记录重新加密失败的信笺
+
+重新加密任务遇到损坏或无法解密的信笺时将其标记，之后的批次不再选取，
+否则同一批信笺每次都被选中并失败，任务永远无法向前推进。
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "time_capsule_letters",
+        sa.Column("rewrap_failed", sa.Boolean, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("time_capsule_letters") as batch:
+        batch.drop_column("rewrap_failed")
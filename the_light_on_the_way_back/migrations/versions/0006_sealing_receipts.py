@@ -0,0 +1,30 @@
+"""异步封存回执表
+
+回执状态原先只保存在受理请求的worker内存中，多worker时查询多半落到其他worker而返回404。
+封存完成时在写入信笺的同一事务中记录回执，任何worker都能查询；过期的回执由定时任务删除。
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sealing_receipts",
+        sa.Column("receipt", sa.String(64), primary_key=True),
+        sa.Column("letter_id", sa.Integer, nullable=False),
+        sa.Column("created_at", sa.Integer),
+    )
+    op.create_index("ix_sealing_receipts_created_at", "sealing_receipts", ["created_at"])
+
+
+def downgrade():
+    op.drop_table("sealing_receipts")
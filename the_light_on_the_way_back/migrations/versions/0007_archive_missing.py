@@ -0,0 +1,28 @@
+"""记录归档库中缺少密文的信笺
+
+移回主库时归档库中找不到密文的信笺原先只记录日志、仍标记为已归档，
+之后每次都被选中；这样的信笺积累到一批的数量后，移回任务永远无法推进。
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "time_capsule_letters",
+        sa.Column("archive_missing", sa.Boolean, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("time_capsule_letters") as batch:
+        batch.drop_column("archive_missing")
@@ -1,24 +1,65 @@
 """
 数据库模型定义
 """
-from datetime import datetime, timedelta
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary
-from sqlalchemy.sql import func
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, Index, Integer, String, Text, Boolean, LargeBinary
+from sqlalchemy.types import TypeDecorator
 from .database import Base
+from .timeutils import epoch_now, to_epoch, from_epoch
+
+class EpochTimestamp(TypeDecorator):
+    """
+    UTC纪元秒时间戳列
+
+    以整数存储，比ISO文本更紧凑、比较更快；写入时也接受datetime
+    （无时区信息视为UTC），读出为整数纪元秒。
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, datetime):
+            return to_epoch(value)
+        return value
+
+def letter_key_date(open_at: int, open_at_key: Optional[str] = None) -> datetime:
+    """
+    信笺派生密钥使用的开启时间
+
+    新信笺按纪元秒还原出的整秒UTC时间派生密钥；迁移前加密的信笺使用当时的原始时间，
+    其中可能带有亚秒部分，截断后派生出的密钥不同。
+
+    Args:
+        open_at: 开启时间（纪元秒）
+        open_at_key: 原始开启时间文本
+
+    Returns:
+        不带时区信息的UTC datetime
+    """
+    if open_at_key:
+        return datetime.fromisoformat(open_at_key)
+    return from_epoch(open_at)
 
 class TimeCapsuleLetter(Base):
     """时光信笺模型"""
     __tablename__ = "time_capsule_letters"
+    __table_args__ = (
+        # 可开启信笺、寄往虚空信笺的销毁和可开启计数
+        Index("ix_time_capsule_letters_state_open_at", "send_to_void", "is_destroyed", "is_opened", "open_at"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     # 加密的内容
     encrypted_content = Column(LargeBinary, nullable=False)
     # 加密的标题（可选）
     encrypted_title = Column(LargeBinary, nullable=True)
     # 创建时间
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(EpochTimestamp, default=epoch_now)
     # 开启时间
-    open_at = Column(DateTime(timezone=True), nullable=False)
+    open_at = Column(EpochTimestamp, nullable=False, index=True)
+    # 迁移为纪元秒之前加密的信笺：派生密钥使用的原始开启时间文本（含亚秒部分），重新加密后清空
+    open_at_key = Column(String(32), nullable=True)
     # 是否已开启
     is_opened = Column(Boolean, default=False)
     # 是否寄往虚空（创建后立即销毁）
@@ -26,13 +67,23 @@ class TimeCapsuleLetter(Base):
     # 是否已销毁
     is_destroyed = Column(Boolean, default=False)
     # 销毁时间
-    destroyed_at = Column(DateTime(timezone=True), nullable=True)
+    destroyed_at = Column(EpochTimestamp, nullable=True)
     # 创建者IP（用于防滥用，不用于身份识别）
     creator_ip_hash = Column(String(64), nullable=True)
+    # 密文是否已移入冷存储（此时 encrypted_content 为空）
+    is_archived = Column(Boolean, default=False, nullable=False, server_default="0")
+    # 重新加密失败（密文损坏或无法解密），重新加密任务不再选取
+    rewrap_failed = Column(Boolean, default=False, nullable=False, server_default="0")
+    # 移回主库时归档库中找不到密文，移回任务不再选取
+    archive_missing = Column(Boolean, default=False, nullable=False, server_default="0")
     
+    def key_date(self) -> datetime:
+        """派生密钥使用的开启时间"""
+        return letter_key_date(self.open_at, self.open_at_key)
+
     def can_be_opened(self) -> bool:
         """检查是否可以开启"""
-        return datetime.utcnow() >= self.open_at and not self.is_destroyed
+        return epoch_now() >= self.open_at and not self.is_destroyed
     
     def should_be_destroyed(self) -> bool:
         """检查是否应该被销毁（寄往虚空的信笺）"""
@@ -41,14 +92,18 @@ class TimeCapsuleLetter(Base):
 class FacadeIdentity(Base):
     """假象身份模型"""
     __tablename__ = "facade_identities"
+    __table_args__ = (
+        # 过期清理和有效身份计数
+        Index("ix_facade_identities_is_expired_expires_at", "is_expired", "expires_at"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     # 匿名身份标识（随机生成）
     identity_token = Column(String(64), unique=True, nullable=False, index=True)
     # 创建时间
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(EpochTimestamp, default=epoch_now)
     # 过期时间（24小时后）
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(EpochTimestamp, nullable=False, index=True)
     # 是否已过期
     is_expired = Column(Boolean, default=False)
     # 创建者IP哈希（防滥用）
@@ -57,17 +112,21 @@ class FacadeIdentity(Base):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.expires_at:
-            self.expires_at = datetime.utcnow() + timedelta(hours=24)
+            self.expires_at = epoch_now() + 24 * 60 * 60
     
     def is_valid(self) -> bool:
         """检查身份是否有效"""
-        return datetime.utcnow() < self.expires_at and not self.is_expired
+        return epoch_now() < self.expires_at and not self.is_expired
 
 class FacadeContent(Base):
     """假象回廊内容模型"""
     __tablename__ = "facade_contents"
+    __table_args__ = (
+        # 回廊分页：未删除的内容按创建时间倒序
+        Index("ix_facade_contents_is_deleted_created_at", "is_deleted", "created_at"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     # 关联的假象身份ID
     facade_identity_id = Column(Integer, nullable=False, index=True)
     # 内容文本
@@ -75,7 +134,7 @@ class FacadeContent(Base):
     # 图片路径（如果有）
     image_path = Column(String(255), nullable=True)
     # 创建时间
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(EpochTimestamp, default=epoch_now, index=True)
     # 鼓掌数
     applause_count = Column(Integer, default=0)
     # 是否已删除
@@ -84,15 +143,35 @@ class FacadeContent(Base):
 class FacadeApplause(Base):
     """假象回廊鼓掌记录模型"""
     __tablename__ = "facade_applause"
+    __table_args__ = (
+        # 确保同一IP对同一内容只能鼓掌一次
+        Index("ux_facade_applause_content_id_applauder_ip_hash", "content_id", "applauder_ip_hash", unique=True),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     # 内容ID
-    content_id = Column(Integer, nullable=False, index=True)
+    content_id = Column(Integer, nullable=False)
     # 鼓掌者IP哈希（防止重复鼓掌）
     applauder_ip_hash = Column(String(64), nullable=False)
     # 鼓掌时间
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
-    class Meta:
-        # 确保同一IP对同一内容只能鼓掌一次
-        unique_together = [['content_id', 'applauder_ip_hash']]
+    created_at = Column(EpochTimestamp, default=epoch_now)
+
+class SealingReceipt(Base):
+    """异步封存回执模型（回执到已封存信笺的映射，任何worker都能查询）"""
+    __tablename__ = "sealing_receipts"
+
+    # 回执编号
+    receipt = Column(String(64), primary_key=True)
+    # 封存后的信笺ID
+    letter_id = Column(Integer, nullable=False)
+    # 封存时间（过期的回执由定时任务删除）
+    created_at = Column(EpochTimestamp, default=epoch_now, index=True)
+
+class StatCounter(Base):
+    """统计计数模型（由服务方法在事务内增减，定时任务校准）"""
+    __tablename__ = "stats_counters"
+
+    # 计数名
+    name = Column(String(64), primary_key=True)
+    # 计数值
+    value = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,341 @@
+"""
+性能诊断模块
+提供事件循环阻塞检测和按请求采样的性能剖析，默认关闭
+"""
+import asyncio
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+from .config import (
+    PROFILING_ENABLED,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_DEBUG_HEADER,
+    PROFILING_DEBUG_TOKEN,
+    PROFILING_SAMPLE_INTERVAL_MS,
+    PROFILING_DUMP_PATH,
+    LOOP_LAG_CHECK_INTERVAL_MS,
+    LOOP_LAG_THRESHOLD_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 事件循环空闲时停留的帧，不计入热点
+_IDLE_FRAMES = {("selectors.py", "select"), ("selectors.py", "poll")}
+
+
+def _frame_key(frame) -> str:
+    """将栈帧格式化为 "文件:行号 函数名" """
+    code = frame.f_code
+    return f"{code.co_filename}:{frame.f_lineno} {code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    filename = frame.f_code.co_filename.rsplit("/", 1)[-1]
+    return (filename, frame.f_code.co_name) in _IDLE_FRAMES
+
+
+class StackSampler:
+    """
+    栈采样器
+
+    在后台线程中按固定间隔采样事件循环线程的调用栈，并聚合为热点帧。
+    采用引用计数：只有存在被剖析的请求时线程才会采样。
+    """
+
+    def __init__(self, interval_ms: int = PROFILING_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.thread_id: Optional[int] = None
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.samples = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int):
+        """启动采样线程"""
+        self.thread_id = thread_id
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止采样线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def acquire(self):
+        """开始剖析一个请求"""
+        with self._lock:
+            self._active += 1
+            self._wakeup.set()
+
+    def release(self):
+        """结束剖析一个请求"""
+        with self._lock:
+            self._active -= 1
+            if self._active <= 0:
+                self._active = 0
+                self._wakeup.clear()
+
+    def record_stack(self, frame):
+        """将一个调用栈计入热点统计"""
+        if frame is None or _is_idle(frame):
+            return
+        self.samples += 1
+        self.self_counts[_frame_key(frame)] += 1
+        seen = set()
+        while frame is not None:
+            key = _frame_key(frame)
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key] += 1
+            frame = frame.f_back
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            if self._stopped.is_set():
+                return
+            frame = sys._current_frames().get(self.thread_id)
+            self.record_stack(frame)
+            del frame
+            time.sleep(self.interval)
+
+    def reset(self):
+        self.self_counts.clear()
+        self.total_counts.clear()
+        self.samples = 0
+
+
+class LoopLagMonitor:
+    """
+    事件循环阻塞检测器
+
+    协程心跳按固定间隔休眠并测量实际唤醒延迟；看门狗线程在心跳超过阈值未更新时
+    抓取事件循环线程当前的调用栈，即造成阻塞的代码位置。
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = LOOP_LAG_CHECK_INTERVAL_MS,
+        threshold_ms: int = LOOP_LAG_THRESHOLD_MS,
+        max_events: int = 50,
+    ):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.thread_id: Optional[int] = None
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.checks = 0
+        self.stalls = 0
+        self.events = deque(maxlen=max_events)
+        self.stall_frames = Counter()
+        self._last_beat = time.perf_counter()
+        self._pending: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """在当前事件循环中启动心跳和看门狗"""
+        self.thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        """停止检测"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - started - self.interval)
+            with self._lock:
+                self._last_beat = now
+                self.checks += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.threshold:
+                    self.stalls += 1
+                    event = self._pending or {
+                        "at": datetime.utcnow().isoformat(),
+                        "stack": None,
+                    }
+                    event["lag_ms"] = round(lag * 1000, 2)
+                    self.events.append(event)
+                self._pending = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            with self._lock:
+                overdue = time.perf_counter() - self._last_beat - self.interval
+                if overdue < self.threshold or self._pending is not None:
+                    continue
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is None or _is_idle(frame):
+                    continue
+                self._pending = {
+                    "at": datetime.utcnow().isoformat(),
+                    "stack": traceback.format_stack(frame),
+                }
+                while frame is not None:
+                    self.stall_frames[_frame_key(frame)] += 1
+                    frame = frame.f_back
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "interval_ms": self.interval * 1000,
+                "threshold_ms": self.threshold * 1000,
+                "checks": self.checks,
+                "stalls": self.stalls,
+                "last_lag_ms": round(self.last_lag * 1000, 2),
+                "max_lag_ms": round(self.max_lag * 1000, 2),
+                "recent_stalls": list(self.events),
+            }
+
+
+class Profiler:
+    """性能诊断入口：组合阻塞检测和请求采样剖析"""
+
+    def __init__(
+        self,
+        enabled: bool = PROFILING_ENABLED,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        debug_token: str = PROFILING_DEBUG_TOKEN,
+        dump_path: str = PROFILING_DUMP_PATH,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.debug_header = PROFILING_DEBUG_HEADER.lower().encode()
+        self.debug_token = debug_token.encode()
+        self.dump_path = dump_path
+        self.monitor = LoopLagMonitor()
+        self.sampler = StackSampler()
+        self.profiled_requests = Counter()
+        self.request_time = Counter()
+
+    def should_profile(self, scope) -> bool:
+        """按采样率或调试请求头决定是否剖析当前请求"""
+        if self.debug_token:
+            for name, value in scope.get("headers", ()):
+                if name == self.debug_header and value == self.debug_token:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record_request(self, route: str, duration: float):
+        self.profiled_requests[route] += 1
+        self.request_time[route] += duration
+
+    def start(self):
+        """启动诊断（须在事件循环线程中调用）"""
+        if not self.enabled:
+            return
+        self.monitor.start()
+        self.sampler.start(self.monitor.thread_id)
+        logger.info("性能诊断已启用，请求采样率 %.4f", self.sample_rate)
+
+    async def stop(self):
+        """停止诊断，并按配置写出转储文件"""
+        if not self.enabled:
+            return
+        self.sampler.stop()
+        await self.monitor.stop()
+        if self.dump_path:
+            self.dump(self.dump_path)
+
+    def snapshot(self, top: int = 30) -> dict:
+        """
+        获取诊断快照
+
+        Args:
+            top: 返回的热点帧数量
+
+        Returns:
+            包含循环阻塞统计和热点帧的字典
+        """
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "loop_lag": self.monitor.snapshot(),
+            "stall_hot_frames": self.monitor.stall_frames.most_common(top),
+            "profiled_requests": {
+                route: {
+                    "count": count,
+                    "avg_ms": round(self.request_time[route] / count * 1000, 2),
+                }
+                for route, count in self.profiled_requests.most_common()
+            },
+            "samples": self.sampler.samples,
+            "hot_frames_self": self.sampler.self_counts.most_common(top),
+            "hot_frames_total": self.sampler.total_counts.most_common(top),
+        }
+
+    def dump(self, path: str):
+        """将诊断快照写入文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(top=100), f, ensure_ascii=False, indent=2)
+        logger.info("性能诊断数据已写入 %s", path)
+
+
+class ProfilingMiddleware:
+    """请求采样剖析中间件（纯ASGI实现，未命中采样的请求只多一次随机数判断）"""
+
+    def __init__(self, app, profiler: "Profiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self.profiler.sampler.acquire()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.sampler.release()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path", "")
+            self.profiler.record_request(
+                f"{scope['method']} {path}", time.perf_counter() - started
+            )
+
+
+# 全局性能诊断实例
+profiler = Profiler()
@@ -0,0 +1,166 @@
+"""
+热度排行模块
+在内存中增量维护回廊内容的时间衰减热度，读取前k名只需 O(k)
+"""
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import TRENDING_HALF_LIFE_HOURS
+from .timeutils import epoch_now
+
+# 指数超过该值时整体换基，避免权重溢出浮点数范围
+_MAX_EXPONENT = 256
+
+
+class TrendingIndex:
+    """
+    时间衰减热度索引
+
+    每次鼓掌贡献 2^((鼓掌时间 - 基准时间) / 半衰期) 的权重。所有内容按相同速率衰减，
+    因此按该权重排序的结果不随时间变化：有序列表只需在鼓掌时局部调整，
+    读取时从头顺序取出即可，不必重新排序。
+
+    索引只存在于当前进程内，启动时由数据库重建。
+    """
+
+    def __init__(self, half_life_hours: float = TRENDING_HALF_LIFE_HOURS):
+        self.half_life = half_life_hours * 3600
+        self._base = epoch_now()
+        # 内容ID -> 以基准时间计的热度
+        self._scores: Dict[int, float] = {}
+        # 内容ID -> 过期时间（身份过期后内容从回廊消失）
+        self._expires: Dict[int, int] = {}
+        # 按 (-热度, -内容ID) 升序排列，热度相同时较新的内容靠前
+        self._order: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, content_id: int) -> bool:
+        return content_id in self._scores
+
+    def _weight(self, at: int) -> float:
+        return 2.0 ** ((at - self._base) / self.half_life)
+
+    def _rebase(self, at: int):
+        """将基准时间移动到 at，所有热度等比例缩放，顺序不变"""
+        factor = 2.0 ** ((self._base - at) / self.half_life)
+        self._base = at
+        for content_id in self._scores:
+            self._scores[content_id] *= factor
+        self._order = sorted((-score, -content_id) for content_id, score in self._scores.items())
+
+    def _remove_from_order(self, content_id: int):
+        key = (-self._scores[content_id], -content_id)
+        index = bisect.bisect_left(self._order, key)
+        if index < len(self._order) and self._order[index] == key:
+            del self._order[index]
+
+    def add(self, content_id: int, expires_at: int, score: float = 0.0):
+        """
+        加入一条内容（已存在时只更新过期时间）
+
+        Args:
+            content_id: 内容ID
+            expires_at: 过期时间（纪元秒）
+            score: 以基准时间计的初始热度
+        """
+        self._expires[content_id] = expires_at
+        if content_id in self._scores:
+            return
+        self._scores[content_id] = score
+        bisect.insort(self._order, (-score, -content_id))
+
+    def applaud(self, content_id: int, expires_at: int, at: Optional[int] = None):
+        """
+        记录一次鼓掌
+
+        Args:
+            content_id: 内容ID
+            expires_at: 内容过期时间（内容不在索引中时用于加入）
+            at: 鼓掌时间（纪元秒），默认为当前时间
+        """
+        at = at or epoch_now()
+        if (at - self._base) / self.half_life > _MAX_EXPONENT:
+            self._rebase(at)
+        if content_id not in self._scores:
+            self.add(content_id, expires_at)
+        self._remove_from_order(content_id)
+        self._scores[content_id] += self._weight(at)
+        bisect.insort(self._order, (-self._scores[content_id], -content_id))
+
+    def discard(self, content_id: int):
+        """移除一条内容"""
+        if content_id not in self._scores:
+            return
+        self._remove_from_order(content_id)
+        del self._scores[content_id]
+        del self._expires[content_id]
+
+    def evict(self, content_ids: Iterable[int]) -> int:
+        """
+        批量移除内容（身份过期时调用）
+
+        Returns:
+            实际移除的数量
+        """
+        count = 0
+        for content_id in content_ids:
+            if content_id in self._scores:
+                self.discard(content_id)
+                count += 1
+        return count
+
+    def top(self, limit: int, now: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        获取热度最高的内容
+
+        顺带移除扫描到的已过期内容，因此摊还开销为 O(limit)。
+
+        Args:
+            limit: 数量
+            now: 当前时间（纪元秒）
+
+        Returns:
+            (内容ID, 当前热度) 列表，当前热度即衰减后的有效鼓掌数
+        """
+        now = now or epoch_now()
+        decay = 2.0 ** ((self._base - now) / self.half_life)
+        result = []
+        expired = []
+        for negative_score, negative_id in self._order:
+            content_id = -negative_id
+            if self._expires[content_id] <= now:
+                expired.append(content_id)
+                continue
+            result.append((content_id, -negative_score * decay))
+            if len(result) >= limit:
+                break
+        self.evict(expired)
+        return result
+
+    def rebuild(
+        self,
+        contents: Iterable[Tuple[int, int]],
+        applause: Iterable[Tuple[int, int]],
+        now: Optional[int] = None
+    ):
+        """
+        由数据库中的记录重建索引
+
+        Args:
+            contents: (内容ID, 过期时间) 列表
+            applause: (内容ID, 鼓掌时间) 列表
+            now: 当前时间（纪元秒），作为新的基准时间
+        """
+        self._base = now or epoch_now()
+        self._expires = dict(contents)
+        self._scores = dict.fromkeys(self._expires, 0.0)
+        for content_id, at in applause:
+            if content_id in self._scores:
+                self._scores[content_id] += self._weight(at)
+        self._order = sorted((-score, -content_id) for content_id, score in self._scores.items())
+
+
+# 全局热度索引实例
+trending_index = TrendingIndex()
@@ -0,0 +1,141 @@
+"""
+限流模块
+按客户端IP哈希为开销大的路由分配令牌桶，超出配额时返回 429
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request
+
+from .encryption import hash_ip
+from .config import RATE_LIMIT_ENABLED, RATE_LIMIT_POLICIES, RATE_LIMIT_MAX_KEYS
+
+class TokenBucketPolicy:
+    """
+    一条路由的令牌桶
+
+    每个客户端一个桶，容量为 burst，每秒补充 rate 个令牌，每个请求消耗一个。
+    桶只保存 (令牌数, 更新时间)，按最近访问顺序排列：补满所需时间之后桶与不存在等价，
+    因此每次检查时顺带从最久未访问的一端淘汰已补满的桶，检查和淘汰的均摊开销都是O(1)。
+    """
+
+    def __init__(self, burst: int, per_minute: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.burst = burst
+        self.rate = per_minute / 60
+        # 空桶补满所需的时间
+        self.ttl = burst / self.rate
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.limited = 0
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """
+        为客户端消耗一个令牌
+
+        Args:
+            key: 客户端标识
+            now: 当前时间（单调时钟秒）
+
+        Returns:
+            0 表示放行，否则为需要等待的秒数
+        """
+        if now is None:
+            now = time.monotonic()
+        buckets = self._buckets
+
+        bucket = buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens, updated = bucket
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+            self.allowed += 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        buckets[key] = (tokens, now)
+
+        # 淘汰已补满的桶；超过上限时淘汰最久未访问的桶（对其客户端只会更宽松）
+        while buckets:
+            oldest, (_, updated) = next(iter(buckets.items()))
+            if now - updated < self.ttl and len(buckets) <= self.max_keys:
+                break
+            del buckets[oldest]
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class RateLimiter:
+    """按策略名管理令牌桶"""
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, policies: Dict[str, Tuple[int, float]] = RATE_LIMIT_POLICIES):
+        self.enabled = enabled
+        self.policies = {
+            name: TokenBucketPolicy(burst, per_minute)
+            for name, (burst, per_minute) in policies.items()
+        }
+
+    def check(self, policy: str, client_ip: str) -> float:
+        """
+        检查客户端是否可以访问
+
+        Args:
+            policy: 策略名
+            client_ip: 客户端IP（只以哈希形式保存）
+
+        Returns:
+            0 表示放行，否则为需要等待的秒数
+        """
+        if not self.enabled:
+            return 0.0
+        return self.policies[policy].acquire(hash_ip(client_ip))
+
+    def get_stats(self) -> dict:
+        """
+        获取限流统计
+
+        Returns:
+            每条策略的放行数、拒绝数和当前跟踪的客户端数
+        """
+        return {
+            name: {
+                "allowed": policy.allowed,
+                "limited": policy.limited,
+                "clients": len(policy),
+            }
+            for name, policy in self.policies.items()
+        }
+
+def rate_limit(policy: str):
+    """
+    创建限流依赖，用法：@router.post(..., dependencies=[Depends(rate_limit("letter_create"))])
+
+    Args:
+        policy: config.RATE_LIMIT_POLICIES 中的策略名
+
+    Raises:
+        HTTPException: 超出配额时返回 429，Retry-After 为需要等待的整秒数
+    """
+    if policy not in rate_limiter.policies:
+        raise ValueError(f"未知的限流策略: {policy}")
+
+    async def dependency(request: Request):
+        client_ip = request.client.host if request.client else "unknown"
+        wait = rate_limiter.check(policy, client_ip)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="请求过于频繁，请稍后再试",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+    return dependency
+
+# 全局限流实例
+rate_limiter = RateLimiter()
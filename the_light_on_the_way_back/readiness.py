@@ -0,0 +1,198 @@
+"""
+就绪检查模块
+在有界的时间内检查数据库、连接池、事件循环、定时任务和队列，判断本worker能否继续接收流量
+"""
+import asyncio
+import time
+from typing import Optional
+
+from .config import (
+    READY_DB_TIMEOUT_MS,
+    READY_DB_DEGRADED_MS,
+    READY_LOOP_LAG_DEGRADED_MS,
+    READY_LOOP_LAG_UNREADY_MS,
+    READY_QUEUE_DEGRADED_RATIO,
+)
+from .database import get_engine
+from .profiling import profiler
+from .scheduler import scheduler
+from .sealing import sealing_queue
+from .storage import image_store
+
+READY = "ready"
+DEGRADED = "degraded"
+UNREADY = "unready"
+_SEVERITY = {READY: 0, DEGRADED: 1, UNREADY: 2}
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _result(status: str, reasons: list, **details) -> dict:
+    return {"status": status, "reasons": reasons, **details}
+
+
+class ReadinessChecker:
+    """
+    就绪检查
+
+    每项检查给出 ready / degraded / unready，整体状态取最严重的一项。
+    只有数据库探测需要等待，受 db_timeout 限制，整个检查的耗时因此有上限；
+    其余各项只读取进程内的状态。
+
+    - 数据库：获取连接并执行 SELECT 1；SQLite 还会短暂获取写锁（BEGIN IMMEDIATE 后立即回滚），
+      其他连接长时间持有写锁时这一步会等待直到超时
+    - 连接池：已借出的连接数和溢出连接数，基础连接用完时为降级
+    - 事件循环：让出一次事件循环后重新被调度的延迟；启用性能诊断时同时参考心跳测得的延迟
+    - 定时任务：调度器是否运行，以及每个任务最近一次成功的时间、是否连续失败或落后
+    - 队列：封存队列深度和缩略图进程池中排队的任务
+    """
+
+    def __init__(
+        self,
+        db_timeout_ms: int = READY_DB_TIMEOUT_MS,
+        db_degraded_ms: int = READY_DB_DEGRADED_MS,
+        loop_lag_degraded_ms: int = READY_LOOP_LAG_DEGRADED_MS,
+        loop_lag_unready_ms: int = READY_LOOP_LAG_UNREADY_MS,
+        queue_degraded_ratio: float = READY_QUEUE_DEGRADED_RATIO
+    ):
+        self.db_timeout = db_timeout_ms / 1000
+        self.db_degraded = db_degraded_ms / 1000
+        self.loop_lag_degraded = loop_lag_degraded_ms / 1000
+        self.loop_lag_unready = loop_lag_unready_ms / 1000
+        self.queue_degraded_ratio = queue_degraded_ratio
+        self._db_probe: Optional[asyncio.Task] = None
+
+    async def check(self) -> dict:
+        """
+        执行全部检查
+
+        Returns:
+            整体状态、耗时和各项检查的结果
+        """
+        started = time.perf_counter()
+        checks = {
+            "event_loop": await self.check_event_loop(),
+            # 在数据库探测借出连接之前读取连接池
+            "connection_pool": self.check_pool(),
+            "database": await self.check_database(),
+            "scheduler": self.check_scheduler(),
+            "queues": self.check_queues(),
+        }
+        status = max((check["status"] for check in checks.values()), key=_SEVERITY.__getitem__)
+        return {
+            "status": status,
+            "duration_ms": _ms(time.perf_counter() - started),
+            "checks": checks,
+        }
+
+    async def check_event_loop(self) -> dict:
+        started = time.perf_counter()
+        await asyncio.sleep(0)
+        lag = time.perf_counter() - started
+        details = {"lag_ms": _ms(lag)}
+        if profiler.enabled:
+            monitored = profiler.monitor.last_lag
+            details["monitored_lag_ms"] = _ms(monitored)
+            lag = max(lag, monitored)
+
+        if lag >= self.loop_lag_unready:
+            return _result(UNREADY, [f"事件循环延迟 {_ms(lag)} ms"], **details)
+        if lag >= self.loop_lag_degraded:
+            return _result(DEGRADED, [f"事件循环延迟 {_ms(lag)} ms"], **details)
+        return _result(READY, [], **details)
+
+    async def check_database(self) -> dict:
+        if self._db_probe is not None and not self._db_probe.done():
+            return _result(UNREADY, ["上一次数据库探测仍未完成"])
+
+        # 探测在单独的任务中进行，超时后不取消：取消要等驱动线程中的语句返回，
+        # 被锁住的 SQLite 连接会一直等到 busy_timeout，检查的耗时就不再有上限
+        details = {}
+        probe = self._db_probe = asyncio.ensure_future(self._probe_database(details))
+        probe.add_done_callback(lambda task: task.cancelled() or task.exception())
+        done, _ = await asyncio.wait({probe}, timeout=self.db_timeout)
+        if not done:
+            return _result(UNREADY, [f"数据库探测超过 {_ms(self.db_timeout)} ms"], **details)
+        error = probe.exception()
+        if error is not None:
+            return _result(UNREADY, [f"数据库探测失败: {type(error).__name__}: {error}"], **details)
+
+        slow = [
+            f"{name} {value} ms" for name, value in details.items()
+            if value >= self.db_degraded * 1000
+        ]
+        return _result(DEGRADED if slow else READY, slow, **details)
+
+    async def _probe_database(self, details: dict):
+        engine = get_engine()
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            acquired = time.perf_counter()
+            details["acquire_ms"] = _ms(acquired - started)
+            await conn.exec_driver_sql("SELECT 1")
+            queried = time.perf_counter()
+            details["round_trip_ms"] = _ms(queried - acquired)
+            if engine.dialect.name == "sqlite":
+                await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                await conn.exec_driver_sql("ROLLBACK")
+                details["write_lock_ms"] = _ms(time.perf_counter() - queried)
+
+    def check_pool(self) -> dict:
+        pool = get_engine().pool
+        if not hasattr(pool, "checkedout"):
+            # 不排队的连接池（如内存数据库使用的 StaticPool）
+            return _result(READY, [], pool=type(pool).__name__)
+
+        size = pool.size()
+        checked_out = pool.checkedout()
+        overflow = max(0, pool.overflow())
+        details = {
+            "pool": type(pool).__name__,
+            "size": size,
+            "checked_out": checked_out,
+            "overflow": overflow,
+            "max_overflow": pool._max_overflow,
+        }
+        if overflow > 0:
+            return _result(DEGRADED, [f"基础连接已用完，使用 {overflow} 个溢出连接"], **details)
+        return _result(READY, [], **details)
+
+    def check_scheduler(self) -> dict:
+        summary = scheduler.health_summary()
+        jobs = {
+            job_id: {
+                "last_success_at": stats.last_success_at.isoformat() if stats.last_success_at else None,
+                "consecutive_failures": stats.consecutive_failures,
+            }
+            for job_id, stats in scheduler.stats.items()
+        }
+        reasons = []
+        if not summary["running"] and not summary["standby"]:
+            reasons.append("调度器未运行")
+        if summary["failing_jobs"]:
+            reasons.append(f"连续失败的任务: {', '.join(summary['failing_jobs'])}")
+        if summary["lagging_jobs"]:
+            reasons.append(f"落后的任务: {', '.join(summary['lagging_jobs'])}")
+        return _result(DEGRADED if reasons else READY, reasons, running=summary["running"], standby=summary["standby"], jobs=jobs)
+
+    def check_queues(self) -> dict:
+        sealing = sealing_queue.get_stats()
+        images = image_store.get_stats()
+        details = {
+            "sealing_depth": sealing["depth"],
+            "sealing_max_size": sealing["max_size"],
+            "image_in_flight": images["in_flight"],
+            "image_workers": images["workers"],
+        }
+        reasons = []
+        if sealing["enabled"] and sealing["depth"] >= sealing["max_size"] * self.queue_degraded_ratio:
+            reasons.append(f"封存队列积压 {sealing['depth']}/{sealing['max_size']}")
+        if images["workers"] and images["in_flight"] > images["workers"]:
+            reasons.append(f"缩略图进程池排队 {images['in_flight'] - images['workers']} 个任务")
+        return _result(DEGRADED if reasons else READY, reasons, **details)
+
+
+# 全局就绪检查实例
+readiness = ReadinessChecker()
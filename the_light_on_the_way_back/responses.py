@@ -0,0 +1,71 @@
+"""
+快速JSON响应
+安装了 orjson 时使用 orjson 编码，否则回退到标准库 json；
+datetime 统一输出为UTC纪元秒（整数），类型行对象按字段输出
+"""
+import json
+from datetime import datetime
+from operator import attrgetter
+from typing import Any
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from .config import UPLOADS_DIR, UPLOAD_CACHE_MAX_AGE
+from .timeutils import to_epoch
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+# 类型行对象的字段名和批量取值函数，按类缓存
+_row_getters = {}
+
+def _default(obj: Any):
+    """编码器无法直接处理的类型"""
+    if isinstance(obj, datetime):
+        return to_epoch(obj)
+    cls = type(obj)
+    getter = _row_getters.get(cls)
+    if getter is None:
+        slots = getattr(cls, "__slots__", None)
+        if not slots:
+            raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+        getter = _row_getters[cls] = (tuple(slots), attrgetter(*slots))
+    names, get = getter
+    values = get(obj)
+    return dict(zip(names, values if len(names) > 1 else (values,)))
+
+def dumps(content: Any) -> bytes:
+    """
+    将内容编码为JSON字节串
+
+    Args:
+        content: 要编码的内容
+
+    Returns:
+        UTF-8编码的JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """使用快速编码器的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class CachedStaticFiles(StaticFiles):
+    """静态文件：按内容寻址的上传图片附带长期缓存头"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if str(full_path).startswith(str(UPLOADS_DIR)):
+            response.headers["Cache-Control"] = f"public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable"
+        return response
@@ -1,17 +1,26 @@
 """
 假象回廊路由
 """
+import asyncio
 from typing import Optional
 from fastapi import APIRouter, Request, Depends, Form, HTTPException, Query, Cookie
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..database import get_db
+from ..database import get_db, AsyncSessionLocal
 from ..services import facade_service
-from ..config import TEMPLATES_DIR
+from ..config import IMAGE_UPLOADS_ENABLED
+from ..storage import image_store, receive_image_upload, UploadTooLarge
+from ..search import search_index
+from ..templating import get_templates, stream_template
+from ..responses import FastJSONResponse
+from ..ratelimit import rate_limit
 
 router = APIRouter(prefix="/facade-gallery", tags=["facade-gallery"])
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+
+async def _load_gallery_contents(limit: int = 20):
+    """在独立的会话中查询回廊内容（流式响应发送期间，请求依赖的会话已经关闭）"""
+    async with AsyncSessionLocal() as db:
+        return await facade_service.get_gallery_contents(db, limit=limit)
 
 @router.get("/")
 async def facade_gallery_page(
@@ -19,32 +28,36 @@ async def facade_gallery_page(
     identity_token: Optional[str] = Cookie(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """假象回廊页面"""
-    # 验证身份令牌
-    identity = None
-    time_remaining = None
-    
-    if identity_token:
-        identity = await facade_service.get_identity(db, identity_token)
-        if identity and identity.is_valid():
-            time_remaining = facade_service._calculate_time_remaining(identity.expires_at)
-        else:
-            identity_token = None
-    
-    # 获取回廊内容
-    contents = await facade_service.get_gallery_contents(db, limit=20)
-    
-    return templates.TemplateResponse(
-        "facade_gallery.html",
-        {
-            "request": request,
-            "identity_token": identity_token,
-            "time_remaining": time_remaining,
-            "contents": contents
-        }
-    )
-
-@router.post("/create-identity")
+    """假象回廊页面（流式渲染）"""
+    # 先开始查询回廊内容，与身份验证和页面外壳的发送同时进行
+    contents = asyncio.ensure_future(_load_gallery_contents(limit=20))
+    try:
+        # 验证身份令牌
+        identity = None
+        time_remaining = None
+
+        if identity_token:
+            identity = await facade_service.get_identity(db, identity_token)
+            if identity and identity.is_valid():
+                time_remaining = facade_service._calculate_time_remaining(identity.expires_at)
+            else:
+                identity_token = None
+
+        return await stream_template(
+            "facade_gallery.html",
+            {
+                "request": request,
+                "identity_token": identity_token,
+                "time_remaining": time_remaining,
+                "contents": contents
+            }
+        )
+    except BaseException:
+        # 身份查询或模板准备出错（或请求被取消）时，不留下无人等待的查询任务
+        contents.cancel()
+        raise
+
+@router.post("/create-identity", dependencies=[Depends(rate_limit("identity_create"))])
 async def create_identity(
     request: Request,
     db: AsyncSession = Depends(get_db)
@@ -72,7 +85,7 @@ async def create_identity(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建身份失败: {str(e)}")
 
-@router.post("/create-content")
+@router.post("/create-content", dependencies=[Depends(rate_limit("content_create"))])
 async def create_content(
     request: Request,
     identity_token: str = Form(...),
@@ -96,7 +109,7 @@ async def create_content(
         identity = await facade_service.get_identity(db, identity_token)
         time_remaining = facade_service._calculate_time_remaining(identity.expires_at) if identity else None
         
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "facade_gallery.html",
             {
                 "request": request,
@@ -107,6 +120,66 @@ async def create_content(
             }
         )
 
+@router.post("/upload-image", dependencies=[Depends(rate_limit("image_upload"))])
+async def upload_image(
+    request: Request,
+    identity_token: Optional[str] = Cookie(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建带图片的假象回廊内容（流式接收上传）"""
+    if not IMAGE_UPLOADS_ENABLED:
+        raise HTTPException(status_code=404, detail="图片上传未启用")
+
+    # 有Cookie时先验证身份，避免为无效身份接收整个文件
+    if identity_token and not await facade_service.get_identity(db, identity_token):
+        raise HTTPException(status_code=401, detail="身份无效或已过期")
+
+    try:
+        fields, pending = await receive_image_upload(request, image_store)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    identity_token = fields.get("identity_token") or identity_token
+    content_text = fields.get("content_text") or None
+
+    image_path = None
+    created = False
+    try:
+        if pending is not None and pending.size > 0:
+            image_path, created = await image_store.commit(pending)
+        elif pending is not None:
+            pending.discard()
+
+        await facade_service.create_content(
+            db=db,
+            identity_token=identity_token or "",
+            content_text=content_text,
+            image_path=image_path
+        )
+        return RedirectResponse(url="/facade-gallery", status_code=302)
+
+    except ValueError as e:
+        # 新写入的图片没有被任何内容引用，随即删除
+        if created:
+            image_store.delete(image_path)
+        contents = await facade_service.get_gallery_contents(db, limit=20)
+        identity = await facade_service.get_identity(db, identity_token) if identity_token else None
+        time_remaining = facade_service._calculate_time_remaining(identity.expires_at) if identity else None
+
+        return get_templates().TemplateResponse(
+            "facade_gallery.html",
+            {
+                "request": request,
+                "identity_token": identity_token,
+                "time_remaining": time_remaining,
+                "contents": contents,
+                "error_message": str(e)
+            },
+            status_code=400
+        )
+
 @router.post("/applaud/{content_id}")
 async def applaud_content(
     content_id: int,
@@ -123,12 +196,11 @@ async def applaud_content(
         
         if success:
             # 获取更新后的鼓掌数
-            contents = await facade_service.get_gallery_contents(db, limit=1000)
-            content = next((c for c in contents if c['id'] == content_id), None)
+            applause_count = await facade_service.get_applause_count(db, content_id)
             
-            return JSONResponse(content={
+            return FastJSONResponse(content={
                 "success": True,
-                "applause_count": content['applause_count'] if content else 0
+                "applause_count": applause_count
             })
         else:
             raise HTTPException(status_code=400, detail="你已经为这个内容鼓掌过了")
@@ -144,4 +216,31 @@ async def get_contents(
 ):
     """获取回廊内容（API）"""
     contents = await facade_service.get_gallery_contents(db, limit=limit, offset=offset)
-    return JSONResponse(content={"contents": contents})
+    return FastJSONResponse(content={"contents": contents})
+
+@router.get("/search")
+async def search_contents(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """全文搜索回廊内容（API）"""
+    if not search_index.available:
+        raise HTTPException(status_code=503, detail="全文搜索不可用")
+    try:
+        contents, next_cursor = await facade_service.search_contents(
+            db, q, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(content={"contents": contents, "next_cursor": next_cursor})
+
+@router.get("/trending")
+async def get_trending(
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取近期热度最高的回廊内容（API）"""
+    contents = await facade_service.get_trending_contents(db, limit=limit)
+    return FastJSONResponse(content={"contents": contents})
@@ -0,0 +1,96 @@
+"""
+运维诊断路由
+"""
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db
+from ..profiling import profiler
+from ..tracing import tracer
+from ..scheduler import scheduler
+from ..services.singleflight import singleflight
+from ..services.letter_cache import opened_letter_cache
+from ..services.card_cache import gallery_card_cache
+from ..services.applause_filter import applause_filters
+from ..services.stats import stats_service
+from ..sealing import sealing_queue
+from ..ratelimit import rate_limiter
+from ..dedup import near_duplicate_index
+from ..readiness import readiness, UNREADY
+from ..responses import FastJSONResponse
+
+router = APIRouter(tags=["ops"])
+
+def debug_access(component, feature: str):
+    """
+    调试接口的访问控制依赖
+
+    请求须携带 X-Debug-Token 请求头，值为组件的调试令牌（PROFILING_DEBUG_TOKEN / TRACING_DEBUG_TOKEN）。
+
+    Args:
+        component: 带 enabled 和 debug_token 属性的诊断组件
+        feature: 功能名，用于错误信息
+
+    Returns:
+        FastAPI 依赖
+
+    Raises:
+        HTTPException: 未启用或未配置令牌时返回 404，令牌不符时返回 403
+    """
+    async def dependency(x_debug_token: Optional[str] = Header(None)):
+        if not component.enabled or not component.debug_token:
+            raise HTTPException(status_code=404, detail=f"{feature}未启用")
+        if x_debug_token is None or not hmac.compare_digest(x_debug_token.encode(), component.debug_token):
+            raise HTTPException(status_code=403, detail="调试令牌无效")
+    return dependency
+
+@router.get("/metrics")
+async def metrics():
+    """运行指标：定时任务耗时、处理行数、失败和最近成功时间，并发请求合并次数、信笺和回廊卡片缓存命中率、鼓掌过滤器跳过的查询次数、封存队列状态、限流次数和近似重复拒绝次数"""
+    return {
+        "scheduler": scheduler.get_stats(),
+        "singleflight": singleflight.get_stats(),
+        "letter_cache": opened_letter_cache.get_stats(),
+        "card_cache": gallery_card_cache.get_stats(),
+        "applause_filter": applause_filters.get_stats(),
+        "sealing": sealing_queue.get_stats(),
+        "rate_limit": rate_limiter.get_stats(),
+        "dedup": near_duplicate_index.get_stats(),
+    }
+
+@router.get("/ready")
+async def ready():
+    """
+    就绪检查：数据库往返和写锁、连接池、事件循环延迟、定时任务和队列深度
+
+    未就绪时返回 503，负载均衡应停止向本worker转发；降级时仍返回 200，由 status 字段标明
+    """
+    result = await readiness.check()
+    return FastJSONResponse(
+        content=result,
+        status_code=503 if result["status"] == UNREADY else 200,
+        headers={"Cache-Control": "no-store"}
+    )
+
+@router.get("/stats")
+async def stats(db: AsyncSession = Depends(get_db)):
+    """运营统计：活跃假象身份、有效内容、鼓掌总数，以及封存中、可开启、已开启和已销毁的信笺数"""
+    return await stats_service.get_stats(db)
+
+@router.get("/debug/profile", dependencies=[Depends(debug_access(profiler, "性能诊断"))])
+async def profile_snapshot(top: int = Query(30, ge=1, le=200)):
+    """性能诊断快照：事件循环阻塞记录和热点帧"""
+    return profiler.snapshot(top=top)
+
+@router.get("/debug/traces", dependencies=[Depends(debug_access(tracer, "请求追踪"))])
+async def recent_traces(
+    limit: int = Query(20, ge=1, le=200),
+    min_ms: float = Query(0, ge=0),
+    name: Optional[str] = Query(None)
+):
+    """最近的请求追踪：每个请求在服务方法、数据库语句、加解密和模板渲染上的耗时，从新到旧"""
+    return {
+        **tracer.get_stats(),
+        "traces": tracer.recent(limit=limit, min_duration_ms=min_ms, name=name),
+    }
@@ -4,34 +4,42 @@
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
+from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..database import get_db
+from ..database import get_db, AsyncSessionLocal
 from ..services import time_capsule_service
-from ..config import TEMPLATES_DIR
+from ..config import SEALING_RETRY_AFTER_SECONDS
+from ..sealing import sealing_queue, SealingQueueFull
+from ..encryption import hash_ip
+from ..templating import get_templates, stream_template
+from ..responses import FastJSONResponse
+from ..ratelimit import rate_limit
 
 router = APIRouter(prefix="/time-capsule", tags=["time-capsule"])
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+
+async def _load_openable_letters():
+    """在独立的会话中查询可开启的信笺（供流式渲染的页面使用）"""
+    async with AsyncSessionLocal() as db:
+        return await time_capsule_service.get_openable_letters(db)
+
+def _wants_html(request: Request) -> bool:
+    """页面表单提交（浏览器的 Accept 包含 text/html）时返回页面，其他客户端返回JSON"""
+    return "text/html" in request.headers.get("accept", "")
 
 @router.get("/")
-async def time_capsule_page(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
-    """时光信笺页面"""
-    # 获取可开启的信笺
-    openable_letters = await time_capsule_service.get_openable_letters(db)
-    
-    return templates.TemplateResponse(
-        "time_capsule.html",
-        {
-            "request": request,
-            "openable_letters": openable_letters
-        }
-    )
+async def time_capsule_page(request: Request, receipt: Optional[str] = None):
+    """时光信笺页面（流式渲染，可开启的信笺在页面外壳发送的同时查询）"""
+    context = {
+        "request": request,
+        "openable_letters": _load_openable_letters()
+    }
+    if receipt:
+        # 异步封存的表单提交重定向到这里，页面显示回执状态并轮询直到封存完成
+        context["receipt"] = receipt
+        context["receipt_status"] = await sealing_queue.get_receipt(receipt)
+    return await stream_template("time_capsule.html", context)
 
-@router.post("/create")
+@router.post("/create", dependencies=[Depends(rate_limit("letter_create"))])
 async def create_letter(
     request: Request,
     title: Optional[str] = Form(None),
@@ -58,6 +66,29 @@ async def create_letter(
             # 寄往虚空的信笺，设置一个默认的未来时间（不会被使用）
             open_datetime = datetime.utcnow()
         
+        if send_to_void:
+            message = "信笺已寄往虚空，愿你的心绪得到释放"
+        else:
+            message = f"信笺已封存，将在 {open_datetime.strftime('%Y年%m月%d日 %H:%M')} 开启"
+
+        if sealing_queue.enabled:
+            # 异步封存：校验后入队，立即返回回执（不查询数据库、不渲染页面）
+            open_at = time_capsule_service.validate_letter(content, open_datetime, send_to_void)
+            receipt = await sealing_queue.submit(
+                content=content,
+                title=title,
+                open_at=open_at,
+                send_to_void=send_to_void,
+                creator_ip_hash=hash_ip(client_ip)
+            )
+            if _wants_html(request):
+                return RedirectResponse(url=f"/time-capsule/?receipt={receipt}", status_code=303)
+            return FastJSONResponse(
+                content={"receipt": receipt, "status": "queued", "message": message},
+                status_code=202,
+                headers={"Location": f"/time-capsule/receipts/{receipt}"}
+            )
+
         # 创建信笺
         letter = await time_capsule_service.create_letter(
             db=db,
@@ -68,12 +99,7 @@ async def create_letter(
             creator_ip=client_ip
         )
         
-        if send_to_void:
-            message = "信笺已寄往虚空，愿你的心绪得到释放"
-        else:
-            message = f"信笺已封存，将在 {open_datetime.strftime('%Y年%m月%d日 %H:%M')} 开启"
-        
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "time_capsule.html",
             {
                 "request": request,
@@ -82,8 +108,22 @@ async def create_letter(
             }
         )
         
+    except SealingQueueFull as e:
+        headers = {"Retry-After": str(SEALING_RETRY_AFTER_SECONDS)}
+        if _wants_html(request):
+            return get_templates().TemplateResponse(
+                "time_capsule.html",
+                {
+                    "request": request,
+                    "error_message": str(e),
+                    "openable_letters": await time_capsule_service.get_openable_letters(db)
+                },
+                status_code=503,
+                headers=headers
+            )
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except ValueError as e:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "time_capsule.html",
             {
                 "request": request,
@@ -100,6 +140,14 @@ async def open_letter(
     """开启时光信笺"""
     try:
         letter_data = await time_capsule_service.open_letter(db, letter_id)
-        return JSONResponse(content=letter_data)
+        return FastJSONResponse(content=letter_data)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/receipts/{receipt}")
+async def get_receipt(receipt: str):
+    """查询异步封存回执的状态（API）"""
+    status = await sealing_queue.get_receipt(receipt)
+    if status is None:
+        raise HTTPException(status_code=404, detail="回执不存在或已过期")
+    return FastJSONResponse(content={"receipt": receipt, **status})
@@ -3,96 +3,431 @@
 """
 import asyncio
 import logging
+import os
+import time
 from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.ext.asyncio import AsyncSession
 
+try:
+    import fcntl
+except ImportError:  # Windows：只支持单进程
+    fcntl = None
+
 from .database import AsyncSessionLocal
-from .services import time_capsule_service, facade_service
+from .services import time_capsule_service, facade_service, stats_service
+from .config import (
+    SCHEDULER_MAX_INSTANCES,
+    SCHEDULER_COALESCE,
+    SCHEDULER_MISFIRE_GRACE_SECONDS,
+    SCHEDULER_JITTER_SECONDS,
+    SCHEDULER_LOCK_PATH,
+    SCHEDULER_STANDBY_RETRY_SECONDS,
+    CLEANUP_IDENTITIES_INTERVAL_SECONDS,
+    CLEANUP_VOID_LETTERS_INTERVAL_SECONDS,
+    CHECK_OPENABLE_LETTERS_INTERVAL_SECONDS,
+    TIER_LETTERS_INTERVAL_SECONDS,
+    REWRAP_LETTERS_INTERVAL_SECONDS,
+    RECONCILE_STATS_INTERVAL_SECONDS,
+    CLEANUP_RECEIPTS_INTERVAL_SECONDS,
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class JobStats:
+    """单个定时任务的运行统计"""
+
+    def __init__(self, job_id: str, name: str, interval_seconds: int):
+        self.job_id = job_id
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.missed = 0
+        self.skipped = 0
+        self.running = 0
+        self.last_started_at = None
+        self.last_success_at = None
+        self.last_failure_at = None
+        self.last_error = None
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_rows = 0
+        self.total_rows = 0
+
+    def record_success(self, duration: float, rows: int):
+        """记录一次成功运行"""
+        self.runs += 1
+        self.consecutive_failures = 0
+        self.last_success_at = datetime.utcnow()
+        self._record_duration(duration)
+        self.last_rows = rows
+        self.total_rows += rows
+
+    def record_failure(self, duration: float, error: Exception):
+        """记录一次失败运行"""
+        self.runs += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure_at = datetime.utcnow()
+        self.last_error = f"{type(error).__name__}: {error}"
+        self._record_duration(duration)
+
+    def _record_duration(self, duration: float):
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+
+    def is_lagging(self, since: datetime) -> bool:
+        """
+        判断任务是否落后
+
+        超过两个周期没有成功运行，或单次耗时超过半个周期，都说明维护任务
+        跟不上数据增长。
+
+        Args:
+            since: 调度器启动时间，用于判断尚未成功运行过的任务
+        """
+        reference = self.last_success_at or since
+        overdue = (datetime.utcnow() - reference).total_seconds() > 2 * self.interval_seconds
+        return overdue or self.last_duration > self.interval_seconds / 2
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "missed": self.missed,
+            "skipped": self.skipped,
+            "running": self.running,
+            "last_started_at": _isoformat(self.last_started_at),
+            "last_success_at": _isoformat(self.last_success_at),
+            "last_failure_at": _isoformat(self.last_failure_at),
+            "last_error": self.last_error,
+            "last_duration_ms": round(self.last_duration * 1000, 2),
+            "max_duration_ms": round(self.max_duration * 1000, 2),
+            "avg_duration_ms": round(self.total_duration / self.runs * 1000, 2) if self.runs else 0.0,
+            "last_rows": self.last_rows,
+            "total_rows": self.total_rows,
+        }
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
 class TaskScheduler:
-    """定时任务调度器"""
-    
-    def __init__(self):
-        self.scheduler = AsyncIOScheduler()
+    """
+    定时任务调度器
+
+    创建实例时只登记任务和统计；APScheduler 在 start() 时才导入并创建，不计入应用的导入时间。
+
+    多个worker各自创建实例，配置了锁文件时只有取得文件锁的一个进程运行任务，
+    其余进程处于待命状态，每隔 standby_retry_seconds 重试取得锁。
+    锁随进程退出释放，持锁的worker崩溃后由某个待命的worker接替，不需要重启。
+    """
+
+    def __init__(
+        self,
+        lock_path: str = SCHEDULER_LOCK_PATH,
+        standby_retry_seconds: float = SCHEDULER_STANDBY_RETRY_SECONDS
+    ):
+        self.scheduler = None
+        self.stats = {}
+        self.started_at = None
+        self.lock_path = lock_path if fcntl is not None else ""
+        self.standby = False
+        self.standby_retry_seconds = standby_retry_seconds
+        self._lock_fd = None
+        self._standby_task = None
+        self._jobs = []
         self._setup_jobs()
-    
+
+    @property
+    def running(self) -> bool:
+        return self.scheduler is not None and self.scheduler.running
+
+    def _create_scheduler(self):
+        """创建 APScheduler 调度器并注册登记的任务"""
+        from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        scheduler = AsyncIOScheduler(
+            job_defaults={
+                "max_instances": SCHEDULER_MAX_INSTANCES,
+                "coalesce": SCHEDULER_COALESCE,
+                "misfire_grace_time": SCHEDULER_MISFIRE_GRACE_SECONDS,
+            }
+        )
+        scheduler.add_listener(
+            self._on_job_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+        )
+        for func, job_id, name, interval_seconds in self._jobs:
+            scheduler.add_job(
+                self._run_job,
+                trigger=IntervalTrigger(
+                    seconds=interval_seconds,
+                    jitter=SCHEDULER_JITTER_SECONDS or None
+                ),
+                args=[job_id, func],
+                id=job_id,
+                name=name,
+                replace_existing=True
+            )
+        return scheduler
+
     def _setup_jobs(self):
         """设置定时任务"""
         # 每小时清理过期的假象身份
-        self.scheduler.add_job(
+        self._add_job(
             self.cleanup_expired_identities,
-            trigger=IntervalTrigger(hours=1),
-            id="cleanup_expired_identities",
+            job_id="cleanup_expired_identities",
             name="清理过期假象身份",
-            replace_existing=True
+            interval_seconds=CLEANUP_IDENTITIES_INTERVAL_SECONDS
         )
-        
+
         # 每天清理寄往虚空的信笺
-        self.scheduler.add_job(
+        self._add_job(
             self.cleanup_void_letters,
-            trigger=IntervalTrigger(hours=24),
-            id="cleanup_void_letters",
+            job_id="cleanup_void_letters",
             name="清理虚空信笺",
-            replace_existing=True
+            interval_seconds=CLEANUP_VOID_LETTERS_INTERVAL_SECONDS
         )
-        
+
         # 每分钟检查可开启的信笺（用于通知等功能）
-        self.scheduler.add_job(
+        self._add_job(
             self.check_openable_letters,
-            trigger=IntervalTrigger(minutes=1),
-            id="check_openable_letters",
+            job_id="check_openable_letters",
             name="检查可开启信笺",
-            replace_existing=True
+            interval_seconds=CHECK_OPENABLE_LETTERS_INTERVAL_SECONDS
         )
-    
-    async def cleanup_expired_identities(self):
-        """清理过期的假象身份"""
+
+        # 每小时在主库和冷存储之间移动信笺
+        self._add_job(
+            self.tier_letters,
+            job_id="tier_letters",
+            name="信笺冷热分层",
+            interval_seconds=TIER_LETTERS_INTERVAL_SECONDS
+        )
+
+        # 分批将信笺迁移到当前的密钥派生参数
+        self._add_job(
+            self.rewrap_letters,
+            job_id="rewrap_letters",
+            name="重新封装信笺",
+            interval_seconds=REWRAP_LETTERS_INTERVAL_SECONDS
+        )
+
+        # 每小时校准统计计数
+        self._add_job(
+            self.reconcile_stats,
+            job_id="reconcile_stats",
+            name="校准统计计数",
+            interval_seconds=RECONCILE_STATS_INTERVAL_SECONDS
+        )
+
+        # 每小时清理过期的封存回执
+        self._add_job(
+            self.cleanup_receipts,
+            job_id="cleanup_receipts",
+            name="清理封存回执",
+            interval_seconds=CLEANUP_RECEIPTS_INTERVAL_SECONDS
+        )
+
+    def _add_job(self, func, job_id: str, name: str, interval_seconds: int):
+        """登记一个带统计的周期任务"""
+        self.stats[job_id] = JobStats(job_id, name, interval_seconds)
+        self._jobs.append((func, job_id, name, interval_seconds))
+
+    async def _run_job(self, job_id: str, func):
+        """
+        执行任务并记录耗时、处理行数和失败情况
+
+        Args:
+            job_id: 任务ID
+            func: 返回处理行数的协程函数
+        """
+        stats = self.stats[job_id]
+        stats.running += 1
+        stats.last_started_at = datetime.utcnow()
+        started = time.perf_counter()
         try:
-            async with AsyncSessionLocal() as db:
-                count = await facade_service.cleanup_expired_identities(db)
-                if count > 0:
-                    logger.info(f"清理了 {count} 个过期的假象身份")
+            rows = await func()
         except Exception as e:
-            logger.error(f"清理过期假象身份时出错: {e}")
-    
-    async def cleanup_void_letters(self):
+            stats.record_failure(time.perf_counter() - started, e)
+            logger.exception(f"{stats.name}时出错: {e}")
+        else:
+            stats.record_success(time.perf_counter() - started, rows or 0)
+        finally:
+            stats.running -= 1
+
+    def _on_job_event(self, event):
+        """记录错过触发和因并行上限被跳过的运行"""
+        from apscheduler.events import EVENT_JOB_MISSED
+
+        stats = self.stats.get(event.job_id)
+        if stats is None:
+            return
+        if event.code == EVENT_JOB_MISSED:
+            stats.missed += 1
+            logger.warning(f"{stats.name}错过了计划运行时间")
+        else:
+            stats.skipped += 1
+            logger.warning(f"{stats.name}上一次运行尚未结束，本次运行被跳过")
+
+    async def cleanup_expired_identities(self) -> int:
+        """清理过期的假象身份"""
+        async with AsyncSessionLocal() as db:
+            count = await facade_service.cleanup_expired_identities(db)
+            if count > 0:
+                logger.info(f"清理了 {count} 个过期的假象身份")
+            return count
+
+    async def cleanup_void_letters(self) -> int:
         """清理寄往虚空的信笺"""
+        async with AsyncSessionLocal() as db:
+            count = await time_capsule_service.destroy_void_letters(db)
+            if count > 0:
+                logger.info(f"清理了 {count} 封虚空信笺")
+            return count
+
+    async def check_openable_letters(self) -> int:
+        """检查可开启的信笺，并刷新统计中的可开启数"""
+        async with AsyncSessionLocal() as db:
+            # 只计数不加载信笺；通知等需要逐封处理时改用 get_openable_letters
+            count = await stats_service.refresh_openable(db)
+            if count:
+                logger.info(f"发现 {count} 封可开启的信笺")
+            return count
+
+    async def tier_letters(self) -> int:
+        """信笺冷热分层"""
+        async with AsyncSessionLocal() as db:
+            count = await time_capsule_service.tier_letters(db)
+            if count > 0:
+                logger.info(f"在主库和冷存储之间移动了 {count} 封信笺")
+            return count
+
+    async def rewrap_letters(self) -> int:
+        """将信笺迁移到当前的密钥派生参数"""
+        async with AsyncSessionLocal() as db:
+            count = await time_capsule_service.rewrap_letters(db)
+            if count > 0:
+                logger.info(f"将 {count} 封信笺迁移到了当前的密钥派生参数")
+            return count
+
+    async def reconcile_stats(self) -> int:
+        """校准统计计数"""
+        async with AsyncSessionLocal() as db:
+            return await stats_service.reconcile(db)
+
+    async def cleanup_receipts(self) -> int:
+        """清理过期的封存回执"""
+        async with AsyncSessionLocal() as db:
+            count = await time_capsule_service.cleanup_receipts(db)
+            if count > 0:
+                logger.info(f"清理了 {count} 个过期的封存回执")
+            return count
+
+    def get_stats(self) -> dict:
+        """
+        获取所有任务的运行统计
+
+        Returns:
+            调度器状态和每个任务的统计信息
+        """
+        jobs = {}
+        for job_id, stats in self.stats.items():
+            job = self.scheduler.get_job(job_id) if self.scheduler else None
+            jobs[job_id] = stats.to_dict()
+            jobs[job_id]["next_run_at"] = _isoformat(job.next_run_time) if job else None
+            jobs[job_id]["lagging"] = self.started_at is not None and stats.is_lagging(self.started_at)
+        return {
+            "running": self.running,
+            "standby": self.standby,
+            "started_at": _isoformat(self.started_at),
+            "jobs": jobs,
+        }
+
+    def health_summary(self) -> dict:
+        """
+        获取用于健康检查的简要状态
+
+        Returns:
+            调度器是否运行、是否因其他worker运行而待命，以及连续失败或落后的任务
+        """
+        return {
+            "running": self.running,
+            "standby": self.standby,
+            "failing_jobs": [
+                job_id for job_id, stats in self.stats.items()
+                if stats.consecutive_failures > 0
+            ],
+            "lagging_jobs": [
+                job_id for job_id, stats in self.stats.items()
+                if self.started_at is not None and stats.is_lagging(self.started_at)
+            ],
+        }
+
+    def _acquire_lock(self) -> bool:
+        """尝试取得运行定时任务的文件锁（未配置锁文件时总是成功）"""
+        if not self.lock_path or self._lock_fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
         try:
-            async with AsyncSessionLocal() as db:
-                count = await time_capsule_service.destroy_void_letters(db)
-                if count > 0:
-                    logger.info(f"清理了 {count} 封虚空信笺")
-        except Exception as e:
-            logger.error(f"清理虚空信笺时出错: {e}")
-    
-    async def check_openable_letters(self):
-        """检查可开启的信笺"""
-        try:
-            async with AsyncSessionLocal() as db:
-                letters = await time_capsule_service.get_openable_letters(db)
-                if letters:
-                    logger.info(f"发现 {len(letters)} 封可开启的信笺")
-                    # 这里可以添加通知逻辑，比如发送邮件、推送等
-        except Exception as e:
-            logger.error(f"检查可开启信笺时出错: {e}")
-    
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _retry_lock(self):
+        """待命期间定期重试取得锁"""
+        while self.standby:
+            await asyncio.sleep(self.standby_retry_seconds)
+            self.start()
+
     def start(self):
-        """启动调度器"""
+        """启动调度器（其他进程持有锁时进入待命状态，在事件循环中调用时定期重试）"""
+        if not self._acquire_lock():
+            if not self.standby:
+                self.standby = True
+                logger.info(f"定时任务由另一个worker运行，本进程待命（PID {os.getpid()}）")
+                try:
+                    self._standby_task = asyncio.get_running_loop().create_task(self._retry_lock())
+                except RuntimeError:
+                    # 不在事件循环中调用：只能由下一次 start() 重试
+                    pass
+            return
+        if self.standby:
+            logger.info(f"持锁的worker已退出，本进程接替运行定时任务（PID {os.getpid()}）")
+        self.standby = False
+        if self.scheduler is None:
+            self.scheduler = self._create_scheduler()
         if not self.scheduler.running:
             self.scheduler.start()
+            self.started_at = datetime.utcnow()
             logger.info("定时任务调度器已启动")
-    
+
     def shutdown(self):
         """关闭调度器"""
-        if self.scheduler.running:
+        if self._standby_task is not None:
+            self._standby_task.cancel()
+            self._standby_task = None
+        self.standby = False
+        if self.running:
             self.scheduler.shutdown()
             logger.info("定时任务调度器已关闭")
+        self._release_lock()
 
 # 全局调度器实例
 scheduler = TaskScheduler()
@@ -0,0 +1,26 @@
+"""
+API响应行对象
+使用带 __slots__ 的轻量类型行，代替逐行构建的字典；时间字段为UTC纪元秒
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(slots=True)
+class GalleryItem:
+    """回廊内容行"""
+    id: int
+    content_text: Optional[str]
+    image_path: Optional[str]
+    created_at: int
+    applause_count: int
+    time_remaining: str
+    expires_at: int
+
+@dataclass(slots=True)
+class OpenedLetter:
+    """已开启的信笺"""
+    id: int
+    title: Optional[str]
+    content: str
+    created_at: int
+    opened_at: int
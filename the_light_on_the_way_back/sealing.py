@@ -0,0 +1,477 @@
+"""
+异步封存模块
+创建信笺的请求只做校验并入队，后台工作协程批量派生密钥、加密并写入数据库
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：只支持单进程
+    fcntl = None
+
+from .database import AsyncSessionLocal
+from .services import time_capsule_service
+from .config import (
+    ENCRYPTION_KEY,
+    ASYNC_SEALING_ENABLED,
+    SEALING_QUEUE_MAX_SIZE,
+    SEALING_WORKERS,
+    SEALING_BATCH_SIZE,
+    SEALING_JOURNAL_PATH,
+    SEALING_RECEIPTS_KEPT,
+    SEALING_RECEIPT_TTL_SECONDS,
+    SEALING_DRAIN_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+class SealingQueueFull(ValueError):
+    """封存队列已满"""
+
+class LetterDraft:
+    """等待封存的信笺"""
+    __slots__ = ("receipt", "title", "content", "open_at", "send_to_void", "creator_ip_hash", "submitted_at", "enqueued")
+
+    def __init__(
+        self,
+        receipt: str,
+        title: Optional[str],
+        content: str,
+        open_at: int,
+        send_to_void: bool,
+        creator_ip_hash: Optional[str],
+        submitted_at: float
+    ):
+        self.receipt = receipt
+        self.title = title
+        self.content = content
+        self.open_at = open_at
+        self.send_to_void = send_to_void
+        self.creator_ip_hash = creator_ip_hash
+        self.submitted_at = submitted_at
+        self.enqueued = time.monotonic()
+
+    def to_record(self) -> dict:
+        return {
+            "op": "submit",
+            "receipt": self.receipt,
+            "title": self.title,
+            "content": self.content,
+            "open_at": self.open_at,
+            "send_to_void": self.send_to_void,
+            "creator_ip_hash": self.creator_ip_hash,
+            "submitted_at": self.submitted_at,
+        }
+
+class SealingJournal:
+    """
+    封存日志
+
+    入队的明文以 Fernet 加密后逐行追加写入文件并 fsync，封存完成后追加完成记录。
+    启动时重放尚未完成的记录，然后压缩日志只保留这些记录。
+    追加写入会阻塞，由队列在线程池中调用，多个线程的写入由锁串行。
+
+    多个worker配置同一个路径时，每个进程独占一个日志文件（path、path.1、path.2……），
+    由旁边的 .lock 文件上的文件锁保证；启动时除了重放自己的文件，
+    还接管无人持锁的文件（已退出的worker留下的），把其中未完成的记录转入自己的日志。
+    """
+
+    def __init__(self, path: str, master_key: str = ENCRYPTION_KEY):
+        from cryptography.fernet import Fernet
+
+        self.path = path
+        self.file_path = None
+        key = hashlib.sha256(b"sealing-journal:" + master_key.encode()).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(key))
+        self._file = None
+        self._lock_fd = None
+        self._lock = threading.Lock()
+
+    def _encode(self, record: dict) -> bytes:
+        return self._fernet.encrypt(json.dumps(record, ensure_ascii=False).encode()) + b"\n"
+
+    def _append(self, record: dict):
+        line = self._encode(record)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _slot_path(self, index: int) -> str:
+        return self.path if index == 0 else f"{self.path}.{index}"
+
+    def _existing_slots(self) -> List[int]:
+        directory, name = os.path.split(self.path)
+        pattern = re.compile(re.escape(name) + r"(?:\.(\d+))?")
+        slots = []
+        for entry in os.listdir(directory or "."):
+            match = pattern.fullmatch(entry)
+            if match:
+                slots.append(int(match.group(1) or 0))
+        return sorted(slots)
+
+    def _try_lock(self, index: int) -> Optional[int]:
+        """尝试独占一个日志文件，其他进程持有时返回 None"""
+        fd = os.open(self._slot_path(index) + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+        return fd
+
+    def _read(self, path: str, pending: "OrderedDict[str, dict]"):
+        """读取一个日志文件，把未完成的入队记录合并到 pending 中"""
+        from cryptography.fernet import InvalidToken
+
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(self._fernet.decrypt(line.strip()))
+                except (InvalidToken, ValueError):
+                    # 崩溃时可能留下写了一半的最后一行
+                    logger.warning("跳过无法解密的封存日志记录")
+                    continue
+                if record["op"] == "submit":
+                    pending[record["receipt"]] = record
+                else:
+                    for receipt in record["receipts"]:
+                        pending.pop(receipt, None)
+
+    def open(self) -> List[dict]:
+        """
+        独占一个日志文件，读取未完成的记录（包括接管的文件中的）并压缩日志
+
+        Returns:
+            尚未封存的入队记录
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        index = 0
+        while (fd := self._try_lock(index)) is None:
+            index += 1
+        self._lock_fd = fd
+        self.file_path = self._slot_path(index)
+
+        pending = OrderedDict()
+        self._read(self.file_path, pending)
+        orphans = []
+        for other in self._existing_slots():
+            if other == index or (fd := self._try_lock(other)) is None:
+                continue
+            self._read(self._slot_path(other), pending)
+            orphans.append((other, fd))
+
+        tmp = self.file_path + ".tmp"
+        with open(tmp, "wb") as f:
+            for record in pending.values():
+                f.write(self._encode(record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.file_path)
+        # 记录已转入本进程的日志后才删除接管的文件（两步之间崩溃只会重复，不会丢失）
+        for other, fd in orphans:
+            if os.path.exists(self._slot_path(other)):
+                os.remove(self._slot_path(other))
+            os.close(fd)
+        if orphans:
+            logger.info(f"接管了 {len(orphans)} 个已退出进程的封存日志")
+        self._file = open(self.file_path, "ab")
+        return list(pending.values())
+
+    def submitted(self, draft: LetterDraft):
+        self._append(draft.to_record())
+
+    def completed(self, receipts: List[str]):
+        self._append({"op": "done", "receipts": receipts})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+class SealingQueue:
+    """
+    信笺封存队列
+
+    有界的内存队列 + 若干工作协程。每个工作协程一次取出最多 batch_size 封信笺，
+    在线程池中派生密钥并加密（不阻塞事件循环），再在同一个事务中写入数据库。
+
+    回执编号带有签发时间和签名。封存完成的回执与信笺在同一事务中写入数据库，
+    任何worker都能查询；数据库中没有、但签名有效且未过期的回执就是仍在某个worker的队列中。
+    封存失败只记录在受理的worker内存中（配置了封存日志时下次启动会重试）。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = ASYNC_SEALING_ENABLED,
+        max_size: int = SEALING_QUEUE_MAX_SIZE,
+        workers: int = SEALING_WORKERS,
+        batch_size: int = SEALING_BATCH_SIZE,
+        journal_path: str = SEALING_JOURNAL_PATH
+    ):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.journal = SealingJournal(journal_path) if journal_path else None
+        self._receipt_key = hashlib.sha256(b"sealing-receipt:" + ENCRYPTION_KEY.encode()).digest()
+        self.receipts: "OrderedDict[str, dict]" = OrderedDict()
+        self.submitted = 0
+        self.sealed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._reserved = 0
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self):
+        """启动工作协程，并重放封存日志中未完成的信笺"""
+        if not self.enabled:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sealing")
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"sealing-worker-{i}")
+            for i in range(self.workers)
+        ]
+        if self.journal is not None:
+            pending = self.journal.open()
+            # 写入数据库之后、记录完成之前崩溃的信笺已经封存，重放会与已有的回执冲突
+            sealed = await self._sealed_receipts([record["receipt"] for record in pending])
+            if sealed:
+                await asyncio.to_thread(self.journal.completed, list(sealed))
+                logger.info(f"封存日志中有 {len(sealed)} 封信笺已经封存，不再重放")
+            replayed = 0
+            for record in pending:
+                record.pop("op")
+                draft = LetterDraft(**record)
+                if draft.receipt in sealed:
+                    self._track(draft.receipt, {"status": "sealed", "letter_id": sealed[draft.receipt]})
+                    continue
+                self._track(draft.receipt, {"status": "queued"})
+                self.submitted += 1
+                replayed += 1
+                await self._queue.put(draft)
+            if replayed:
+                logger.info(f"从封存日志恢复了 {replayed} 封待封存的信笺")
+        logger.info(f"异步封存已启用，{self.workers} 个工作协程")
+
+    async def stop(self, timeout: float = SEALING_DRAIN_TIMEOUT_SECONDS):
+        """
+        排空队列后停止
+
+        Args:
+            timeout: 等待排空的最长时间（秒），超时后剩余信笺留在日志中
+        """
+        if not self.enabled or self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"封存队列未能在 {timeout} 秒内排空，剩余 {self._queue.qsize()} 封")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+        if self.journal is not None:
+            self.journal.close()
+
+    async def submit(
+        self,
+        content: str,
+        title: Optional[str],
+        open_at: int,
+        send_to_void: bool = False,
+        creator_ip_hash: Optional[str] = None
+    ) -> str:
+        """
+        提交一封已校验的信笺
+
+        Args:
+            content: 信笺内容
+            title: 信笺标题
+            open_at: 开启时间（纪元秒）
+            send_to_void: 是否寄往虚空
+            creator_ip_hash: 创建者IP哈希
+
+        Returns:
+            回执编号
+
+        Raises:
+            SealingQueueFull: 队列已满
+        """
+        # 写日志期间其他请求也可能入队，先预留位置，保证写入日志的信笺一定能入队
+        if self._queue.qsize() + self._reserved >= self.max_size:
+            raise SealingQueueFull("封存队列已满，请稍后再试")
+        draft = LetterDraft(
+            self._issue_receipt(), title, content, open_at, send_to_void,
+            creator_ip_hash, time.time()
+        )
+        if self.journal is not None:
+            self._reserved += 1
+            try:
+                await asyncio.to_thread(self.journal.submitted, draft)
+            finally:
+                self._reserved -= 1
+        self._queue.put_nowait(draft)
+        self._track(draft.receipt, {"status": "queued"})
+        self.submitted += 1
+        return draft.receipt
+
+    def _sign(self, body: str) -> str:
+        digest = hmac.new(self._receipt_key, body.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:12]).decode()
+
+    def _issue_receipt(self) -> str:
+        """签发回执编号：签发时间（十六进制纪元秒）.随机数.签名"""
+        body = f"{int(time.time()):x}.{secrets.token_urlsafe(12)}"
+        return f"{body}.{self._sign(body)}"
+
+    def _issued_at(self, receipt: str) -> Optional[int]:
+        """校验回执签名，返回签发时间；不是本服务签发的回执返回None"""
+        body, _, signature = receipt.rpartition(".")
+        if not body or not hmac.compare_digest(signature, self._sign(body)):
+            return None
+        return int(body.split(".", 1)[0], 16)
+
+    async def get_receipt(self, receipt: str) -> Optional[dict]:
+        """
+        查询回执状态
+
+        Args:
+            receipt: 回执编号
+
+        Returns:
+            queued / sealed（附信笺ID）/ failed；回执不存在或已过期时返回None
+        """
+        status = self.receipts.get(receipt)
+        if status is not None:
+            return status
+        async with AsyncSessionLocal() as db:
+            letter_id = await time_capsule_service.get_receipt_letter_id(db, receipt)
+        if letter_id is not None:
+            return {"status": "sealed", "letter_id": letter_id}
+        issued_at = self._issued_at(receipt)
+        if issued_at is None or issued_at + SEALING_RECEIPT_TTL_SECONDS < time.time():
+            return None
+        # 由其他worker受理、尚未封存
+        return {"status": "queued"}
+
+    async def _sealed_receipts(self, receipts: List[str]) -> Dict[str, int]:
+        """
+        查询哪些回执已经封存
+
+        Args:
+            receipts: 回执编号
+
+        Returns:
+            已封存的回执到信笺ID的映射
+        """
+        sealed = {}
+        if not receipts:
+            return sealed
+        async with AsyncSessionLocal() as db:
+            for receipt in receipts:
+                letter_id = await time_capsule_service.get_receipt_letter_id(db, receipt)
+                if letter_id is not None:
+                    sealed[receipt] = letter_id
+        return sealed
+
+    def _track(self, receipt: str, status: dict):
+        self.receipts[receipt] = status
+        self.receipts.move_to_end(receipt)
+        while len(self.receipts) > SEALING_RECEIPTS_KEPT:
+            self.receipts.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._seal(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _seal(self, batch: List[LetterDraft]):
+        """加密并写入一批信笺"""
+        loop = asyncio.get_running_loop()
+        try:
+            letters = await asyncio.gather(*(
+                loop.run_in_executor(
+                    self._executor,
+                    time_capsule_service.build_letter,
+                    draft.content, draft.title, draft.open_at,
+                    draft.send_to_void, draft.creator_ip_hash
+                )
+                for draft in batch
+            ))
+            async with AsyncSessionLocal() as db:
+                await time_capsule_service.save_letters(db, letters, [draft.receipt for draft in batch])
+        except Exception as e:
+            # 数据库错误等：回执标记为失败，日志中的记录保留，下次启动时重试
+            logger.exception(f"封存 {len(batch)} 封信笺失败: {e}")
+            self.failed += len(batch)
+            for draft in batch:
+                self._track(draft.receipt, {"status": "failed", "error": str(e)})
+            return
+
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.completed, [draft.receipt for draft in batch])
+        now = time.monotonic()
+        self.batches += 1
+        for draft, letter in zip(batch, letters):
+            latency = now - draft.enqueued
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_latency += latency
+            self.sealed += 1
+            self._track(draft.receipt, {"status": "sealed", "letter_id": letter.id})
+
+    def get_stats(self) -> dict:
+        """
+        获取队列统计
+
+        Returns:
+            队列深度、提交/完成/失败数和封存延迟
+        """
+        return {
+            "enabled": self.enabled,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "submitted": self.submitted,
+            "sealed": self.sealed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_latency_ms": round(self.last_latency * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+            "avg_latency_ms": round(self.total_latency / self.sealed * 1000, 2) if self.sealed else 0.0,
+        }
+
+# 全局封存队列实例
+sealing_queue = SealingQueue()
@@ -0,0 +1,230 @@
+"""
+全文搜索模块
+基于 SQLite FTS5 为回廊内容建立倒排索引
+
+FTS5 自带的 unicode61 分词器把连续的汉字视为一个词，无法按词搜索中文。
+这里在写入前自行切分：汉字（及假名、谚文）按重叠的二元组切分，并补上每段的末字，
+其他文字按单词切分；查询时用同样的方式切分成短语，相邻二元组组成的短语恰好等价于子串匹配。
+"""
+import base64
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from .config import SEARCH_MAX_QUERY_LENGTH, SEARCH_MAX_QUERY_TERMS, SEARCH_MAX_CANDIDATES
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "facade_content_fts"
+
+_WORD_RE = re.compile(r"[^\W_]+")
+# 假名、汉字（含扩展A和兼容区）、谚文
+_CJK_RE = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)")
+
+SEARCH_SCHEMA = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+    USING fts5(tokens, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    # 软删除、物理删除和身份过期清理时同步移除索引，与应用代码无关
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_soft_delete
+    AFTER UPDATE OF is_deleted ON facade_contents WHEN new.is_deleted
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON facade_contents
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_expire
+    AFTER UPDATE OF is_expired ON facade_identities WHEN new.is_expired
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (
+            SELECT id FROM facade_contents WHERE facade_identity_id = new.id
+        );
+    END
+    """,
+)
+
+INSERT_SQL = f"INSERT INTO {FTS_TABLE} (rowid, tokens) VALUES (:id, :tokens)"
+
+# 按 rowid 倒序从索引中流式取出最新的若干条命中作为候选，只对候选计算bm25并排序。
+# 对全部命中按相关度排序的开销与命中数成正比，常见词在大表上会达到数百毫秒；
+# 限定候选集后单次查询的工作量有固定上限，回廊内容本身也只在24小时内有效。
+SEARCH_SQL = f"""
+    SELECT c.id, c.content_text, c.image_path, c.created_at, c.applause_count,
+           i.expires_at, m.rank
+    FROM (
+        SELECT rowid AS id, rank FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH :query
+        ORDER BY rowid DESC
+        LIMIT :candidates
+    ) AS m
+    JOIN facade_contents AS c ON c.id = m.id
+    JOIN facade_identities AS i ON i.id = c.facade_identity_id
+    WHERE c.is_deleted = 0 AND i.is_expired = 0 AND i.expires_at > :now
+      AND (m.rank > :after_rank OR (m.rank = :after_rank AND c.id > :after_id))
+    ORDER BY m.rank, c.id
+    LIMIT :limit
+"""
+
+
+def _segments(text: str) -> List[Tuple[str, bool]]:
+    """将文本切分为 (片段, 是否为汉字类文字) 列表"""
+    segments = []
+    for word in _WORD_RE.findall(text.lower()):
+        for part in _CJK_RE.split(word):
+            if part:
+                segments.append((part, bool(_CJK_RE.fullmatch(part))))
+    return segments
+
+
+def tokenize(text: Optional[str]) -> str:
+    """
+    将内容切分为以空格分隔的索引词
+
+    Args:
+        text: 内容文本
+
+    Returns:
+        交给 FTS5 的索引文本
+    """
+    tokens = []
+    for segment, is_cjk in _segments(text or ""):
+        if is_cjk:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+            # 末字单独成词，使单字前缀查询能命中段中任意位置的字
+            tokens.append(segment[-1])
+        else:
+            tokens.append(segment)
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> str:
+    """
+    将用户输入转换为 FTS5 查询表达式
+
+    每个片段转换为一个带引号的短语（各片段之间为AND），因此用户输入中的运算符
+    和特殊字符不会被 FTS5 解释。
+
+    Args:
+        query: 用户输入
+
+    Returns:
+        FTS5 MATCH 表达式
+
+    Raises:
+        ValueError: 查询为空或过长
+    """
+    if len(query) > SEARCH_MAX_QUERY_LENGTH:
+        raise ValueError(f"搜索词不能超过{SEARCH_MAX_QUERY_LENGTH}字符")
+    segments = _segments(query)
+    if not segments:
+        raise ValueError("请输入搜索关键词")
+    if len(segments) > SEARCH_MAX_QUERY_TERMS:
+        raise ValueError(f"搜索词不能超过{SEARCH_MAX_QUERY_TERMS}个")
+
+    phrases = []
+    for segment, is_cjk in segments:
+        if is_cjk and len(segment) > 1:
+            bigrams = " ".join(segment[i:i + 2] for i in range(len(segment) - 1))
+            phrases.append(f'"{bigrams}"')
+        else:
+            # 单字和单词按前缀匹配
+            phrases.append(f'"{segment}"*')
+    return " ".join(phrases)
+
+
+def encode_cursor(rank: float, content_id: int) -> str:
+    """将最后一条结果的位置编码为分页游标"""
+    raw = f"{rank!r}:{content_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    解码分页游标
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, content_id = raw.split(":")
+        return float(rank), int(content_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+class SearchIndex:
+    """回廊内容的全文索引（仅 SQLite 且支持 FTS5 时可用）"""
+
+    def __init__(self):
+        self.available = False
+        self.max_candidates = SEARCH_MAX_CANDIDATES
+
+    def detect(self, connection) -> bool:
+        """
+        只检查FTS表是否已存在（建表由启动器在父进程中完成时使用）
+
+        Args:
+            connection: 同步数据库连接
+
+        Returns:
+            全文搜索是否可用
+        """
+        self.available = connection.dialect.name == "sqlite" and connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first() is not None
+        return self.available
+
+    def ensure(self, connection) -> bool:
+        """
+        创建FTS表和同步触发器，首次创建时为现有的有效内容建立索引
+
+        Args:
+            connection: 同步数据库连接
+
+        Returns:
+            全文搜索是否可用
+        """
+        if connection.dialect.name != "sqlite":
+            self.available = False
+            return False
+
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first() is not None
+        try:
+            for statement in SEARCH_SCHEMA:
+                connection.exec_driver_sql(statement)
+        except Exception as e:
+            logger.warning(f"SQLite 不支持 FTS5，全文搜索不可用: {e}")
+            self.available = False
+            return False
+
+        if not exists:
+            rows = connection.exec_driver_sql(
+                "SELECT c.id, c.content_text FROM facade_contents AS c "
+                "JOIN facade_identities AS i ON i.id = c.facade_identity_id "
+                "WHERE c.is_deleted = 0 AND i.is_expired = 0 AND c.content_text IS NOT NULL"
+            ).all()
+            if rows:
+                connection.exec_driver_sql(
+                    f"INSERT INTO {FTS_TABLE} (rowid, tokens) VALUES (?, ?)",
+                    [(content_id, tokenize(text)) for content_id, text in rows]
+                )
+            logger.info(f"已为 {len(rows)} 条回廊内容建立全文索引")
+
+        self.available = True
+        return True
+
+
+# 全局全文索引实例
+search_index = SearchIndex()
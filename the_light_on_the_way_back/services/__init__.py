@@ -3,5 +3,6 @@
 """
 from .time_capsule import time_capsule_service
 from .facade_gallery import facade_service
+from .stats import stats_service
 
-__all__ = ['time_capsule_service', 'facade_service']
+__all__ = ['time_capsule_service', 'facade_service', 'stats_service']
@@ -0,0 +1,152 @@
+"""
+鼓掌过滤器模块
+为每条有效的回廊内容保存已鼓掌IP哈希的布隆过滤器，确定没有鼓掌过时跳过数据库中的重复检查
+"""
+import hashlib
+import math
+import sys
+import time
+from typing import Iterable, Optional
+
+from .lru import ByteBudgetLRU
+from ..config import (
+    MAX_APPLAUSE_PER_CONTENT,
+    APPLAUSE_FILTER_ENABLED,
+    APPLAUSE_FILTER_FALSE_POSITIVE_RATE,
+    APPLAUSE_FILTER_MAX_BYTES,
+)
+
+class BloomFilter:
+    """
+    固定容量的布隆过滤器
+
+    位数和哈希函数个数按容量和误判率计算；k 个位置由一次 BLAKE2b 摘要的两半
+    以 h1 + i * h2 的方式导出，不需要 k 次独立的哈希。
+    """
+
+    __slots__ = ("bits", "size", "hashes")
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        capacity = max(1, capacity)
+        size = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.bits = bytearray((size + 7) // 8)
+        self.size = len(self.bits) * 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, value: str):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class _Entry:
+    __slots__ = ("bloom", "expires_at", "size")
+
+    def __init__(self, bloom: BloomFilter, expires_at: int):
+        self.bloom = bloom
+        self.expires_at = expires_at
+        self.size = sys.getsizeof(bloom.bits)
+
+class ApplauseFilters(ByteBudgetLRU):
+    """
+    每条内容一个已鼓掌IP哈希的布隆过滤器
+
+    过滤器在内容第一次被鼓掌时由数据库加载，之后每次接受的鼓掌都加入其中。
+    过滤器回答"一定没有鼓掌过"时鼓掌直接插入；回答"可能鼓掌过"时仍查询数据库。
+    每个worker各有一份，其他worker接受的鼓掌不在其中，此时由唯一索引拒绝插入，不会重复计数。
+    容量取每条内容的鼓掌上限，大小固定；条目在发布者身份过期时丢弃，
+    总字节数超过上限时淘汰最久未使用的过滤器。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = APPLAUSE_FILTER_ENABLED,
+        capacity: int = MAX_APPLAUSE_PER_CONTENT,
+        false_positive_rate: float = APPLAUSE_FILTER_FALSE_POSITIVE_RATE,
+        max_bytes: int = APPLAUSE_FILTER_MAX_BYTES
+    ):
+        super().__init__(max_bytes)
+        self.enabled = enabled
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.loads = 0
+        self.checks = 0
+        self.skipped = 0
+
+    def check(self, content_id: int, ip_hash: str) -> Optional[bool]:
+        """
+        查询是否可能已经鼓掌过
+
+        Args:
+            content_id: 内容ID
+            ip_hash: 鼓掌者IP哈希
+
+        Returns:
+            False 表示一定没有鼓掌过；True 表示可能鼓掌过，需要查询数据库；
+            None 表示过滤器尚未加载（或未启用、已过期）
+        """
+        if not self.enabled:
+            return None
+        entry = self._lookup(content_id)
+        if entry is None or entry.expires_at <= time.time():
+            if entry is not None:
+                self._remove(content_id)
+            return None
+        self.checks += 1
+        if ip_hash in entry.bloom:
+            return True
+        self.skipped += 1
+        return False
+
+    def load(self, content_id: int, ip_hashes: Iterable[str], expires_at: int):
+        """
+        由数据库中的鼓掌记录建立过滤器
+
+        Args:
+            content_id: 内容ID
+            ip_hashes: 该内容全部鼓掌者的IP哈希
+            expires_at: 发布者身份的过期时间（纪元秒）
+        """
+        if not self.enabled:
+            return
+        ip_hashes = list(ip_hashes)
+        bloom = BloomFilter(max(self.capacity, len(ip_hashes)), self.false_positive_rate)
+        for ip_hash in ip_hashes:
+            bloom.add(ip_hash)
+        if self._store(content_id, _Entry(bloom, expires_at)):
+            self.loads += 1
+
+    def add(self, content_id: int, ip_hash: str):
+        """记录一次已写入数据库的鼓掌（过滤器尚未加载时忽略，加载时会从数据库读到）"""
+        entry = self._entries.get(content_id)
+        if entry is not None:
+            entry.bloom.add(ip_hash)
+
+    def get_stats(self) -> dict:
+        """
+        获取过滤器统计
+
+        Returns:
+            是否启用、过滤器数、占用字节数、加载次数、查询次数和跳过的数据库查询次数
+        """
+        return {
+            "enabled": self.enabled,
+            **self._budget_stats(),
+            "loads": self.loads,
+            "checks": self.checks,
+            "skipped": self.skipped,
+            "evictions": self.evictions,
+        }
+
+# 全局鼓掌过滤器实例
+applause_filters = ApplauseFilters()
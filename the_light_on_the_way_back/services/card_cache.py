@@ -0,0 +1,88 @@
+"""
+回廊卡片片段缓存模块
+缓存每条回廊内容渲染好的卡片HTML，页面渲染时只拼接片段，不再逐条执行卡片模板
+"""
+import time
+from typing import Optional
+
+from .lru import ByteBudgetLRU
+from ..config import CARD_CACHE_ENABLED, CARD_CACHE_MAX_BYTES
+
+class _Entry:
+    __slots__ = ("version", "html", "expires_at", "size")
+
+    def __init__(self, version: int, html: str, expires_at: int):
+        self.version = version
+        self.html = html
+        self.expires_at = expires_at
+        self.size = len(html.encode())
+
+class GalleryCardCache(ByteBudgetLRU):
+    """
+    回廊卡片HTML的LRU缓存
+
+    按内容ID缓存，每条内容只保留一个版本。版本为鼓掌数：卡片中只有它会变化
+    （剩余时间由浏览器根据过期时间填写），鼓掌数随查询结果一起读出，
+    其他worker的鼓掌也会使版本变化，不需要跨进程失效。
+    条目在发布者身份过期时失效，总字节数超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, enabled: bool = CARD_CACHE_ENABLED, max_bytes: int = CARD_CACHE_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content_id: int, version: int) -> Optional[str]:
+        """
+        读取缓存的卡片
+
+        Args:
+            content_id: 内容ID
+            version: 当前版本（鼓掌数）
+
+        Returns:
+            卡片HTML，未命中或版本不符时为None
+        """
+        if not self.enabled:
+            return None
+        entry = self._lookup(content_id)
+        if entry is None or entry.version != version or entry.expires_at <= time.time():
+            if entry is not None:
+                self._remove(content_id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.html
+
+    def put(self, content_id: int, version: int, html: str, expires_at: int):
+        """
+        缓存一张卡片
+
+        Args:
+            content_id: 内容ID
+            version: 版本（鼓掌数）
+            html: 卡片HTML
+            expires_at: 发布者身份的过期时间（纪元秒）
+        """
+        if not self.enabled:
+            return
+        self._store(content_id, _Entry(version, html, expires_at))
+
+    def get_stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            是否启用、条目数、占用字节数、命中/未命中和淘汰次数
+        """
+        return {
+            "enabled": self.enabled,
+            **self._budget_stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# 全局回廊卡片缓存实例
+gallery_card_cache = GalleryCardCache()
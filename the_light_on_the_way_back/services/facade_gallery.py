@@ -1,16 +1,41 @@
 """
 假象回廊服务模块
 """
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+import time
+from typing import Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, desc, func
+from sqlalchemy import select, and_, desc, func, text
+from sqlalchemy.exc import IntegrityError
 from ..models import FacadeIdentity, FacadeContent, FacadeApplause
+from ..schemas import GalleryItem
+from ..timeutils import epoch_now
+from ..storage import image_store
+from ..ranking import trending_index
+from ..dedup import near_duplicate_index
+from .singleflight import singleflight
+from .card_cache import gallery_card_cache
+from .applause_filter import applause_filters
+from .stats import stats_service
+from ..invalidation import invalidation_bus, GALLERY
+from ..search import search_index, tokenize, build_match_query, encode_cursor, decode_cursor, INSERT_SQL, SEARCH_SQL
 from ..encryption import generate_identity_token, hash_ip
-from ..config import FACADE_LIFETIME_HOURS, MAX_FACADE_CONTENT_LENGTH, MAX_APPLAUSE_PER_CONTENT
+from ..tracing import tracer
+from ..config import (
+    FACADE_LIFETIME_HOURS,
+    MAX_FACADE_CONTENT_LENGTH,
+    MAX_APPLAUSE_PER_CONTENT,
+    TRENDING_RESYNC_INTERVAL_SECONDS,
+)
 
+# 本进程热度索引对回廊写入的观察者
+gallery_generation = invalidation_bus.watch(GALLERY)
+
+@tracer.trace_methods("facade_gallery")
 class FacadeGalleryService:
     """假象回廊服务类"""
+
+    # 最近一次因其他进程写入而重建热度索引的时间（单调时钟）
+    _trending_synced_at = 0.0
     
     async def create_identity(
         self,
@@ -44,11 +69,12 @@ class FacadeGalleryService:
         # 创建假象身份
         identity = FacadeIdentity(
             identity_token=identity_token,
-            expires_at=datetime.utcnow() + timedelta(hours=FACADE_LIFETIME_HOURS),
+            expires_at=epoch_now() + FACADE_LIFETIME_HOURS * 60 * 60,
             creator_ip_hash=hash_ip(creator_ip) if creator_ip else None
         )
         
         db.add(identity)
+        await stats_service.increment(db, active_facades=1)
         await db.commit()
         await db.refresh(identity)
         
@@ -74,7 +100,7 @@ class FacadeGalleryService:
                 and_(
                     FacadeIdentity.identity_token == identity_token,
                     FacadeIdentity.is_expired == False,
-                    FacadeIdentity.expires_at > datetime.utcnow()
+                    FacadeIdentity.expires_at > epoch_now()
                 )
             )
         )
@@ -113,6 +139,9 @@ class FacadeGalleryService:
         
         if content_text and len(content_text) > MAX_FACADE_CONTENT_LENGTH:
             raise ValueError(f"文本内容不能超过{MAX_FACADE_CONTENT_LENGTH}字符")
+
+        # 与近期内容近似重复时在写入数据库之前拒绝
+        dedup_key = near_duplicate_index.check(content_text, identity.expires_at)
         
         # 创建内容
         content = FacadeContent(
@@ -121,9 +150,22 @@ class FacadeGalleryService:
             image_path=image_path
         )
         
-        db.add(content)
-        await db.commit()
+        try:
+            db.add(content)
+            if search_index.available and content_text:
+                # 与内容在同一事务中写入全文索引
+                await db.flush()
+                await db.execute(text(INSERT_SQL), {"id": content.id, "tokens": tokenize(content_text)})
+            await stats_service.increment(db, live_posts=1)
+            await db.commit()
+        except BaseException:
+            near_duplicate_index.discard(dedup_key)
+            raise
         await db.refresh(content)
+
+        near_duplicate_index.bind(dedup_key, content.id)
+        trending_index.add(content.id, identity.expires_at)
+        gallery_generation.bump()
         
         return content
     
@@ -132,10 +174,13 @@ class FacadeGalleryService:
         db: AsyncSession,
         limit: int = 20,
         offset: int = 0
-    ) -> List[Dict]:
+    ) -> List[GalleryItem]:
         """
         获取假象回廊内容列表
-        
+
+        只查询需要的列，直接由SQL行元组构建类型行，不做ORM实体装配；
+        相同分页的并发请求共享同一次查询
+
         Args:
             db: 数据库会话
             limit: 限制数量
@@ -144,14 +189,35 @@ class FacadeGalleryService:
         Returns:
             内容列表
         """
+        return await singleflight.do(
+            ("gallery_contents", limit, offset),
+            lambda: self._query_gallery_contents(db, limit, offset)
+        )
+
+    async def _query_gallery_contents(
+        self,
+        db: AsyncSession,
+        limit: int,
+        offset: int
+    ) -> List[GalleryItem]:
+        """查询一页回廊内容"""
+        now = epoch_now()
+
         # 查询有效的内容
         result = await db.execute(
-            select(FacadeContent, FacadeIdentity).join(
+            select(
+                FacadeContent.id,
+                FacadeContent.content_text,
+                FacadeContent.image_path,
+                FacadeContent.created_at,
+                FacadeContent.applause_count,
+                FacadeIdentity.expires_at
+            ).join(
                 FacadeIdentity,
                 and_(
                     FacadeContent.facade_identity_id == FacadeIdentity.id,
                     FacadeIdentity.is_expired == False,
-                    FacadeIdentity.expires_at > datetime.utcnow()
+                    FacadeIdentity.expires_at > now
                 )
             ).where(
                 FacadeContent.is_deleted == False
@@ -159,19 +225,206 @@ class FacadeGalleryService:
                 desc(FacadeContent.created_at)
             ).limit(limit).offset(offset)
         )
-        
-        contents = []
-        for content, identity in result:
-            contents.append({
-                'id': content.id,
-                'content_text': content.content_text,
-                'image_path': content.image_path,
-                'created_at': content.created_at,
-                'applause_count': content.applause_count,
-                'time_remaining': self._calculate_time_remaining(identity.expires_at)
-            })
-        
-        return contents
+
+        calculate = self._calculate_time_remaining
+        return [
+            GalleryItem(
+                content_id,
+                content_text,
+                image_path,
+                created_at,
+                applause_count,
+                calculate(expires_at, now),
+                expires_at
+            )
+            for content_id, content_text, image_path, created_at, applause_count, expires_at
+            in result.tuples()
+        ]
+
+    async def get_applause_count(self, db: AsyncSession, content_id: int) -> int:
+        """
+        获取内容的鼓掌数
+
+        Args:
+            db: 数据库会话
+            content_id: 内容ID
+
+        Returns:
+            鼓掌数，内容不存在时为0
+        """
+        result = await db.execute(
+            select(FacadeContent.applause_count).where(FacadeContent.id == content_id)
+        )
+        return result.scalar_one_or_none() or 0
+
+    async def get_trending_contents(
+        self,
+        db: AsyncSession,
+        limit: int = 20
+    ) -> List[GalleryItem]:
+        """
+        获取近期热度最高的回廊内容
+
+        排名来自内存中的热度索引，数据库只按主键取回这几条内容
+
+        Args:
+            db: 数据库会话
+            limit: 限制数量
+
+        Returns:
+            按热度排序的内容列表
+        """
+        await self._sync_trending(db)
+        now = epoch_now()
+        ranked = [content_id for content_id, _ in trending_index.top(limit, now)]
+        if not ranked:
+            return []
+
+        result = await db.execute(
+            select(
+                FacadeContent.id,
+                FacadeContent.content_text,
+                FacadeContent.image_path,
+                FacadeContent.created_at,
+                FacadeContent.applause_count,
+                FacadeIdentity.expires_at
+            ).join(
+                FacadeIdentity,
+                and_(
+                    FacadeContent.facade_identity_id == FacadeIdentity.id,
+                    FacadeIdentity.is_expired == False,
+                    FacadeIdentity.expires_at > now
+                )
+            ).where(
+                and_(
+                    FacadeContent.id.in_(ranked),
+                    FacadeContent.is_deleted == False
+                )
+            )
+        )
+
+        calculate = self._calculate_time_remaining
+        items = {
+            content_id: GalleryItem(
+                content_id,
+                content_text,
+                image_path,
+                created_at,
+                applause_count,
+                calculate(expires_at, now),
+                expires_at
+            )
+            for content_id, content_text, image_path, created_at, applause_count, expires_at
+            in result.tuples()
+        }
+        return [items[content_id] for content_id in ranked if content_id in items]
+
+    async def search_contents(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[GalleryItem], Optional[str]]:
+        """
+        全文搜索有效的回廊内容
+
+        在最新的 SEARCH_MAX_CANDIDATES 条命中中按bm25相关度排序，
+        翻页使用 (相关度, 内容ID) 游标而不是偏移量。
+
+        Args:
+            db: 数据库会话
+            query: 搜索词
+            limit: 每页数量
+            cursor: 上一页返回的游标
+
+        Returns:
+            (内容列表, 下一页游标或None)
+
+        Raises:
+            ValueError: 搜索词或游标无效
+        """
+        after_rank, after_id = decode_cursor(cursor) if cursor else (float("-inf"), 0)
+        now = epoch_now()
+        result = await db.execute(
+            text(SEARCH_SQL),
+            {
+                "query": build_match_query(query),
+                "candidates": search_index.max_candidates,
+                "now": now,
+                "after_rank": after_rank,
+                "after_id": after_id,
+                "limit": limit + 1,
+            }
+        )
+        rows = result.all()
+
+        calculate = self._calculate_time_remaining
+        items = [
+            GalleryItem(
+                content_id,
+                content_text,
+                image_path,
+                created_at,
+                applause_count,
+                calculate(expires_at, now),
+                expires_at
+            )
+            for content_id, content_text, image_path, created_at, applause_count, expires_at, _
+            in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last.rank, last.id)
+        return items, next_cursor
+
+    async def _sync_trending(self, db: AsyncSession):
+        """
+        其他进程写入过回廊时由数据库重建热度索引
+
+        重建的开销与有效内容数成正比，因此最多每 TRENDING_RESYNC_INTERVAL_SECONDS 重建一次，
+        该间隔加上一次重建的耗时就是其他进程的写入在本进程排行中的最大延迟。
+        """
+        started = time.monotonic()
+        if started - self._trending_synced_at < TRENDING_RESYNC_INTERVAL_SECONDS:
+            return
+        if gallery_generation.changed():
+            self._trending_synced_at = started
+            await self.rebuild_trending(db)
+
+    async def rebuild_trending(self, db: AsyncSession) -> int:
+        """
+        由数据库重建热度索引（启动时以及其他进程写入后调用）
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            索引中的内容数量
+        """
+        # 先记录版本号再查询：查询期间其他进程的写入会触发下一次重建
+        gallery_generation.sync()
+        now = epoch_now()
+        live = and_(
+            FacadeContent.is_deleted == False,
+            FacadeIdentity.is_expired == False,
+            FacadeIdentity.expires_at > now
+        )
+        contents = await db.execute(
+            select(FacadeContent.id, FacadeIdentity.expires_at).join(
+                FacadeIdentity, FacadeContent.facade_identity_id == FacadeIdentity.id
+            ).where(live)
+        )
+        applause = await db.execute(
+            select(FacadeApplause.content_id, FacadeApplause.created_at).join(
+                FacadeContent, FacadeApplause.content_id == FacadeContent.id
+            ).join(
+                FacadeIdentity, FacadeContent.facade_identity_id == FacadeIdentity.id
+            ).where(live)
+        )
+        trending_index.rebuild(contents.tuples().all(), applause.tuples(), now)
+        return len(trending_index)
     
     async def applaud_content(
         self,
@@ -193,36 +446,49 @@ class FacadeGalleryService:
         Raises:
             ValueError: 如果内容不存在或已达到鼓掌上限
         """
-        # 查找内容
+        # 查找内容（连同身份过期时间，供热度索引使用）
         result = await db.execute(
-            select(FacadeContent).where(
+            select(FacadeContent, FacadeIdentity.expires_at).join(
+                FacadeIdentity, FacadeContent.facade_identity_id == FacadeIdentity.id
+            ).where(
                 and_(
                     FacadeContent.id == content_id,
                     FacadeContent.is_deleted == False
                 )
             )
         )
-        content = result.scalar_one_or_none()
+        row = result.first()
         
-        if not content:
+        if not row:
             raise ValueError("内容不存在")
+        content, expires_at = row
         
         if content.applause_count >= MAX_APPLAUSE_PER_CONTENT:
             raise ValueError("鼓掌数已达上限")
         
-        # 检查是否已经鼓掌过
+        # 检查是否已经鼓掌过：过滤器确定没有鼓掌过时跳过查询，直接插入
         applauder_ip_hash = hash_ip(applauder_ip)
-        existing_applause = await db.execute(
-            select(FacadeApplause).where(
-                and_(
-                    FacadeApplause.content_id == content_id,
-                    FacadeApplause.applauder_ip_hash == applauder_ip_hash
+        seen = applause_filters.check(content_id, applauder_ip_hash)
+        if seen is None and applause_filters.enabled:
+            # 本进程第一次为该内容鼓掌：加载全部鼓掌者，同时得到本次的确切结果
+            result = await db.execute(
+                select(FacadeApplause.applauder_ip_hash).where(FacadeApplause.content_id == content_id)
+            )
+            applauder_ip_hashes = result.scalars().all()
+            applause_filters.load(content_id, applauder_ip_hashes, expires_at)
+            if applauder_ip_hash in applauder_ip_hashes:
+                return False  # 已经鼓掌过
+        elif seen is not False:
+            existing_applause = await db.execute(
+                select(FacadeApplause.id).where(
+                    and_(
+                        FacadeApplause.content_id == content_id,
+                        FacadeApplause.applauder_ip_hash == applauder_ip_hash
+                    )
                 )
             )
-        )
-        
-        if existing_applause.scalar_one_or_none():
-            return False  # 已经鼓掌过
+            if existing_applause.first():
+                return False  # 已经鼓掌过
         
         # 创建鼓掌记录
         applause = FacadeApplause(
@@ -234,13 +500,27 @@ class FacadeGalleryService:
         content.applause_count += 1
         
         db.add(applause)
-        await db.commit()
+        try:
+            await stats_service.increment(db, total_applause=1)
+            await db.commit()
+        except IntegrityError:
+            # 同一IP的并发请求都通过了上面的检查，或其他worker接受的鼓掌不在本进程的过滤器中，
+            # 由唯一索引拒绝
+            await db.rollback()
+            applause_filters.add(content_id, applauder_ip_hash)
+            return False
+        applause_filters.add(content_id, applauder_ip_hash)
+
+        trending_index.applaud(content_id, expires_at)
+        gallery_generation.bump()
         
         return True
     
     async def cleanup_expired_identities(self, db: AsyncSession) -> int:
         """
         清理过期的假象身份
+
+        同时将这些身份的内容移出热度索引、卡片缓存和鼓掌过滤器，并删除只被它们引用的上传图片
         
         Args:
             db: 数据库会话
@@ -248,17 +528,44 @@ class FacadeGalleryService:
         Returns:
             清理的身份数量
         """
-        current_time = datetime.utcnow()
-        
-        # 查找过期的身份
+        current_time = epoch_now()
+        expired_condition = and_(
+            FacadeIdentity.expires_at <= current_time,
+            FacadeIdentity.is_expired == False
+        )
+
+        # 过期身份发布过的图片
         result = await db.execute(
-            select(FacadeIdentity).where(
+            select(FacadeContent.image_path).where(
                 and_(
-                    FacadeIdentity.expires_at <= current_time,
-                    FacadeIdentity.is_expired == False
+                    FacadeContent.facade_identity_id.in_(
+                        select(FacadeIdentity.id).where(expired_condition)
+                    ),
+                    FacadeContent.image_path.isnot(None)
+                )
+            ).distinct()
+        )
+        image_paths = set(result.scalars().all())
+
+        # 过期身份的内容从热度索引中移除
+        result = await db.execute(
+            select(FacadeContent.id, FacadeContent.is_deleted).where(
+                FacadeContent.facade_identity_id.in_(
+                    select(FacadeIdentity.id).where(expired_condition)
                 )
             )
         )
+        expired_contents = result.all()
+        trending_index.evict([content_id for content_id, _ in expired_contents])
+        near_duplicate_index.evict([content_id for content_id, _ in expired_contents])
+        gallery_card_cache.evict([content_id for content_id, _ in expired_contents])
+        applause_filters.evict([content_id for content_id, _ in expired_contents])
+        live_posts = sum(1 for _, is_deleted in expired_contents if not is_deleted)
+        
+        # 查找过期的身份
+        result = await db.execute(
+            select(FacadeIdentity).where(expired_condition)
+        )
         expired_identities = result.scalars().all()
         
         count = 0
@@ -266,26 +573,48 @@ class FacadeGalleryService:
             identity.is_expired = True
             count += 1
         
+        await stats_service.increment(db, active_facades=-count, live_posts=-live_posts)
         await db.commit()
+        if count:
+            gallery_generation.bump()
+
+        if image_paths:
+            # 内容寻址去重后同一图片可能被其他仍有效的内容引用
+            result = await db.execute(
+                select(FacadeContent.image_path).join(
+                    FacadeIdentity,
+                    FacadeContent.facade_identity_id == FacadeIdentity.id
+                ).where(
+                    and_(
+                        FacadeContent.image_path.in_(image_paths),
+                        FacadeContent.is_deleted == False,
+                        FacadeIdentity.is_expired == False
+                    )
+                ).distinct()
+            )
+            for image_path in image_paths - set(result.scalars().all()):
+                image_store.delete(image_path)
+
         return count
     
-    def _calculate_time_remaining(self, expires_at: datetime) -> str:
+    def _calculate_time_remaining(self, expires_at: int, now: Optional[int] = None) -> str:
         """
         计算剩余时间
         
         Args:
-            expires_at: 过期时间
+            expires_at: 过期时间（纪元秒）
+            now: 当前时间（批量计算时由调用方传入，避免逐行取时间）
             
         Returns:
             剩余时间描述
         """
-        remaining = expires_at - datetime.utcnow()
+        remaining = expires_at - (now or epoch_now())
         
-        if remaining.total_seconds() <= 0:
+        if remaining <= 0:
             return "已过期"
         
-        hours = int(remaining.total_seconds() // 3600)
-        minutes = int((remaining.total_seconds() % 3600) // 60)
+        hours = remaining // 3600
+        minutes = (remaining % 3600) // 60
         
         if hours > 0:
             return f"{hours}小时{minutes}分钟"
@@ -0,0 +1,112 @@
+"""
+已开启信笺缓存模块
+缓存解密后的信笺，重复开启时不再派生密钥和解密（默认关闭）
+"""
+import time
+from typing import Optional, Tuple
+
+from .lru import ByteBudgetLRU
+from ..config import LETTER_CACHE_ENABLED, LETTER_CACHE_TTL_SECONDS, LETTER_CACHE_MAX_BYTES
+
+def _wipe(buffer: Optional[bytearray]):
+    """将缓冲区原地清零"""
+    if buffer is not None:
+        buffer[:] = bytes(len(buffer))
+
+class _Entry:
+    __slots__ = ("title", "content", "created_at", "expires_at", "size")
+
+    def __init__(self, title: Optional[bytearray], content: bytearray, created_at: int, expires_at: float):
+        self.title = title
+        self.content = content
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.size = len(content) + (len(title) if title else 0)
+
+class OpenedLetterCache(ByteBudgetLRU):
+    """
+    已开启信笺的LRU缓存
+
+    按信笺ID缓存明文，受条目存活时间和总字节数限制。明文以 bytearray 保存，
+    淘汰、过期或信笺销毁时原地清零；每次命中解码出的 str 由调用方持有，
+    Python 无法保证清除其副本，因此只能做到缓存本身不留存明文。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LETTER_CACHE_ENABLED,
+        ttl_seconds: int = LETTER_CACHE_TTL_SECONDS,
+        max_bytes: int = LETTER_CACHE_MAX_BYTES
+    ):
+        super().__init__(max_bytes)
+        self.enabled = enabled
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, letter_id: int) -> Optional[Tuple[Optional[str], str, int]]:
+        """
+        读取缓存的信笺
+
+        Args:
+            letter_id: 信笺ID
+
+        Returns:
+            (标题, 内容, 创建时间)，未命中时为None
+        """
+        if not self.enabled:
+            return None
+        entry = self._lookup(letter_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(letter_id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        title = entry.title.decode() if entry.title is not None else None
+        return title, entry.content.decode(), entry.created_at
+
+    def put(self, letter_id: int, title: Optional[str], content: str, created_at: int):
+        """
+        缓存一封已开启的信笺
+
+        Args:
+            letter_id: 信笺ID
+            title: 标题
+            content: 内容
+            created_at: 创建时间（纪元秒）
+        """
+        if not self.enabled:
+            return
+        entry = _Entry(
+            bytearray(title.encode()) if title is not None else None,
+            bytearray(content.encode()),
+            created_at,
+            time.monotonic() + self.ttl
+        )
+        self._store(letter_id, entry)
+
+    def _on_remove(self, entry: _Entry):
+        # 淘汰、过期、信笺销毁或清空时清零明文
+        _wipe(entry.title)
+        _wipe(entry.content)
+
+    def get_stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            是否启用、条目数、占用字节数、命中/未命中和淘汰次数
+        """
+        return {
+            "enabled": self.enabled,
+            **self._budget_stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# 全局已开启信笺缓存实例
+opened_letter_cache = OpenedLetterCache()
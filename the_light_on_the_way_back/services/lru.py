@@ -0,0 +1,84 @@
+"""
+按字节预算淘汰的LRU模块
+卡片缓存、已开启信笺缓存和鼓掌过滤器共用：条目按最近使用排序，总字节数超过上限时淘汰最久未使用的条目
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+class ByteBudgetLRU:
+    """
+    受总字节数限制的LRU
+
+    条目须有 size 属性（字节数），单个条目超过上限时不保存。
+    过期、版本等判断由子类在取得条目后自行处理；
+    条目被移除（淘汰、替换、丢弃或清空）时调用 _on_remove，子类可在其中释放条目内容。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def _lookup(self, key: Hashable) -> Optional[Any]:
+        """取得条目并标记为最近使用，不存在时返回None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, entry: Any) -> bool:
+        """
+        保存条目，替换同键的旧条目，超出上限时淘汰最久未使用的条目
+
+        Args:
+            key: 键
+            entry: 带 size 属性的条目
+
+        Returns:
+            是否保存（条目本身超过上限时不保存）
+        """
+        if entry.size > self.max_bytes:
+            self._on_remove(entry)
+            return False
+        self.discard(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return True
+
+    def discard(self, key: Hashable):
+        """移除一个条目（不存在时忽略）"""
+        if key in self._entries:
+            self._remove(key)
+
+    def evict(self, keys: Iterable[Hashable]):
+        """移除一组条目（身份过期等情况下调用）"""
+        for key in keys:
+            self.discard(key)
+
+    def clear(self):
+        """清空全部条目"""
+        for key in list(self._entries):
+            self._remove(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        self._on_remove(entry)
+
+    def _on_remove(self, entry: Any):
+        """条目被移除时调用（默认不做处理）"""
+
+    def _budget_stats(self) -> dict:
+        """条目数、占用字节数和上限"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
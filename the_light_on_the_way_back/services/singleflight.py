@@ -0,0 +1,89 @@
+"""
+并发请求合并模块
+相同键的并发调用共享同一次正在进行的计算
+"""
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """
+    按键合并并发调用
+
+    第一个调用者执行计算，计算完成前到达的相同键调用直接等待其结果（包括异常）。
+    计算结束即移除该键，之后的调用会重新计算，因此不会返回过期数据。
+
+    键为元组，第一个元素作为统计分组名，例如 ("open_letter", 42)。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = Counter()
+        self.executions = Counter()
+        self.coalesced = Counter()
+
+    async def do(self, key: Tuple, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入一次计算
+
+        Args:
+            key: 合并键
+            func: 无参数的协程函数
+
+        Returns:
+            计算结果
+        """
+        group = key[0]
+        self.calls[group] += 1
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.coalesced[group] += 1
+            try:
+                # shield：等待者被取消时不影响正在进行的计算
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行者被取消（如客户端断开），由当前调用者接手重新计算
+                self.coalesced[group] -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.executions[group] += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def get_stats(self) -> dict:
+        """
+        获取合并统计
+
+        Returns:
+            每个分组的调用次数、实际执行次数和被合并的次数
+        """
+        return {
+            group: {
+                "calls": self.calls[group],
+                "executions": self.executions[group],
+                "coalesced": self.coalesced[group],
+                "inflight": sum(1 for key in self._inflight if key[0] == group),
+            }
+            for group in self.calls
+        }
+
+# 全局并发合并实例
+singleflight = SingleFlight()
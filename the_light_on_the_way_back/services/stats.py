@@ -0,0 +1,174 @@
+"""
+统计计数模块
+在数据库中维护运营指标的计数，由各服务方法在自身事务内增减，定时任务定期校准
+"""
+import logging
+from typing import Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_, func
+from ..models import StatCounter, TimeCapsuleLetter, FacadeIdentity, FacadeContent, FacadeApplause
+from ..timeutils import epoch_now
+from ..tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# 由服务方法增减的计数
+ACTIVE_FACADES = "active_facades"        # 尚未被清理的假象身份
+LIVE_POSTS = "live_posts"                # 这些身份发布的未删除内容
+TOTAL_APPLAUSE = "total_applause"        # 鼓掌总数
+LETTERS_SEALED = "letters_sealed"        # 尚未开启且未销毁的信笺（含已到开启时间的）
+LETTERS_OPENED = "letters_opened"        # 已开启且未销毁的信笺
+LETTERS_DESTROYED = "letters_destroyed"  # 已销毁的信笺
+# 随时间变化、没有对应写操作的计数，由定时任务刷新
+LETTERS_OPENABLE = "letters_openable"    # 已到开启时间但尚未开启的信笺
+RECONCILED_AT = "reconciled_at"          # 最近一次校准的时间（纪元秒）
+
+COUNTERS = (
+    ACTIVE_FACADES,
+    LIVE_POSTS,
+    TOTAL_APPLAUSE,
+    LETTERS_SEALED,
+    LETTERS_OPENED,
+    LETTERS_DESTROYED,
+    LETTERS_OPENABLE,
+)
+
+@tracer.trace_methods("stats")
+class StatsService:
+    """
+    统计计数服务
+
+    每个计数是 stats_counters 表中的一行。服务方法在提交业务数据之前调用 increment，
+    计数与业务数据在同一事务中生效或回滚；读取时只需查询这几行，与数据量无关。
+    校准任务用 COUNT 重新计算全部计数，修正进程崩溃、手工改库等造成的偏差。
+    """
+
+    async def increment(self, db: AsyncSession, **deltas: int):
+        """
+        在调用方的事务中增减计数（不提交）
+
+        Args:
+            db: 数据库会话
+            **deltas: 计数名与增量，例如 live_posts=1
+        """
+        for name, delta in deltas.items():
+            if delta:
+                await db.execute(
+                    update(StatCounter)
+                    .where(StatCounter.name == name)
+                    .values(value=StatCounter.value + delta)
+                )
+
+    async def get_stats(self, db: AsyncSession) -> Dict[str, int]:
+        """
+        读取全部计数
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            计数名到数值的映射，以及最近一次校准时间
+        """
+        result = await db.execute(select(StatCounter.name, StatCounter.value))
+        values = dict(result.tuples().all())
+        stats = {name: values.get(name, 0) for name in COUNTERS}
+        stats[RECONCILED_AT] = values.get(RECONCILED_AT)
+        return stats
+
+    def _openable_condition(self, now: int):
+        return and_(
+            TimeCapsuleLetter.open_at <= now,
+            TimeCapsuleLetter.is_opened == False,
+            TimeCapsuleLetter.is_destroyed == False,
+            TimeCapsuleLetter.send_to_void == False
+        )
+
+    async def _count(self, db: AsyncSession, query) -> int:
+        return (await db.execute(query)).scalar_one()
+
+    async def refresh_openable(self, db: AsyncSession) -> int:
+        """
+        重新计算可开启的信笺数（按 open_at 索引计数，不加载信笺）
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            可开启的信笺数量
+        """
+        count = await self._count(
+            db,
+            select(func.count()).select_from(TimeCapsuleLetter).where(self._openable_condition(epoch_now()))
+        )
+        await db.merge(StatCounter(name=LETTERS_OPENABLE, value=count))
+        await db.commit()
+        return count
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """
+        用 COUNT 重新计算全部计数并写回
+
+        计数与写回之间其他进程提交的增减可能被覆盖，偏差在下一次校准时修正。
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            与实际值不一致而被修正的计数个数
+        """
+        now = epoch_now()
+        letters = select(func.count()).select_from(TimeCapsuleLetter)
+        actual = {
+            ACTIVE_FACADES: await self._count(
+                db,
+                select(func.count()).select_from(FacadeIdentity).where(FacadeIdentity.is_expired == False)
+            ),
+            LIVE_POSTS: await self._count(
+                db,
+                select(func.count()).select_from(FacadeContent).join(
+                    FacadeIdentity, FacadeContent.facade_identity_id == FacadeIdentity.id
+                ).where(
+                    and_(
+                        FacadeContent.is_deleted == False,
+                        FacadeIdentity.is_expired == False
+                    )
+                )
+            ),
+            TOTAL_APPLAUSE: await self._count(db, select(func.count()).select_from(FacadeApplause)),
+            LETTERS_SEALED: await self._count(
+                db,
+                letters.where(
+                    and_(
+                        TimeCapsuleLetter.is_opened == False,
+                        TimeCapsuleLetter.is_destroyed == False
+                    )
+                )
+            ),
+            LETTERS_OPENED: await self._count(
+                db,
+                letters.where(
+                    and_(
+                        TimeCapsuleLetter.is_opened == True,
+                        TimeCapsuleLetter.is_destroyed == False
+                    )
+                )
+            ),
+            LETTERS_DESTROYED: await self._count(db, letters.where(TimeCapsuleLetter.is_destroyed == True)),
+            LETTERS_OPENABLE: await self._count(db, letters.where(self._openable_condition(now))),
+        }
+
+        result = await db.execute(select(StatCounter.name, StatCounter.value))
+        stored = dict(result.tuples().all())
+        drifted = 0
+        for name, value in actual.items():
+            # 首次启动时计数行尚不存在，不算作偏差
+            if name in stored and stored[name] != value and name != LETTERS_OPENABLE:
+                logger.warning(f"统计计数 {name} 偏差 {stored[name] - value}，已校准为 {value}")
+                drifted += 1
+            await db.merge(StatCounter(name=name, value=value))
+        await db.merge(StatCounter(name=RECONCILED_AT, value=now))
+        await db.commit()
+        return drifted
+
+# 全局统计计数服务实例
+stats_service = StatsService()
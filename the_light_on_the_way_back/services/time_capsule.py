@@ -1,15 +1,31 @@
 """
 时光信笺服务模块
 """
+import asyncio
 import json
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from ..models import TimeCapsuleLetter
+from sqlalchemy import select, update, delete, and_, or_, func
+from ..models import TimeCapsuleLetter, SealingReceipt, letter_key_date
+from ..schemas import OpenedLetter
+from ..timeutils import epoch_now, to_epoch, from_epoch
 from ..encryption import encryption_service, hash_ip
-from ..config import MAX_LETTER_LENGTH, MAX_FUTURE_DAYS
+from ..archive import letter_archive
+from ..tracing import tracer
+from .singleflight import singleflight
+from .letter_cache import opened_letter_cache
+from .stats import stats_service
+from ..invalidation import invalidation_bus, LETTERS
+from ..config import MAX_LETTER_LENGTH, MAX_FUTURE_DAYS, LETTER_REWRAP_BATCH_SIZE, SEALING_RECEIPT_TTL_SECONDS
 
+logger = logging.getLogger(__name__)
+
+# 本进程已开启信笺缓存对信笺销毁的观察者
+letters_generation = invalidation_bus.watch(LETTERS)
+
+@tracer.trace_methods("time_capsule")
 class TimeCapsuleService:
     """时光信笺服务类"""
     
@@ -36,6 +52,64 @@ class TimeCapsuleService:
         Returns:
             创建的信笺对象
             
+        Raises:
+            ValueError: 如果参数无效
+        """
+        open_at = self.validate_letter(content, open_date, send_to_void)
+        letter = self.build_letter(
+            content,
+            title,
+            open_at,
+            send_to_void,
+            hash_ip(creator_ip) if creator_ip else None
+        )
+        
+        await self.save_letters(db, [letter])
+        await db.refresh(letter)
+        
+        return letter
+
+    async def save_letters(
+        self,
+        db: AsyncSession,
+        letters: List[TimeCapsuleLetter],
+        receipts: Optional[List[str]] = None
+    ):
+        """
+        写入已构建的信笺，并在同一事务中更新统计计数
+
+        Args:
+            db: 数据库会话
+            letters: build_letter 返回的信笺对象
+            receipts: 与信笺一一对应的异步封存回执（可选），与信笺在同一事务中记录
+        """
+        db.add_all(letters)
+        if receipts:
+            await db.flush()
+            db.add_all(
+                SealingReceipt(receipt=receipt, letter_id=letter.id)
+                for receipt, letter in zip(receipts, letters)
+            )
+        destroyed = sum(1 for letter in letters if letter.is_destroyed)
+        await stats_service.increment(
+            db,
+            letters_sealed=len(letters) - destroyed,
+            letters_destroyed=destroyed
+        )
+        await db.commit()
+    
+    def validate_letter(self, content: str, open_date: datetime, send_to_void: bool = False) -> int:
+        """
+        校验信笺内容和开启日期
+
+        Args:
+            content: 信笺内容
+            open_date: 开启日期
+            send_to_void: 是否寄往虚空
+
+        Returns:
+            开启时间（纪元秒）
+
         Raises:
             ValueError: 如果参数无效
         """
@@ -43,15 +117,43 @@ class TimeCapsuleService:
         if len(content) > MAX_LETTER_LENGTH:
             raise ValueError(f"信笺内容不能超过{MAX_LETTER_LENGTH}字符")
         
+        # 以纪元秒存储开启时间；密钥按其还原出的整秒UTC时间派生，保证开启时可重现
+        open_at = to_epoch(open_date)
+
         # 验证开启日期
         if not send_to_void:
-            max_date = datetime.utcnow() + timedelta(days=MAX_FUTURE_DAYS)
-            if open_date > max_date:
+            now = epoch_now()
+            if open_at > now + MAX_FUTURE_DAYS * 24 * 60 * 60:
                 raise ValueError(f"开启日期不能超过{MAX_FUTURE_DAYS}天后")
             
-            if open_date <= datetime.utcnow():
+            if open_at <= now:
                 raise ValueError("开启日期必须是未来时间")
-        
+
+        return open_at
+
+    def build_letter(
+        self,
+        content: str,
+        title: Optional[str],
+        open_at: int,
+        send_to_void: bool = False,
+        creator_ip_hash: Optional[str] = None
+    ) -> TimeCapsuleLetter:
+        """
+        加密内容并构建信笺对象（不访问数据库，可在线程池中调用）
+
+        Args:
+            content: 信笺内容
+            title: 信笺标题（可选）
+            open_at: 开启时间（纪元秒）
+            send_to_void: 是否寄往虚空
+            creator_ip_hash: 创建者IP哈希
+
+        Returns:
+            尚未写入数据库的信笺对象
+        """
+        open_date = from_epoch(open_at)
+
         # 加密内容
         encrypted_content = encryption_service.encrypt_content(content, open_date)
 
@@ -64,40 +166,60 @@ class TimeCapsuleService:
         letter = TimeCapsuleLetter(
             encrypted_content=encrypted_content,
             encrypted_title=encrypted_title,
-            open_at=open_date,
+            open_at=open_at,
             send_to_void=send_to_void,
-            creator_ip_hash=hash_ip(creator_ip) if creator_ip else None
+            creator_ip_hash=creator_ip_hash
         )
         
         # 如果是寄往虚空，立即标记为销毁
         if send_to_void:
             letter.is_destroyed = True
-            letter.destroyed_at = datetime.utcnow()
-        
-        db.add(letter)
-        await db.commit()
-        await db.refresh(letter)
-        
+            letter.destroyed_at = epoch_now()
+
         return letter
     
     async def open_letter(
         self,
         db: AsyncSession,
         letter_id: int
-    ) -> dict:
+    ) -> OpenedLetter:
         """
         开启时光信笺
+
+        同一封信笺的并发开启请求只做一次密钥派生和解密，共享结果；
+        启用缓存时，已开启过的信笺直接从缓存返回
         
         Args:
             db: 数据库会话
             letter_id: 信笺ID
             
         Returns:
-            包含解密内容的字典
+            包含解密内容的信笺
             
         Raises:
             ValueError: 如果信笺不存在或无法开启
         """
+        # 其他进程销毁过信笺时，本进程缓存中的条目可能已失效
+        if opened_letter_cache.enabled and letters_generation.changed():
+            opened_letter_cache.clear()
+        cached = opened_letter_cache.get(letter_id)
+        if cached is not None:
+            title, content, created_at = cached
+            return OpenedLetter(
+                id=letter_id,
+                title=title,
+                content=content,
+                created_at=created_at,
+                opened_at=epoch_now()
+            )
+
+        return await singleflight.do(
+            ("open_letter", letter_id),
+            lambda: self._open_letter(db, letter_id)
+        )
+
+    async def _open_letter(self, db: AsyncSession, letter_id: int) -> OpenedLetter:
+        """查询、解密并标记信笺为已开启"""
         # 查找信笺
         result = await db.execute(
             select(TimeCapsuleLetter).where(TimeCapsuleLetter.id == letter_id)
@@ -113,31 +235,52 @@ class TimeCapsuleService:
         if not letter.can_be_opened():
             raise ValueError("信笺尚未到开启时间")
         
+        # 密文可能仍在冷存储中（分层任务尚未移回）
+        encrypted_content, encrypted_title = letter.encrypted_content, letter.encrypted_title
+        if letter.archive_missing:
+            raise ValueError("信笺的密文已丢失")
+        if letter.is_archived:
+            encrypted_content, encrypted_title = await letter_archive.fetch(letter.id)
+        
         # 解密内容
         try:
+            open_date = letter.key_date()
             content = encryption_service.decrypt_content(
-                letter.encrypted_content,
-                letter.open_at
+                encrypted_content,
+                open_date
             )
 
             title = None
-            if letter.encrypted_title:
+            if encrypted_title:
                 title = encryption_service.decrypt_content(
-                    letter.encrypted_title,
-                    letter.open_at
+                    encrypted_title,
+                    open_date
                 )
             
-            # 标记为已开启
-            letter.is_opened = True
+            # 标记为已开启（以尚未开启为条件，多个进程同时开启时只计数一次）
+            if not letter.is_opened:
+                marked = await db.execute(
+                    update(TimeCapsuleLetter)
+                    .where(
+                        and_(
+                            TimeCapsuleLetter.id == letter.id,
+                            TimeCapsuleLetter.is_opened == False
+                        )
+                    )
+                    .values(is_opened=True)
+                )
+                if marked.rowcount:
+                    await stats_service.increment(db, letters_sealed=-1, letters_opened=1)
             await db.commit()
+            opened_letter_cache.put(letter.id, title, content, letter.created_at)
             
-            return {
-                'id': letter.id,
-                'title': title,
-                'content': content,
-                'created_at': letter.created_at,
-                'opened_at': datetime.utcnow()
-            }
+            return OpenedLetter(
+                id=letter.id,
+                title=title,
+                content=content,
+                created_at=letter.created_at,
+                opened_at=epoch_now()
+            )
         except Exception as e:
             raise ValueError(f"解密失败: {str(e)}")
     
@@ -151,7 +294,7 @@ class TimeCapsuleService:
         Returns:
             可开启的信笺列表
         """
-        current_time = datetime.utcnow()
+        current_time = epoch_now()
         result = await db.execute(
             select(TimeCapsuleLetter).where(
                 and_(
@@ -164,6 +307,38 @@ class TimeCapsuleService:
         )
         return result.scalars().all()
     
+    async def get_receipt_letter_id(self, db: AsyncSession, receipt: str) -> Optional[int]:
+        """
+        查询异步封存回执对应的信笺
+
+        Args:
+            db: 数据库会话
+            receipt: 回执编号
+
+        Returns:
+            已封存时返回信笺ID，否则返回None
+        """
+        result = await db.execute(
+            select(SealingReceipt.letter_id).where(SealingReceipt.receipt == receipt)
+        )
+        return result.scalar_one_or_none()
+
+    async def cleanup_receipts(self, db: AsyncSession) -> int:
+        """
+        删除过期的封存回执
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            删除的回执数量
+        """
+        result = await db.execute(
+            delete(SealingReceipt).where(SealingReceipt.created_at < epoch_now() - SEALING_RECEIPT_TTL_SECONDS)
+        )
+        await db.commit()
+        return result.rowcount
+
     async def destroy_void_letters(self, db: AsyncSession) -> int:
         """
         销毁寄往虚空的信笺
@@ -185,12 +360,114 @@ class TimeCapsuleService:
         letters = result.scalars().all()
         
         count = 0
+        opened = 0
         for letter in letters:
+            if letter.is_opened:
+                opened += 1
             letter.is_destroyed = True
-            letter.destroyed_at = datetime.utcnow()
+            letter.destroyed_at = epoch_now()
+            opened_letter_cache.discard(letter.id)
             count += 1
         
+        await stats_service.increment(
+            db,
+            letters_sealed=opened - count,
+            letters_opened=-opened,
+            letters_destroyed=count
+        )
         await db.commit()
+        if count:
+            letters_generation.bump()
+        return count
+
+    async def tier_letters(self, db: AsyncSession) -> int:
+        """
+        在主库和冷存储之间移动信笺密文
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            移动的信笺数量
+        """
+        promoted = await letter_archive.promote(db)
+        demoted = await letter_archive.demote(db)
+        return promoted + demoted
+
+    async def rewrap_letters(self, db: AsyncSession, batch_size: int = LETTER_REWRAP_BATCH_SIZE) -> int:
+        """
+        将一批信笺的密文迁移到当前配置的密钥派生参数
+
+        迁移为纪元秒之前加密的信笺同时改为按整秒开启时间派生密钥，之后不再需要原始开启时间文本。
+
+        每封信笺需要为旧参数和新参数各派生一次密钥，在线程中逐封执行，不阻塞事件循环。
+        冷存储中的信笺跳过，移回主库后再迁移。写回时以原密文为条件，
+        期间被分层任务移走或被其他进程迁移过的信笺保持不变。
+        无法解密的信笺记录日志并标记为 rewrap_failed，本批其余信笺照常迁移。
+
+        Args:
+            db: 数据库会话
+            batch_size: 本次最多迁移的信笺数
+
+        Returns:
+            迁移的信笺数量
+        """
+        header = encryption_service.kdf_params.header()
+        result = await db.execute(
+            select(
+                TimeCapsuleLetter.id,
+                TimeCapsuleLetter.open_at,
+                TimeCapsuleLetter.open_at_key,
+                TimeCapsuleLetter.encrypted_content,
+                TimeCapsuleLetter.encrypted_title
+            ).where(
+                and_(
+                    TimeCapsuleLetter.is_destroyed == False,
+                    TimeCapsuleLetter.is_archived == False,
+                    TimeCapsuleLetter.rewrap_failed == False,
+                    or_(
+                        func.substr(TimeCapsuleLetter.encrypted_content, 1, len(header)) != header,
+                        TimeCapsuleLetter.open_at_key.isnot(None)
+                    )
+                )
+            ).limit(batch_size)
+        )
+        rows = result.all()
+
+        count = 0
+        for letter_id, open_at, open_at_key, encrypted_content, encrypted_title in rows:
+            if open_at_key is None and not encryption_service.needs_rewrap(encrypted_content):
+                continue
+            # 迁移前加密的信笺按原始开启时间解密，改为按整秒开启时间加密
+            open_date = from_epoch(open_at)
+            key_date = letter_key_date(open_at, open_at_key)
+            try:
+                content = await asyncio.to_thread(encryption_service.rewrap, encrypted_content, open_date, key_date)
+                title = encrypted_title
+                if encrypted_title:
+                    title = await asyncio.to_thread(encryption_service.rewrap, encrypted_title, open_date, key_date)
+            except Exception as e:
+                # 一封损坏的信笺不应使整批失败，标记后以后不再选取，避免任务每次都卡在同一批上
+                logger.warning(f"信笺 {letter_id} 重新加密失败，已跳过: {e}")
+                await db.execute(
+                    update(TimeCapsuleLetter)
+                    .where(TimeCapsuleLetter.id == letter_id)
+                    .values(rewrap_failed=True)
+                )
+                await db.commit()
+                continue
+            updated = await db.execute(
+                update(TimeCapsuleLetter)
+                .where(
+                    and_(
+                        TimeCapsuleLetter.id == letter_id,
+                        TimeCapsuleLetter.encrypted_content == encrypted_content
+                    )
+                )
+                .values(encrypted_content=content, encrypted_title=title, open_at_key=None)
+            )
+            await db.commit()
+            count += updated.rowcount
         return count
 
 # 全局服务实例
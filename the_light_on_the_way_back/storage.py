@@ -0,0 +1,344 @@
+"""
+图片存储模块
+流式接收上传的图片，按内容哈希去重并分片存储，在进程池中生成缩略图
+"""
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+from .config import (
+    STATIC_DIR,
+    UPLOADS_DIR,
+    MAX_IMAGE_BYTES,
+    MAX_UPLOAD_FIELD_BYTES,
+    IMAGE_VARIANT_WIDTHS,
+    IMAGE_PROCESS_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 文件头魔数 -> 扩展名；以实际内容判断类型，不信任客户端声明的 Content-Type
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    根据文件头判断图片类型
+
+    Args:
+        head: 文件开头的字节
+
+    Returns:
+        扩展名，无法识别时为None
+    """
+    for signature, extension in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+def variant_path(image_path: str, width: int) -> str:
+    """缩略图的相对路径：<哈希>_<宽度><扩展名>"""
+    stem, extension = os.path.splitext(image_path)
+    return f"{stem}_{width}{extension}"
+
+def make_variants(source: str, widths: Tuple[int, ...]) -> int:
+    """
+    生成等比缩放的缩略图（在进程池中运行，不占用事件循环）
+
+    Args:
+        source: 原图绝对路径
+        widths: 缩略图宽度
+
+    Returns:
+        生成的缩略图数量
+    """
+    from PIL import Image
+
+    created = 0
+    with Image.open(source) as image:
+        image.load()
+        for width in widths:
+            target = variant_path(source, width)
+            if os.path.exists(target):
+                continue
+            # 不放大：原图更窄时缩略图即原尺寸副本，保证每个宽度的文件都存在
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            else:
+                resized = image
+            tmp = target + ".tmp"
+            resized.save(tmp, format=image.format)
+            os.replace(tmp, target)
+            created += 1
+    return created
+
+class UploadTooLarge(ValueError):
+    """上传内容超过大小限制"""
+
+class PendingUpload:
+    """正在接收的图片：边写入临时文件边计算哈希"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.extension: Optional[str] = None
+        self._hash = hashlib.sha256()
+        self._head = b""
+
+    def write(self, data: bytes):
+        """写入一段数据（在线程池中调用）"""
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"图片不能超过{self.max_bytes // (1024 * 1024)}MB")
+        if self.extension is None and len(self._head) < 16:
+            self._head += data[:16]
+            if len(self._head) >= 12:
+                self.extension = sniff_image_type(self._head)
+                if self.extension is None:
+                    raise ValueError("仅支持 JPEG、PNG、GIF、WebP 格式的图片")
+        self._hash.update(data)
+        self.file.write(data)
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def discard(self):
+        """丢弃临时文件"""
+        if not self.file.closed:
+            self.file.close()
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class ImageStore:
+    """
+    内容寻址的图片存储
+
+    文件按 SHA-256 存放在 uploads/<前两位>/<三四位>/<哈希><扩展名>，
+    相同内容只保存一份；路径以相对 static/ 的形式写入数据库。
+    """
+
+    def __init__(
+        self,
+        root: Path = UPLOADS_DIR,
+        max_bytes: int = MAX_IMAGE_BYTES,
+        variant_widths: Tuple[int, ...] = IMAGE_VARIANT_WIDTHS,
+        workers: int = IMAGE_PROCESS_WORKERS
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.variants_available = importlib.util.find_spec("PIL") is not None
+        self.variant_widths = variant_widths if self.variants_available else ()
+        self.workers = workers
+        self._pool: Optional["ProcessPoolExecutor"] = None
+        # 已提交到进程池、尚未完成的缩略图任务
+        self.in_flight = 0
+
+    def begin(self) -> PendingUpload:
+        """开始接收一个上传文件"""
+        return PendingUpload(self.root / ".incoming", self.max_bytes)
+
+    def relative_path(self, digest: str, extension: str) -> str:
+        return f"{self.root.relative_to(STATIC_DIR).as_posix()}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    async def commit(self, pending: PendingUpload) -> Tuple[str, bool]:
+        """
+        将接收完成的文件移入正式位置
+
+        Args:
+            pending: 接收完成的上传
+
+        Returns:
+            (相对 static/ 的路径, 是否为新文件)；内容已存在时直接复用
+
+        Raises:
+            ValueError: 文件为空或不是支持的图片
+        """
+        await run_in_threadpool(pending.file.close)
+        if pending.size == 0 or pending.extension is None:
+            pending.discard()
+            raise ValueError("请上传有效的图片")
+
+        image_path = self.relative_path(pending.digest, pending.extension)
+        target = STATIC_DIR / image_path
+        created = not target.exists()
+        if created:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(pending.temp_path, target)
+        else:
+            pending.discard()
+
+        if self.variant_widths:
+            try:
+                loop = asyncio.get_running_loop()
+                self.in_flight += 1
+                try:
+                    await loop.run_in_executor(
+                        self._get_pool(), make_variants, str(target), self.variant_widths
+                    )
+                finally:
+                    self.in_flight -= 1
+            except Exception as e:
+                if created:
+                    self.delete(image_path)
+                raise ValueError(f"无法处理该图片: {e}")
+
+        return image_path, created
+
+    def delete(self, image_path: str):
+        """删除图片及其缩略图"""
+        target = STATIC_DIR / image_path
+        for path in [target] + [Path(variant_path(str(target), w)) for w in self.variant_widths]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _get_pool(self) -> "ProcessPoolExecutor":
+        if self._pool is None:
+            # 首次生成缩略图时才导入 multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def get_stats(self) -> dict:
+        """
+        获取缩略图进程池状态
+
+        Returns:
+            进程数和进行中的任务数（超过进程数的部分在排队）
+        """
+        return {
+            "workers": self.workers if self.variant_widths else 0,
+            "in_flight": self.in_flight,
+        }
+
+    def shutdown(self):
+        """关闭缩略图进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+async def receive_image_upload(
+    request: Request,
+    store: "ImageStore",
+    file_field: str = "image"
+) -> Tuple[Dict[str, str], Optional[PendingUpload]]:
+    """
+    流式解析 multipart 请求
+
+    普通字段读入内存（有长度上限），图片字段按到达的数据块写入临时文件并计算哈希，
+    整个请求体不会缓存在内存中。
+
+    Args:
+        request: 请求对象
+        store: 图片存储
+        file_field: 图片字段名
+
+    Returns:
+        (普通字段, 接收完成的图片或None)
+
+    Raises:
+        ValueError: 请求格式无效、字段过长或图片无效
+        UploadTooLarge: 图片超过大小限制
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValueError("请求必须是 multipart/form-data")
+
+    fields: Dict[str, str] = {}
+    state = {"name": None, "is_file": False, "header_field": b"", "header_value": b"", "headers": {}}
+    buffers: Dict[str, bytearray] = {}
+    pending_upload: Dict[str, PendingUpload] = {}
+    chunks = []
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        state["name"] = name
+        state["is_file"] = name == file_field and b"filename" in options
+        if state["is_file"]:
+            if file_field in pending_upload:
+                raise ValueError("只能上传一张图片")
+            pending_upload[file_field] = store.begin()
+        else:
+            buffers[name] = bytearray()
+
+    def on_part_data(data, start, end):
+        if state["is_file"]:
+            chunks.append(data[start:end])
+            return
+        buffer = buffers[state["name"]]
+        buffer += data[start:end]
+        if len(buffer) > MAX_UPLOAD_FIELD_BYTES:
+            raise ValueError("表单字段过长")
+
+    def on_part_end():
+        if not state["is_file"]:
+            fields[state["name"]] = buffers.pop(state["name"]).decode("utf-8", "replace")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if chunks:
+                # 文件写入放到线程池，避免阻塞事件循环
+                data = b"".join(chunks)
+                chunks.clear()
+                await run_in_threadpool(pending_upload[file_field].write, data)
+        parser.finalize()
+    except Exception:
+        for upload in pending_upload.values():
+            upload.discard()
+        raise
+
+    return fields, pending_upload.get(file_field)
+
+# 全局图片存储实例
+image_store = ImageStore()
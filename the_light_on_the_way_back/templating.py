@@ -0,0 +1,217 @@
+"""
+模板环境
+所有路由共享同一个Jinja2环境和模板缓存，首次渲染页面时才导入 Jinja2 并创建；
+大页面可用 stream_template 流式渲染，页面外壳在数据查询完成之前就开始发送
+"""
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncIterator, Dict
+
+from .config import (
+    TEMPLATES_DIR,
+    IMAGE_UPLOADS_ENABLED,
+    TEMPLATE_STREAMING_ENABLED,
+    TEMPLATE_STREAM_CHUNK_SIZE,
+)
+from .storage import image_store, variant_path
+from .services.card_cache import gallery_card_cache
+from .tracing import tracer
+from .timeutils import from_epoch
+
+logger = logging.getLogger(__name__)
+
+_templates = None
+_async_env = None
+
+def epoch_format(value: int, fmt: str = "%Y-%m-%d %H:%M") -> str:
+    """模板过滤器：格式化UTC纪元秒"""
+    return from_epoch(value).strftime(fmt)
+
+def image_url(image_path: str, width: int = None) -> str:
+    """模板过滤器：上传图片（或指定宽度缩略图）的URL"""
+    if width:
+        image_path = variant_path(image_path, width)
+    return f"/static/{image_path}"
+
+def resolve(value: Any) -> Any:
+    """模板函数：取得上下文中的值（同步渲染时上下文中已是数据）"""
+    return value
+
+async def resolve_async(value: Any) -> Any:
+    """模板函数：等待上下文中尚未完成的查询（流式渲染时使用，结果由 Jinja 自动等待）"""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+def gallery_card(content):
+    """
+    模板函数：回廊内容卡片的HTML
+
+    按内容ID和鼓掌数缓存，未命中时渲染 gallery_card.html。
+    卡片模板不等待任何数据，流式渲染时同样用同步环境渲染，两种渲染方式共用缓存。
+
+    Args:
+        content: 回廊内容行
+
+    Returns:
+        卡片HTML（已转义的 Markup）
+    """
+    from markupsafe import Markup
+
+    html = gallery_card_cache.get(content.id, content.applause_count)
+    if html is None:
+        html = get_templates().env.get_template("gallery_card.html").render(content=content)
+        gallery_card_cache.put(content.id, content.applause_count, html, content.expires_at)
+    return Markup(html)
+
+def _traced_template_class(base):
+    """为每次渲染记录跨度的模板类（只在启用追踪时使用）"""
+    class TracedTemplate(base):
+        def render(self, *args, **kwargs):
+            with tracer.span("template.render", template=self.name):
+                return super().render(*args, **kwargs)
+    return TracedTemplate
+
+def _configure(env, resolver):
+    env.filters["epoch_format"] = epoch_format
+    env.filters["image_url"] = image_url
+    env.globals["image_uploads_enabled"] = IMAGE_UPLOADS_ENABLED
+    env.globals["image_variant_widths"] = image_store.variant_widths
+    env.globals["resolve"] = resolver
+    env.globals["gallery_card"] = gallery_card
+    if tracer.enabled:
+        env.template_class = _traced_template_class(env.template_class)
+
+def get_templates():
+    """
+    获取共享的模板环境
+
+    Returns:
+        Jinja2Templates 实例
+    """
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+
+        templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+        _configure(templates.env, resolve)
+        _templates = templates
+    return _templates
+
+def _get_async_env():
+    # 异步模式编译出的模板只能异步渲染，因此与 TemplateResponse 使用的环境分开
+    global _async_env
+    if _async_env is None:
+        import jinja2
+
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(TEMPLATES_DIR)),
+            autoescape=True,
+            enable_async=True,
+        )
+        _configure(env, resolve_async)
+        _async_env = env
+    return _async_env
+
+async def _buffered(chunks: AsyncIterator[str], chunk_size: int) -> AsyncIterator[str]:
+    """
+    合并 Jinja 输出的细碎片段
+
+    渲染在单独的任务中进行。片段累积到 chunk_size 时发送；渲染停下来等待数据时，
+    把已渲染的部分立即发送出去，而不是等到凑满一块。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+        except Exception as e:
+            # 交给发送方抛出
+            queue.put_nowait(e)
+        else:
+            queue.put_nowait(done)
+
+    producer = asyncio.ensure_future(produce())
+    buffer, size = [], 0
+    try:
+        while True:
+            if queue.empty() and buffer:
+                yield "".join(buffer)
+                buffer, size = [], 0
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            buffer.append(item)
+            size += len(item)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+def _cancel_pending(context: Dict[str, Any]):
+    """取消上下文中尚未完成的查询任务"""
+    for value in context.values():
+        if isinstance(value, asyncio.Future) and not value.done():
+            value.cancel()
+
+async def stream_template(name: str, context: Dict[str, Any], status_code: int = 200):
+    """
+    流式渲染模板
+
+    context 中的协程会立即作为任务启动，模板用 resolve() 取值时才等待，
+    因此数据库查询与页面头部、样式和外壳的发送同时进行。响应头发送后出错时只能中断连接，
+    查询出错的页面无法再改为错误页。未启用流式渲染时等待全部数据后整页渲染。
+
+    Args:
+        name: 模板名
+        context: 模板上下文，值可以是协程或任务
+        status_code: 状态码
+
+    Returns:
+        响应对象
+    """
+    context = {
+        key: asyncio.ensure_future(value) if inspect.isawaitable(value) else value
+        for key, value in context.items()
+    }
+
+    if not TEMPLATE_STREAMING_ENABLED:
+        try:
+            for key, value in context.items():
+                if isinstance(value, asyncio.Future):
+                    context[key] = await value
+        except BaseException:
+            _cancel_pending(context)
+            raise
+        return get_templates().TemplateResponse(name, context, status_code=status_code)
+
+    from fastapi.responses import StreamingResponse
+
+    try:
+        template = _get_async_env().get_template(name)
+    except BaseException:
+        _cancel_pending(context)
+        raise
+
+    async def body():
+        try:
+            with tracer.span("template.stream", template=name):
+                async for chunk in _buffered(template.generate_async(context), TEMPLATE_STREAM_CHUNK_SIZE):
+                    yield chunk
+        except Exception:
+            logger.exception(f"流式渲染 {name} 时出错")
+            raise
+        finally:
+            # 客户端提前断开时取消尚未完成的查询
+            _cancel_pending(context)
+
+    return StreamingResponse(body(), status_code=status_code, media_type="text/html; charset=utf-8")
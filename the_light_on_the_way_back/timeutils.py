@@ -0,0 +1,39 @@
+"""
+时间工具
+统一使用UTC纪元秒（整数）在接口和模板之间传递时间
+"""
+import time
+from datetime import datetime, timezone
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def epoch_now() -> int:
+    """当前UTC纪元秒"""
+    return int(time.time())
+
+def to_epoch(value: datetime) -> int:
+    """
+    将datetime转换为UTC纪元秒
+
+    Args:
+        value: datetime对象，无时区信息时视为UTC
+
+    Returns:
+        纪元秒
+    """
+    if value.tzinfo is None:
+        return int((value - _EPOCH).total_seconds())
+    return int((value - _EPOCH_UTC).total_seconds())
+
+def from_epoch(value: int) -> datetime:
+    """
+    将UTC纪元秒转换为不带时区信息的UTC datetime
+
+    Args:
+        value: 纪元秒
+
+    Returns:
+        datetime对象
+    """
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,360 @@
+"""
+请求追踪模块
+按请求记录路由、服务方法、数据库语句、加解密和模板渲染各层的耗时，默认关闭
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+from .config import (
+    TRACING_ENABLED,
+    TRACING_SAMPLE_RATE,
+    TRACING_DEBUG_HEADER,
+    TRACING_DEBUG_TOKEN,
+    TRACING_BUFFER_SIZE,
+    TRACING_EXPORT_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 当前所在的跨度；未被追踪的请求中为None，各层的追踪点据此直接跳过
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# 数据库跨度记录的语句长度（不记录参数，避免信笺内容进入追踪）
+_STATEMENT_LENGTH = 200
+
+
+class Trace:
+    """一次请求的追踪：跨度按结束顺序收集"""
+
+    __slots__ = ("trace_id", "started", "wall_time", "spans", "_next_id", "_lock")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(8)
+        self.started = time.perf_counter()
+        self.wall_time = datetime.utcnow()
+        self.spans: List["Span"] = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        # 加解密跨度可能在线程池中结束
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def to_dict(self) -> dict:
+        root = next(span for span in self.spans if span.parent_id is None)
+        return {
+            "trace_id": self.trace_id,
+            "at": self.wall_time.isoformat(),
+            "name": root.name,
+            "duration_ms": root.duration_ms,
+            "attributes": root.attributes,
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda span: span.started)],
+        }
+
+
+class Span:
+    """
+    追踪中的一个跨度
+
+    用作上下文管理器时成为当前跨度，期间创建的跨度都是它的子跨度；
+    数据库语句等叶子跨度只调用 start() 和 finish()，不改变当前跨度。
+    """
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "started", "duration", "_token")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[int] = None, attributes: Optional[dict] = None):
+        self.trace = trace
+        self.span_id = trace.next_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.started = 0.0
+        self.duration = 0.0
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return round(self.duration * 1000, 3)
+
+    def set(self, **attributes):
+        """添加属性"""
+        self.attributes.update(attributes)
+
+    def start(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.attributes["error"] = type(error).__name__
+        self.trace.spans.append(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 异步生成器在其他上下文中被关闭
+            pass
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.started - self.trace.started) * 1000, 3),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """未被追踪时的空跨度"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None and context is not None:
+        context._trace_span = Span(
+            parent.trace, "db.execute", parent.span_id, {"statement": statement[:_STATEMENT_LENGTH]}
+        ).start()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        context._trace_span = None
+        if cursor.rowcount >= 0:
+            span.attributes["rowcount"] = cursor.rowcount
+        span.finish()
+
+
+def _handle_error(exception_context):
+    span = getattr(exception_context.execution_context, "_trace_span", None)
+    if span is not None:
+        exception_context.execution_context._trace_span = None
+        span.finish(exception_context.original_exception)
+
+
+class Tracer:
+    """
+    请求追踪入口
+
+    中间件按采样率（或调试请求头）决定是否追踪一个请求，被追踪的请求在上下文变量中
+    带有当前跨度；服务方法、数据库语句、加解密和模板渲染的追踪点只在存在当前跨度时记录。
+    未启用时不注册数据库事件、不包装服务方法，其余追踪点只多一次上下文变量读取。
+    完成的追踪保存在环形缓冲区中，并可逐条追加到 JSON Lines 文件。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACING_ENABLED,
+        sample_rate: float = TRACING_SAMPLE_RATE,
+        debug_token: str = TRACING_DEBUG_TOKEN,
+        buffer_size: int = TRACING_BUFFER_SIZE,
+        export_path: str = TRACING_EXPORT_PATH,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.debug_header = TRACING_DEBUG_HEADER.lower().encode()
+        self.debug_token = debug_token.encode()
+        self.export_path = export_path
+        self.traced = 0
+        self.exported = 0
+        self._buffer = deque(maxlen=buffer_size)
+        self._export_file = None
+
+    def span(self, name: str, **attributes):
+        """
+        创建当前跨度的子跨度
+
+        Args:
+            name: 跨度名，如 "crypto.kdf"
+            **attributes: 属性
+
+        Returns:
+            上下文管理器；当前请求未被追踪时为空跨度
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return _NULL_SPAN
+        return Span(parent.trace, name, parent.span_id, attributes)
+
+    def wrap(self, name: str, func):
+        """为函数或协程函数包装同名跨度"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+        return wrapper
+
+    def trace_methods(self, prefix: str):
+        """
+        类装饰器：为所有公开方法包装跨度，跨度名为 "前缀.方法名"
+
+        未启用追踪时原样返回类，方法调用没有额外开销。
+
+        Args:
+            prefix: 跨度名前缀
+        """
+        def decorator(cls):
+            if not self.enabled:
+                return cls
+            for attr, value in list(vars(cls).items()):
+                if not attr.startswith("_") and inspect.isfunction(value):
+                    setattr(cls, attr, self.wrap(f"{prefix}.{attr}", value))
+            return cls
+        return decorator
+
+    def instrument_engine(self, engine):
+        """
+        为数据库引擎的每条语句记录跨度（未启用时不注册事件）
+
+        Args:
+            engine: 异步引擎
+        """
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+
+    def should_trace(self, scope) -> bool:
+        """按采样率或调试请求头决定是否追踪当前请求"""
+        if self.debug_token:
+            for name, value in scope.get("headers", ()):
+                if name == self.debug_header and value == self.debug_token:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, trace: Trace):
+        """保存一次完成的追踪"""
+        self.traced += 1
+        data = trace.to_dict()
+        self._buffer.append(data)
+        if self.export_path:
+            try:
+                if self._export_file is None:
+                    self._export_file = open(self.export_path, "a", encoding="utf-8", buffering=1)
+                self._export_file.write(json.dumps(data, ensure_ascii=False) + "\n")
+                self.exported += 1
+            except OSError as e:
+                logger.warning(f"写入追踪文件失败: {e}")
+
+    def recent(self, limit: int = 50, min_duration_ms: float = 0, name: Optional[str] = None) -> List[dict]:
+        """
+        最近的追踪，从新到旧
+
+        Args:
+            limit: 返回数量
+            min_duration_ms: 只返回总耗时不低于该值的追踪
+            name: 只返回请求名（如 "POST /time-capsule/create"）相同的追踪
+
+        Returns:
+            追踪列表
+        """
+        result = []
+        for data in reversed(self._buffer):
+            if data["duration_ms"] < min_duration_ms or (name and data["name"] != name):
+                continue
+            result.append(data)
+            if len(result) >= limit:
+                break
+        return result
+
+    def close(self):
+        if self._export_file is not None:
+            self._export_file.close()
+            self._export_file = None
+
+    def get_stats(self) -> dict:
+        """
+        获取追踪统计
+
+        Returns:
+            是否启用、采样率、已追踪和已写出的请求数、缓冲区中的追踪数
+        """
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "traced": self.traced,
+            "exported": self.exported,
+            "buffered": len(self._buffer),
+            "buffer_size": self._buffer.maxlen,
+        }
+
+
+class TracingMiddleware:
+    """请求追踪中间件（纯ASGI实现，未命中采样的请求只多一次随机数判断）"""
+
+    def __init__(self, app, tracer: "Tracer"):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.should_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        root = Span(trace, f"{scope['method']} {scope.get('path', '')}")
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.attributes["status"] = message["status"]
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, traced_send)
+        finally:
+            # 路由匹配后才知道路由模板，按模板命名便于聚合
+            route = scope.get("route")
+            if getattr(route, "path", None):
+                root.name = f"{scope['method']} {route.path}"
+            self.tracer.record(trace)
+
+
+# 全局请求追踪实例
+tracer = Tracer()